@@ -42,6 +42,7 @@ from terrarun.models.oauth_client import OauthClient
 from terrarun.models.oauth_token import OauthToken
 from terrarun.models.github_app_oauth_token import GithubAppOauthToken
 from terrarun.models.authorised_repo import AuthorisedRepo
+from terrarun.models.vcs_trigger_claim import VcsTriggerClaim
 from terrarun.models.api_id import ApiId
 from terrarun.models.tool import Tool
 from terrarun.models.global_setting import GlobalSetting
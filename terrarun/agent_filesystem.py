@@ -13,6 +13,16 @@ class AgentFilesystem:
 
     FILE_SYSTEM_KEY = "agent-filesystem/{run_id}.gzip"
 
+    # Filesystem returned for runs that have not yet uploaded a filesystem
+    EMPTY_FILESYSTEM = gzip.compress(data=b"", mtime=0)
+
+    # Expiry, in seconds, of presigned download URLs.
+    # Agents follow the redirect immediately, so this only needs to be short.
+    DOWNLOAD_URL_EXPIRY = 300
+
+    # Size of chunks, in bytes, when streaming filesystem content
+    STREAM_CHUNK_SIZE = 1024 * 1024
+
     def __init__(self, run):
         """Store member variables"""
         self._run = run
@@ -23,22 +33,41 @@ class AgentFilesystem:
         """Return filesystem key"""
         return self.FILE_SYSTEM_KEY.format(run_id=self._run.api_id)
 
-    def upload_content(self, data):
-        """Get signed upload URL"""
-        # Since upload occurs at end of run, allow the signed URL to last for
-        # the length of the timeout
-        return self._object_storage.upload_file(
+    def upload_content(self, fileobj):
+        """Upload filesystem from file-like object, streaming to object storage"""
+        self._object_storage.upload_fileobj(
             path=self.filesystem_key,
-            content=data
+            fileobj=fileobj
         )
 
-    def get_content(self):
-        """Get filesystem or run"""
-        # If filesystem doesn't exit, create an empty one
+    def get_download_url(self):
+        """
+        Return presigned URL for downloading filesystem,
+        or None if no filesystem exists for the run.
+        """
         if not self._object_storage.file_exists(self.filesystem_key):
-            # Create empty filesystem
-            self._object_storage.upload_file(path=self.filesystem_key, content=gzip.compress(data=b""))
+            return None
+        return self._object_storage.create_presigned_download_url(
+            path=self.filesystem_key,
+            expiry=self.DOWNLOAD_URL_EXPIRY
+        )
+
+    def get_content_stream(self):
+        """
+        Return iterator of filesystem content and content length.
+
+        If a filesystem does not exist, an empty filesystem is returned.
+        """
+        file_stream = self._object_storage.get_file_stream(self.filesystem_key)
+        if file_stream is None:
+            return iter([self.EMPTY_FILESYSTEM]), len(self.EMPTY_FILESYSTEM)
+
+        body, content_length = file_stream
+
+        def iter_content():
+            try:
+                yield from body.iter_chunks(chunk_size=self.STREAM_CHUNK_SIZE)
+            finally:
+                body.close()
 
-        # Return signed URL for downloading file
-        return self._object_storage.get_file(path=self.filesystem_key)
-        
\ No newline at end of file
+        return iter_content(), content_length
@@ -0,0 +1,100 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import atexit
+from datetime import datetime
+import threading
+from typing import Dict, Optional
+
+import sqlalchemy
+
+import terrarun.config
+from terrarun.database import Database
+from terrarun.logger import get_logger
+import terrarun.models.agent
+
+
+logger = get_logger(__name__)
+
+
+class AgentHeartbeatBuffer:
+    """
+    Buffer agent heartbeats in memory, periodically writing
+    the last seen time of all agents in a single batch.
+    """
+
+    _lock = threading.Lock()
+    # Latest heartbeat time, keyed by agent ID, that has not yet been written
+    _last_seen: Dict[int, datetime] = {}
+    _flush_thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def record(cls, agent_id: int, seen_at: datetime):
+        """Record heartbeat of agent"""
+        with cls._lock:
+            cls._last_seen[agent_id] = seen_at
+            cls._ensure_flush_thread()
+
+    @classmethod
+    def discard(cls, agent_id: int):
+        """Discard buffered heartbeat of agent, once it has been written directly"""
+        with cls._lock:
+            cls._last_seen.pop(agent_id, None)
+
+    @classmethod
+    def _ensure_flush_thread(cls):
+        """Start background flush thread, if not already running. Must be called with lock held"""
+        if cls._flush_thread is not None:
+            return
+        cls._flush_thread = threading.Thread(target=cls._flush_loop, daemon=True, name="agent-heartbeat-flush")
+        cls._flush_thread.start()
+        # Avoid losing buffered heartbeats on shutdown
+        atexit.register(cls.flush)
+
+    @classmethod
+    def _flush_loop(cls):
+        """Periodically flush heartbeats"""
+        stop_event = threading.Event()
+        while not stop_event.wait(terrarun.config.Config().AGENT_HEARTBEAT_FLUSH_INTERVAL):
+            try:
+                cls.flush()
+            except Exception as exc:
+                logger.error(f"Failed to flush agent heartbeats: {exc}")
+
+    @classmethod
+    def flush(cls):
+        """Write buffered heartbeats to database"""
+        with cls._lock:
+            last_seen = cls._last_seen
+            cls._last_seen = {}
+        if not last_seen:
+            return
+
+        session = Database.get_session()
+        try:
+            # Only move last ping time forward, as status changes
+            # may have been written directly since heartbeats were buffered
+            agent_table = terrarun.models.agent.Agent.__table__
+            session.execute(
+                agent_table.update().where(
+                    agent_table.c.id==sqlalchemy.bindparam("agent_id"),
+                    sqlalchemy.or_(
+                        agent_table.c.last_ping_at==None,
+                        agent_table.c.last_ping_at < sqlalchemy.bindparam("seen_at")
+                    )
+                ).values(last_ping_at=sqlalchemy.bindparam("seen_at")),
+                [
+                    {"agent_id": agent_id, "seen_at": seen_at}
+                    for agent_id, seen_at in last_seen.items()
+                ]
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            # Retain heartbeats for next flush, unless newer heartbeats have been received
+            with cls._lock:
+                for agent_id, seen_at in last_seen.items():
+                    cls._last_seen.setdefault(agent_id, seen_at)
+            raise
+        finally:
+            Database.get_session().remove()
@@ -0,0 +1,222 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import threading
+import time
+from typing import Callable, Dict, Optional, Set, Tuple, Any
+
+import sqlalchemy
+
+import terrarun.config
+from terrarun.database import Database
+from terrarun.logger import get_logger
+import terrarun.models.agent_pool
+import terrarun.models.configuration
+import terrarun.models.run
+import terrarun.models.workspace
+from terrarun.models.run_queue import JobQueueAgentType, RunQueue
+
+
+logger = get_logger(__name__)
+
+
+class AgentJobWaiter:
+    """
+    Park agent job requests until a job is queued for the agent's pool,
+    or the long-poll timeout expires.
+
+    Waiters are woken in-process when a job is queued by the same process.
+    Jobs queued by other processes (e.g. the worker) or returned to the queue
+    (e.g. by the agent reaper) are detected by a single background thread,
+    which periodically checks for unclaimed agent jobs whilst any requests are parked,
+    waking only the agent pools that may pick up the new jobs.
+
+    Parked requests do not hold a database transaction (or connection) whilst waiting.
+    """
+
+    # Interval, in seconds, between checks for jobs queued by other processes
+    POLL_INTERVAL = 1.0
+
+    _lock = threading.Lock()
+    # Condition for each agent pool ID that has parked requests
+    _conditions: Dict[int, threading.Condition] = {}
+    # Number of notifications for each agent pool ID that has parked requests
+    _generations: Dict[int, int] = {}
+    # Number of parked requests for each agent pool ID
+    _waiter_counts: Dict[int, int] = {}
+    _total_waiters = 0
+    _poll_thread: Optional[threading.Thread] = None
+    # IDs of unclaimed agent jobs, as of the last check by the poll thread
+    _unclaimed_job_ids: Set[int] = set()
+
+    @classmethod
+    def notify(cls, agent_pool_id: Optional[int]):
+        """
+        Wake requests waiting for jobs for an agent pool.
+
+        If the agent pool is unknown (None), jobs may be applicable to
+        non-scoped or remote agent pools, so all waiters are woken.
+        """
+        with cls._lock:
+            if agent_pool_id is None:
+                agent_pool_ids = list(cls._conditions)
+            else:
+                agent_pool_ids = [agent_pool_id] if agent_pool_id in cls._conditions else []
+            for notified_agent_pool_id in agent_pool_ids:
+                cls._generations[notified_agent_pool_id] += 1
+            conditions = [cls._conditions[notified_agent_pool_id] for notified_agent_pool_id in agent_pool_ids]
+
+        for condition in conditions:
+            with condition:
+                condition.notify_all()
+
+    @classmethod
+    def _ensure_poll_thread(cls):
+        """Start background poll thread, if not already running. Must be called with lock held"""
+        if cls._poll_thread is not None:
+            return
+        cls._poll_thread = threading.Thread(target=cls._poll_loop, daemon=True, name="agent-job-waiter-poll")
+        cls._poll_thread.start()
+
+    @classmethod
+    def _poll_loop(cls):
+        """Periodically check for jobs queued by other processes, whilst requests are parked"""
+        stop_event = threading.Event()
+        while not stop_event.wait(cls.POLL_INTERVAL):
+            with cls._lock:
+                has_waiters = cls._total_waiters > 0
+            if not has_waiters:
+                cls._unclaimed_job_ids = set()
+                continue
+
+            try:
+                cls._check_for_queued_jobs()
+            except Exception as exc:
+                logger.error(f"Failed to check for queued agent jobs: {exc}")
+            finally:
+                Database.get_session().remove()
+
+    @classmethod
+    def _check_for_queued_jobs(cls):
+        """Wake waiters for agent pools of agent jobs that have become available since the last check"""
+        session = Database.get_session()
+        Run = terrarun.models.run.Run
+        ConfigurationVersion = terrarun.models.configuration.ConfigurationVersion
+        Workspace = terrarun.models.workspace.Workspace
+        unclaimed_jobs = dict(
+            session.query(RunQueue.id, Workspace.effective_agent_pool_id).join(
+                Run, RunQueue.run_id==Run.id
+            ).join(
+                ConfigurationVersion, Run.configuration_version_id==ConfigurationVersion.id
+            ).join(
+                Workspace, ConfigurationVersion.workspace_id==Workspace.id
+            ).filter(
+                RunQueue.agent_type==JobQueueAgentType.AGENT,
+                RunQueue.agent_id==None,
+            )
+        )
+        new_job_ids = unclaimed_jobs.keys() - cls._unclaimed_job_ids
+        cls._unclaimed_job_ids = set(unclaimed_jobs)
+        if not new_job_ids:
+            return
+
+        agent_pool_ids = {unclaimed_jobs[job_id] for job_id in new_job_ids}
+        if None in agent_pool_ids:
+            # Jobs for workspaces without an agent pool may be picked up
+            # by non-scoped or remote agent pools
+            agent_pool_ids.discard(None)
+            agent_pool_ids.update(cls._get_unscoped_waiting_agent_pool_ids())
+        for agent_pool_id in agent_pool_ids:
+            cls.notify(agent_pool_id)
+
+    @classmethod
+    def _get_unscoped_waiting_agent_pool_ids(cls) -> Set[int]:
+        """Return IDs of agent pools with parked requests, that are not scoped to workspaces"""
+        with cls._lock:
+            waiting_agent_pool_ids = list(cls._conditions)
+        if not waiting_agent_pool_ids:
+            return set()
+        AgentPool = terrarun.models.agent_pool.AgentPool
+        return {
+            agent_pool_id
+            for agent_pool_id, in Database.get_session().query(AgentPool.id).filter(
+                AgentPool.id.in_(waiting_agent_pool_ids),
+                sqlalchemy.or_(
+                    AgentPool.organisation_id==None,
+                    AgentPool.organisation_scoped!=True,
+                )
+            )
+        }
+
+    @classmethod
+    def _acquire(cls, agent_pool_id: int) -> Optional[threading.Condition]:
+        """Register waiter for agent pool, returning None if the waiter limit has been reached"""
+        with cls._lock:
+            if cls._total_waiters >= terrarun.config.Config().AGENT_JOB_LONG_POLL_MAX_WAITERS:
+                return None
+            cls._total_waiters += 1
+            cls._waiter_counts[agent_pool_id] = cls._waiter_counts.get(agent_pool_id, 0) + 1
+            if agent_pool_id not in cls._conditions:
+                cls._conditions[agent_pool_id] = threading.Condition()
+                cls._generations[agent_pool_id] = 0
+            cls._ensure_poll_thread()
+            return cls._conditions[agent_pool_id]
+
+    @classmethod
+    def _release(cls, agent_pool_id: int):
+        """Deregister waiter for agent pool"""
+        with cls._lock:
+            cls._total_waiters -= 1
+            cls._waiter_counts[agent_pool_id] -= 1
+            if cls._waiter_counts[agent_pool_id] <= 0:
+                del cls._waiter_counts[agent_pool_id]
+                del cls._conditions[agent_pool_id]
+                del cls._generations[agent_pool_id]
+
+    @classmethod
+    def wait_for_job(cls, agent_pool_id: int, get_job: Callable[[], Tuple[Any, Any]]) -> Tuple[Any, Any]:
+        """
+        Return result of get_job, waiting for a job to be queued
+        until the long-poll timeout expires.
+
+        get_job is only called again once a job may have been queued.
+        """
+        timeout = terrarun.config.Config().AGENT_JOB_LONG_POLL_TIMEOUT
+        if timeout <= 0:
+            return get_job()
+
+        condition = cls._acquire(agent_pool_id)
+        if condition is None:
+            logger.debug("Maximum number of parked agent job requests reached, not waiting")
+            return get_job()
+
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                # Record notifications before checking for a job,
+                # so that jobs queued during the check are not missed
+                with cls._lock:
+                    generation = cls._generations[agent_pool_id]
+
+                result = get_job()
+                if result[0]:
+                    break
+
+                # End the transaction of the check, releasing its connection and any
+                # row/range locks whilst waiting, and so that newly queued jobs are visible
+                Database.get_session().rollback()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+                with condition:
+                    notified = condition.wait_for(
+                        lambda: cls._generations[agent_pool_id] != generation,
+                        timeout=remaining
+                    )
+                if not notified:
+                    break
+        finally:
+            cls._release(agent_pool_id)
+
+        return result
@@ -0,0 +1,135 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+from datetime import datetime, timedelta
+
+import sqlalchemy
+
+import terrarun.config
+from terrarun.agent_job_waiter import AgentJobWaiter
+from terrarun.database import Database
+from terrarun.logger import get_logger
+from terrarun.models.agent import Agent, AgentStatus
+from terrarun.models.run import Run
+from terrarun.models.run_flow import RunStatus
+from terrarun.models.run_queue import JobQueueAgentType, JobQueueType, RunQueue
+from terrarun.models.user_token import UserToken
+from terrarun.terraform_command import TerraformCommandState
+
+
+logger = get_logger(__name__)
+
+
+class AgentReaper:
+    """
+    Mark agents that have not sent a heartbeat within the agent job timeout
+    as unknown and reclaim their jobs.
+
+    Plans are returned to the queue, to be picked up by another agent.
+    Applies cannot be safely retried, so are marked as unreachable
+    and the run is errored.
+    """
+
+    # Statuses of agents that are expected to send heartbeats
+    ACTIVE_AGENT_STATUSES = [AgentStatus.IDLE, AgentStatus.BUSY]
+
+    def __init__(self, batch_size=50):
+        """Store member variables"""
+        self._batch_size = batch_size
+
+    def reap(self):
+        """Mark stale agents and reclaim their jobs"""
+        cutoff = datetime.now() - timedelta(seconds=terrarun.config.Config().AGENT_JOB_TIMEOUT)
+        self._mark_stale_agents(cutoff)
+
+        for job in self._get_stale_jobs(cutoff):
+            try:
+                if job.job_type is JobQueueType.PLAN:
+                    self._release_plan_job(job)
+                else:
+                    self._fail_apply_job(job)
+            except Exception as exc:
+                logger.error(f"Failed to reclaim job {job.id}: {exc}")
+                Database.get_session().rollback()
+
+    def _mark_stale_agents(self, cutoff: datetime):
+        """Mark agents that have not sent a heartbeat since cutoff as unknown"""
+        session = Database.get_session()
+        count = session.query(Agent).filter(
+            Agent.last_ping_at < cutoff,
+            Agent.status.in_(self.ACTIVE_AGENT_STATUSES),
+        ).update({Agent.status: AgentStatus.UNKNOWN}, synchronize_session=False)
+        session.commit()
+        if count:
+            logger.warning(f"Marked {count} agent(s) as unknown, due to missed heartbeats")
+
+    def _get_stale_jobs(self, cutoff: datetime):
+        """Return in-progress jobs assigned to agents that have not sent a heartbeat since cutoff"""
+        session = Database.get_session()
+        return session.query(RunQueue).join(
+            Agent, RunQueue.agent_id==Agent.id
+        ).join(
+            Run, RunQueue.run_id==Run.id
+        ).filter(
+            RunQueue.agent_type==JobQueueAgentType.AGENT,
+            Agent.last_ping_at < cutoff,
+            sqlalchemy.or_(
+                sqlalchemy.and_(
+                    RunQueue.job_type==JobQueueType.PLAN,
+                    Run.status.in_([RunStatus.PLAN_QUEUED, RunStatus.PLANNING]),
+                ).self_group(),
+                sqlalchemy.and_(
+                    RunQueue.job_type==JobQueueType.APPLY,
+                    Run.status.in_([RunStatus.APPLY_QUEUED, RunStatus.APPLYING]),
+                ).self_group(),
+            )
+        ).order_by(RunQueue.id).limit(self._batch_size).all()
+
+    def _revoke_job_tokens(self, job: RunQueue):
+        """Remove tokens generated for agent to perform job"""
+        session = Database.get_session()
+        session.query(UserToken).filter(
+            UserToken.job_id==job.id
+        ).delete(synchronize_session=False)
+
+    def _release_plan_job(self, job: RunQueue):
+        """Return plan job to queue"""
+        session = Database.get_session()
+        run = job.run
+        plan = run.plan
+        logger.warning(f"Re-queueing plan for run {run.api_id}, as agent {job.agent.api_id} is unreachable")
+
+        self._revoke_job_tokens(job)
+        job.agent = None
+        session.add(job)
+
+        # Reset plan, discarding output from previous agent
+        plan.agent = None
+        plan.log = None
+        plan.update_status(TerraformCommandState.PENDING, session=session)
+        if not run.update_status(RunStatus.PLAN_QUEUED, session=session):
+            # Run has been modified, e.g. cancelled, so should not be re-queued
+            session.rollback()
+            return
+        session.commit()
+
+        # Wake any agent job requests, long-polling in this process
+        AgentJobWaiter.notify(run.configuration_version.workspace.effective_agent_pool_id)
+
+    def _fail_apply_job(self, job: RunQueue):
+        """Mark apply as unreachable and error run"""
+        session = Database.get_session()
+        run = job.run
+        apply = run.plan.apply
+        logger.warning(f"Failing apply for run {run.api_id}, as agent {job.agent.api_id} is unreachable")
+
+        self._revoke_job_tokens(job)
+        if apply:
+            apply.update_status(TerraformCommandState.UNREACHABLE, session=session)
+        if not run.update_status(RunStatus.ERRORED, session=session):
+            # Run has been modified, e.g. cancelled, which handles the workspace lock
+            session.commit()
+            return
+        session.commit()
+
+        run.unlock_workspace()
@@ -39,6 +39,8 @@ class TerraformVersionEntity(BaseEntity):
             Attribute("beta", "beta", bool, False),
             Attribute("usage", "usage", int, 0),
             Attribute("created-at", "created_at", datetime, None),
+            Attribute("mirror-status", "mirror_status", str, None),
+            Attribute("mirror-error", "mirror_error", str, None),
         )
 
     @classmethod
@@ -58,6 +60,8 @@ class TerraformVersionEntity(BaseEntity):
                 "beta": obj.beta,
                 "usage": obj.usage,
                 "created_at": obj.created_at,
+                "mirror_status": obj.mirror_status.value if obj.mirror_status else None,
+                "mirror_error": obj.mirror_error,
             },
         )
 
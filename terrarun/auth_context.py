@@ -2,15 +2,55 @@
 # SPDX-License-Identifier: GPL-2.0
 
 from typing import Optional
-from dataclasses import dataclass
 
 import terrarun.models.user
 import terrarun.models.run_queue
 
 
-@dataclass
 class AuthContext:
-    """Handle passing current authentication context"""
+    """
+    Handle passing current authentication context.
 
-    user: Optional['terrarun.models.user.User']
-    job: Optional['terrarun.models.run_queue.RunQueue']
+    The user and job may be provided as API IDs,
+    in which case they are only obtained from the database when accessed.
+    """
+
+    def __init__(self,
+                 user: Optional['terrarun.models.user.User'],
+                 job: Optional['terrarun.models.run_queue.RunQueue'],
+                 user_api_id: Optional[str]=None,
+                 job_api_id: Optional[str]=None):
+        """Store member variables"""
+        self._user = user
+        self._job = job
+        self._user_api_id = user_api_id if user is None else None
+        self._job_api_id = job_api_id if job is None else None
+
+    @property
+    def user(self) -> Optional['terrarun.models.user.User']:
+        """Return user"""
+        if self._user_api_id is not None:
+            self._user = terrarun.models.user.User.get_by_api_id(self._user_api_id)
+            self._user_api_id = None
+        return self._user
+
+    @property
+    def job(self) -> Optional['terrarun.models.run_queue.RunQueue']:
+        """Return job"""
+        if self._job_api_id is not None:
+            self._job = terrarun.models.run_queue.RunQueue.get_by_api_id(self._job_api_id)
+            self._job_api_id = None
+        return self._job
+
+    @property
+    def has_identity(self) -> bool:
+        """Return whether a user or job has been provided, without obtaining them"""
+        return (
+            self._user is not None or self._job is not None or
+            self._user_api_id is not None or self._job_api_id is not None
+        )
+
+    @property
+    def has_valid_identity(self) -> bool:
+        """Return whether the provided user or job exists, obtaining them if not already obtained"""
+        return self.user is not None or self.job is not None
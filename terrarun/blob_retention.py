@@ -0,0 +1,262 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import datetime
+import time
+from typing import Dict, List, Optional
+
+import sqlalchemy
+
+from terrarun.database import Base, Database
+from terrarun.logger import get_logger
+from terrarun.models.apply import Apply
+from terrarun.models.blob import Blob
+from terrarun.models.configuration import ConfigurationVersion
+from terrarun.models.organisation import Organisation
+from terrarun.models.plan import Plan
+from terrarun.models.run import Run
+from terrarun.models.state_version import StateVersion, StateVersionStatus
+from terrarun.models.workspace import Workspace
+from terrarun.terraform_command import TerraformCommandState
+
+
+logger = get_logger(__name__)
+
+
+class BlobRetentionSweeper:
+    """
+    Delete blobs that have expired, based on organisation retention
+    policies, or are no longer referenced by any object.
+
+    Each pass deletes, at most, one batch of blobs per call.
+    """
+
+    # Blobs are created before being associated with their parent object,
+    # so only consider unreferenced blobs as orphaned after this period
+    ORPHAN_GRACE_PERIOD = datetime.timedelta(hours=1)
+
+    # Command states, in which logs and plan output are no longer written
+    COMPLETED_COMMAND_STATES = [
+        TerraformCommandState.FINISHED,
+        TerraformCommandState.ERRORED,
+        TerraformCommandState.CANCELED,
+        TerraformCommandState.UNREACHABLE,
+    ]
+
+    def __init__(self, batch_size: int):
+        """Store member variables"""
+        self._batch_size = batch_size
+        # Cumulative totals since start of process, reported in the log after each sweep
+        self.reclaimed_bytes = 0
+        self.reclaimed_blobs = 0
+        self.pruned_state_versions = 0
+
+    def get_metrics(self) -> Dict[str, int]:
+        """Return cumulative totals of space reclaimed since start of process"""
+        return {
+            "reclaimed-bytes": self.reclaimed_bytes,
+            "reclaimed-blobs": self.reclaimed_blobs,
+            "pruned-state-versions": self.pruned_state_versions,
+        }
+
+    def sweep(self):
+        """Perform all retention passes"""
+        start_time = time.time()
+        previous_bytes = self.reclaimed_bytes
+        previous_blobs = self.reclaimed_blobs
+
+        for organisation in self._get_organisations_with_policies():
+            if organisation.state_version_retention_count is not None:
+                self._sweep_state_versions(organisation)
+            if organisation.plan_json_retention_days is not None:
+                self._sweep_plan_json(organisation)
+            if organisation.log_retention_days is not None:
+                self._sweep_logs(organisation)
+        self._sweep_orphaned_blobs()
+
+        logger.info(
+            "Blob retention sweep completed in %.2fs: reclaimed %s bytes from %s blobs "
+            "(total: %s bytes, %s blobs, %s state versions pruned)",
+            time.time() - start_time,
+            self.reclaimed_bytes - previous_bytes, self.reclaimed_blobs - previous_blobs,
+            self.reclaimed_bytes, self.reclaimed_blobs, self.pruned_state_versions
+        )
+
+    def _get_organisations_with_policies(self) -> List[Organisation]:
+        """Return organisations that have any retention policy configured"""
+        session = Database.get_session()
+        return session.query(Organisation).filter(
+            sqlalchemy.or_(
+                Organisation.state_version_retention_count!=None,
+                Organisation.plan_json_retention_days!=None,
+                Organisation.log_retention_days!=None,
+            )
+        ).all()
+
+    def _delete_blobs(self, blob_ids: List[Optional[int]]):
+        """Delete blobs and commit, recording reclaimed space"""
+        session = Database.get_session()
+        blob_ids = [blob_id for blob_id in blob_ids if blob_id is not None]
+        if not blob_ids:
+            session.commit()
+            return
+
+        # Ensure references to blobs have been removed before deletion
+        session.flush()
+        reclaimed_bytes = session.query(
+            sqlalchemy.func.coalesce(sqlalchemy.func.sum(sqlalchemy.func.length(Blob._data)), 0)
+        ).filter(Blob.id.in_(blob_ids)).scalar()
+        deleted_count = session.query(Blob).filter(
+            Blob.id.in_(blob_ids)
+        ).delete(synchronize_session=False)
+        session.commit()
+
+        self.reclaimed_bytes += int(reclaimed_bytes)
+        self.reclaimed_blobs += deleted_count
+
+    def _get_cutoff(self, days: int) -> datetime.datetime:
+        """Return datetime, before which data has expired"""
+        return datetime.datetime.now() - datetime.timedelta(days=days)
+
+    def _sweep_state_versions(self, organisation: Organisation):
+        """Remove backing data of state versions beyond the retention count of each workspace"""
+        session = Database.get_session()
+        # Always retain at least the latest state
+        retention_count = max(organisation.state_version_retention_count, 1)
+        remaining = self._batch_size
+
+        for workspace in session.query(Workspace).filter(Workspace.organisation_id==organisation.id):
+            if remaining <= 0:
+                break
+
+            # Obtain state versions to retain, using the same ordering as Workspace.latest_state
+            retained_ids = [
+                row.id
+                for row in session.query(StateVersion.id).filter(
+                    StateVersion.workspace_id==workspace.id,
+                    StateVersion.status==StateVersionStatus.FINALIZED,
+                    StateVersion.intermediate==False,
+                ).order_by(
+                    StateVersion.serial.desc(),
+                    StateVersion.id.desc()
+                ).limit(retention_count)
+            ]
+            if len(retained_ids) < retention_count:
+                continue
+
+            # Only prune state versions older than the retained versions,
+            # leaving any newer pending or intermediate state untouched
+            state_versions = session.query(StateVersion).filter(
+                StateVersion.workspace_id==workspace.id,
+                StateVersion.status.in_([StateVersionStatus.FINALIZED, StateVersionStatus.DISCARDED]),
+                StateVersion.id.notin_(retained_ids),
+                StateVersion.id < min(retained_ids),
+            ).order_by(StateVersion.id).limit(remaining).all()
+            if not state_versions:
+                continue
+
+            blob_ids = []
+            for state_version in state_versions:
+                blob_ids += [
+                    state_version.state_id,
+                    state_version.json_state_id,
+                    state_version.json_state_outputs_id,
+                    state_version.outputs_document_id,
+                ]
+                state_version.state_id = None
+                state_version.json_state_id = None
+                state_version.json_state_outputs_id = None
+                state_version.outputs_document_id = None
+                state_version.outputs_document_etag = None
+                state_version.status = StateVersionStatus.BACKING_DATA_PERMANENTLY_DELETED
+                session.add(state_version)
+
+            self._delete_blobs(blob_ids)
+            self.pruned_state_versions += len(state_versions)
+            remaining -= len(state_versions)
+
+    def _query_organisation_plans(self, organisation: Organisation, days: int):
+        """Return query for completed plans of organisation, created before retention period"""
+        session = Database.get_session()
+        return session.query(Plan).join(
+            Run, Plan.run_id==Run.id
+        ).join(
+            ConfigurationVersion, Run.configuration_version_id==ConfigurationVersion.id
+        ).join(
+            Workspace, ConfigurationVersion.workspace_id==Workspace.id
+        ).filter(
+            Workspace.organisation_id==organisation.id,
+            Run.created_at < self._get_cutoff(days),
+            Plan.status.in_(self.COMPLETED_COMMAND_STATES),
+        )
+
+    def _sweep_plan_json(self, organisation: Organisation):
+        """Remove JSON plan output and provider schemas from expired plans"""
+        plans = self._query_organisation_plans(
+            organisation=organisation, days=organisation.plan_json_retention_days
+        ).filter(
+            sqlalchemy.or_(Plan.plan_output_id!=None, Plan.providers_schemas_id!=None)
+        ).order_by(Plan.id).limit(self._batch_size).all()
+
+        blob_ids = []
+        for plan in plans:
+            blob_ids += [plan.plan_output_id, plan.providers_schemas_id]
+            plan.plan_output_id = None
+            plan.providers_schemas_id = None
+        self._delete_blobs(blob_ids)
+
+    def _sweep_logs(self, organisation: Organisation):
+        """Remove logs from expired plans and applies"""
+        blob_ids = []
+        plans = self._query_organisation_plans(
+            organisation=organisation, days=organisation.log_retention_days
+        ).filter(
+            Plan.log_id!=None
+        ).order_by(Plan.id).limit(self._batch_size).all()
+        for plan in plans:
+            blob_ids.append(plan.log_id)
+            plan.log_id = None
+
+        session = Database.get_session()
+        applies = session.query(Apply).join(
+            Plan, Apply.plan_id==Plan.id
+        ).join(
+            Run, Plan.run_id==Run.id
+        ).join(
+            ConfigurationVersion, Run.configuration_version_id==ConfigurationVersion.id
+        ).join(
+            Workspace, ConfigurationVersion.workspace_id==Workspace.id
+        ).filter(
+            Workspace.organisation_id==organisation.id,
+            Run.created_at < self._get_cutoff(organisation.log_retention_days),
+            Apply.status.in_(self.COMPLETED_COMMAND_STATES),
+            Apply.log_id!=None,
+        ).order_by(Apply.id).limit(self._batch_size).all()
+        for apply in applies:
+            blob_ids.append(apply.log_id)
+            apply.log_id = None
+
+        self._delete_blobs(blob_ids)
+
+    def _sweep_orphaned_blobs(self):
+        """Delete blobs that are not referenced by any object"""
+        session = Database.get_session()
+
+        # Determine all columns that reference blobs from model metadata,
+        # so that references added to new models are always considered
+        reference_conditions = []
+        for table in Base.metadata.tables.values():
+            for foreign_key in table.foreign_keys:
+                if foreign_key.column.table.name == Blob.__tablename__:
+                    reference_conditions.append(
+                        ~sqlalchemy.exists().where(foreign_key.parent==Blob.id)
+                    )
+
+        orphaned_ids = [
+            row.id
+            for row in session.query(Blob.id).filter(
+                Blob.created_at < datetime.datetime.now() - self.ORPHAN_GRACE_PERIOD,
+                *reference_conditions
+            ).order_by(Blob.id).limit(self._batch_size)
+        ]
+        self._delete_blobs(orphaned_ids)
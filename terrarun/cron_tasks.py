@@ -2,18 +2,28 @@
 # SPDX-License-Identifier: GPL-2.0
 
 
-import re
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import datetime
+import queue
 import signal
+import threading
 import time
-import fnmatch
 
 import schedule
+import terrarun.config
+from terrarun.agent_reaper import AgentReaper
+from terrarun.blob_retention import BlobRetentionSweeper
 from terrarun.database import Database
 from terrarun.logger import get_logger
 
+from terrarun.models.audit_event import AuditEvent
 from terrarun.models.authorised_repo import AuthorisedRepo
-from terrarun.models.configuration import ConfigurationVersion
-from terrarun.models.run import Run
+from terrarun.models.blob import Blob
+from terrarun.models.task_stage import TaskStage
+from terrarun.models.tool import Tool
+from terrarun.repository_snapshot import RepositorySnapshot
+from terrarun.vcs_trigger import VcsTrigger
 
 
 log = get_logger(__name__)
@@ -25,7 +35,27 @@ class CronTasks:
     def __init__(self):
         """Store member variables"""
         self._running = True
-        schedule.every(60).seconds.do(self.check_for_vcs_commits)
+        config = terrarun.config.Config()
+        self._vcs_poll_executor = ThreadPoolExecutor(
+            max_workers=config.VCS_POLL_CONCURRENCY,
+            thread_name_prefix="vcs-poll"
+        )
+        # Semaphores limiting concurrent checks, keyed by OAuth client ID
+        self._vcs_provider_semaphores = {}
+        # Duration, in seconds, of the last VCS poll cycle
+        self.last_vcs_poll_duration = None
+        # Number of VCS provider API calls avoided by sharing repository snapshots in the last VCS poll cycle
+        self.last_vcs_poll_saved_api_calls = 0
+        self._vcs_trigger = VcsTrigger()
+        self._blob_retention_sweeper = BlobRetentionSweeper(batch_size=config.BLOB_RETENTION_BATCH_SIZE)
+        schedule.every(config.VCS_POLL_INTERVAL).seconds.do(self.check_for_vcs_commits)
+        schedule.every(60).seconds.do(self.recompress_legacy_blobs)
+        schedule.every(config.BLOB_RETENTION_SWEEP_INTERVAL).seconds.do(self.sweep_blob_retention)
+        schedule.every(30).seconds.do(self.mirror_tools)
+        self._agent_reaper = AgentReaper()
+        schedule.every(config.AGENT_REAPER_INTERVAL).seconds.do(self.reap_unreachable_agents)
+        schedule.every(60).seconds.do(self.check_task_result_timeouts)
+        schedule.every(3600).seconds.do(self.archive_audit_events)
 
     def stop(self):
         """Mark as stopped, stopping any further jobs from executing"""
@@ -34,173 +64,193 @@ class CronTasks:
     def start(self):
         """Start scheduler"""
         signal.signal(signal.SIGINT, self.stop)
+        # Tools can only be mid-mirror if a previous instance was stopped
+        Tool.reset_interrupted_mirrors()
         #signal.pause()
         while self._running:
             schedule.run_pending()
             time.sleep(1)
 
-    def _process_authorised_repo_workspace(self, authorised_repo, workspace, branch_shas):
-        """Handle checking workspace for new commits to create run for"""
-        log.debug(f'Handling workspace: {workspace.name}')
-        service_provider = authorised_repo.oauth_token.oauth_client.service_provider_instance
-
-        commit_sha = None
-        workspace_branch = None
-        workspace_tag = None
-
-        # Handle workspaces with git tag regex
-        if workspace.vcs_repo_tags_regex:
-            log.debug("Handling tag-based search")
-            tag_re = re.compile(workspace.vcs_repo_tags_regex)
-            tags = service_provider.get_tags(
-                authorised_repo=workspace.authorised_repo
+    def _get_vcs_provider_semaphore(self, oauth_client_id):
+        """Return semaphore limiting concurrent checks against VCS provider"""
+        if oauth_client_id not in self._vcs_provider_semaphores:
+            self._vcs_provider_semaphores[oauth_client_id] = threading.BoundedSemaphore(
+                terrarun.config.Config().VCS_POLL_PROVIDER_CONCURRENCY
             )
-            for tag in tags:
-                log.debug(f"Checking tag: {tag}")
-                if tag_re.match(tag):
-                    log.debug("Tag matches regex")
-                    # Once a match tag is found, check if there is a run for it
-                    if not ConfigurationVersion.get_configuration_version_by_git_commit_sha(
-                            workspace=workspace,
-                            git_commit_sha=tags[tag]):
-                        # If there wasn't, perform a run with the commit sha
-                        commit_sha = tags[tag]
-                        workspace_tag = tag
-                        log.debug(f"Using tag commit {tags[tag]}")
-                    else:
-                        log.debug(f"Run already exists for commit {tags[tag]}")
-
-                    # Otherwise, the commit sha is not set, but exit
-                    # as all other tags are older
-                    break
-                else:
-                    log.debug("Tag does not match regex")
+        return self._vcs_provider_semaphores[oauth_client_id]
 
-        else:
-            workspace_branch = workspace.get_branch()
+    def _check_authorised_repo(self, authorised_repo_id):
+        """
+        Check workspaces of authorised repo for new commits.
 
-            # Obtain latest sha for branch, if not already cached
-            if workspace_branch not in branch_shas:
-                branch_shas[workspace_branch] =  service_provider.get_latest_commit_ref(
-                    authorised_repo=workspace.authorised_repo, branch=workspace_branch
-                )
+        Executed in a poller thread, so objects are obtained using the thread's own session.
+        Returns number of VCS provider API calls saved by sharing repository metadata between workspaces.
+        """
+        snapshot = None
+        try:
+            authorised_repo = AuthorisedRepo.get_by_id(authorised_repo_id)
+            if not authorised_repo:
+                return 0
+
+            log.debug(f'Handling repo: {authorised_repo.name}')
+            workspaces = self._vcs_trigger.get_workspaces(authorised_repo)
+            snapshot = RepositorySnapshot(authorised_repo=authorised_repo, workspaces=workspaces)
 
-            if not branch_shas[workspace_branch]:
-                log.warning(f'Could not find latest commit for branch: {workspace_branch}')
-                return branch_shas
-
-            if not ConfigurationVersion.get_configuration_version_by_git_commit_sha(
-                    workspace=workspace,
-                    git_commit_sha=branch_shas[workspace_branch]):
-                commit_sha = branch_shas[workspace_branch]
-
-                # Check if filters match
-                if workspace.trigger_patterns or workspace.trigger_prefixes:
-                    log.debug("Trigger pattern/prefixes enabled")
-                    latest_configuration_version = workspace.latest_configuration_version
-                    # If there is a configuration version and it contains a git sha...
-                    if latest_configuration_version and latest_configuration_version.git_commit_sha:
-                        # Get the file changes between the commits
-                        file_changes = service_provider.get_changed_files(
-                            authorised_repo=workspace.authorised_repo,
-                            base=latest_configuration_version.git_commit_sha,
-                            head=commit_sha
-                        )
-                        log.debug(f"Found file changes: {file_changes}")
-                        if workspace.trigger_patterns:
-                            log.debug("Checking trigger patterns")
-                            for trigger_pattern in workspace.trigger_patterns:
-                                log.debug(f"Checking pattern: {trigger_pattern}")
-                                # If any of the filters match, break
-                                if fnmatch.filter(file_changes, trigger_pattern):
-                                    log.debug("Pattern matched")
-                                    break
-                            else:
-                                # If no match was found, unset commit sha to avoid build
-                                log.debug('No patterns matched')
-                                commit_sha = None
-
-                        elif workspace.trigger_prefixes:
-                            log.debug("Checking trigger prefixes")
-
-                            for trigger_prefix in workspace.trigger_prefixes:
-                                log.debug(f"Checking prefix: {trigger_prefix}")
-
-                                if filter(lambda x: x.startswith(trigger_prefix), file_changes):
-                                    log.debug("Prefix matched")
-                                    break
-                            else:
-                                log.debug('No prefixes matched')
-                                commit_sha = None
-
-                    else:
-                        log.warning("No latest configuration version found or "
-                                    "latest configuration version has no commit ID")
-
-        if commit_sha is not None:
-            log.info(f"Creating configuration version for commit {commit_sha}")
-            # If there is not a configuration version for the git commit,
-            # create one
-            cv = ConfigurationVersion.generate_from_vcs(
-                workspace=workspace,
-                commit_ref=commit_sha,
-                # Allow all runs to be queued to be applied
-                speculative=False,
-                branch=workspace_branch,
-                tag=workspace_tag
+            for workspace in workspaces:
+                self._vcs_trigger.process_workspace(workspace=workspace, snapshot=snapshot)
+
+            log.debug(
+                "Checked repo %s with %s VCS API calls, saving %s calls",
+                authorised_repo.name, snapshot.api_calls, snapshot.saved_api_calls
             )
-            if not cv:
-                log.info('Unable to create configuration version')
-                return branch_shas
-
-            # Create run
-            if workspace.queue_all_runs:
-                log.info(f"Creating run")
-                try:
-                    Run.create(
-                        configuration_version=cv,
-                        created_by=None,
-                        is_destroy=False,
-                        refresh=True,
-                        refresh_only=False,
-                        auto_apply=workspace.auto_apply,
-                        plan_only=False,
-                        message="Initiated from SCM change"
-                    )
-                # @TODO Limit to legitimate errors, such as environment progression
-                # errors
-                except Exception as exc:
-                    log.error(f"failed to start run: {exc}")
-            else:
-                log.info("Skipping run creation as workspace not configured with queue_all_runs")
-        return branch_shas
+            authorised_repo.last_checked_changes = datetime.datetime.now()
+            Database.get_session().add(authorised_repo)
+            Database.get_session().commit()
+        except Exception as exc:
+            log.error(f"Failed to check authorised repo {authorised_repo_id} for commits: {exc}")
+            Database.get_session().rollback()
+        finally:
+            # Clear database session to avoid cached queries
+            Database.get_session().remove()
+        return snapshot.saved_api_calls if snapshot else 0
+
+    def _submit_authorised_repo_checks(self, authorised_repo_ids, provider_semaphore, results):
+        """
+        Submit checks of pending authorised repos of a VCS provider to the thread pool.
+
+        The provider semaphore is acquired before submitting each check and released once
+        it completes, which submits the next pending check, so poller threads are never
+        blocked waiting for a provider whilst repos of other providers are queued.
+        The result of each check is put into the results queue.
+        """
+        while authorised_repo_ids and provider_semaphore.acquire(blocking=False):
+            try:
+                authorised_repo_id = authorised_repo_ids.popleft()
+            except IndexError:
+                provider_semaphore.release()
+                return
+
+            def _on_complete(future):
+                provider_semaphore.release()
+                results.put(0 if future.exception() else future.result())
+                self._submit_authorised_repo_checks(authorised_repo_ids, provider_semaphore, results)
+
+            self._vcs_poll_executor.submit(
+                self._check_authorised_repo, authorised_repo_id
+            ).add_done_callback(_on_complete)
 
     def check_for_vcs_commits(self):
         """Check for new commits on VCS repositories"""
         log.info("Checking for VCS commits")
+        start_time = time.time()
+
+        # Obtain all authorised repos that have one workspace or project defined.
+        # Repos that receive webhooks are only polled to reconcile any missed events.
+        config = terrarun.config.Config()
+        reconcile_cutoff = datetime.datetime.now() - datetime.timedelta(seconds=config.VCS_WEBHOOK_RECONCILE_INTERVAL)
+        authorised_repos = [
+            (authorised_repo.id, authorised_repo.oauth_token.oauth_client_id)
+            for authorised_repo in AuthorisedRepo.get_all_utilised_repos()
+            if (authorised_repo.webhook_received_at is None or
+                authorised_repo.last_checked_changes is None or
+                authorised_repo.last_checked_changes < reconcile_cutoff)
+        ]
+        Database.get_session().remove()
 
-        # Iterate over all authorised repos that have one workspace or project defined
-        for authorised_repo in AuthorisedRepo.get_all_utilised_repos():
-            log.debug(f'Handling repo: {authorised_repo.name}')
-            branch_shas = {}
-
-            for project in authorised_repo.projects:
-                log.debug(f'Handling project: {project.name}')
-
-                for workspace in project.workspaces:
-                    branch_shas = self._process_authorised_repo_workspace(
-                        authorised_repo=authorised_repo,
-                        workspace=workspace,
-                        branch_shas=branch_shas
-                    )
-
-            # Handle direct member workspaces
-            for workspace in authorised_repo.workspaces:
-                branch_shas = self._process_authorised_repo_workspace(
-                    authorised_repo=authorised_repo,
-                    workspace=workspace,
-                    branch_shas=branch_shas
-                )
+        # Check each repo in the thread pool, limiting the concurrency per VCS provider
+        provider_authorised_repo_ids = collections.defaultdict(collections.deque)
+        for authorised_repo_id, oauth_client_id in authorised_repos:
+            provider_authorised_repo_ids[oauth_client_id].append(authorised_repo_id)
+        results = queue.Queue()
+        for oauth_client_id, authorised_repo_ids in provider_authorised_repo_ids.items():
+            self._submit_authorised_repo_checks(
+                authorised_repo_ids, self._get_vcs_provider_semaphore(oauth_client_id), results
+            )
+        saved_api_calls = sum(results.get() for _ in authorised_repos)
+
+        self.last_vcs_poll_duration = time.time() - start_time
+        self.last_vcs_poll_saved_api_calls = saved_api_calls
+        log.info(
+            "Checked %s repositories for VCS commits in %.2fs (%s VCS API calls saved)",
+            len(authorised_repos), self.last_vcs_poll_duration, self.last_vcs_poll_saved_api_calls
+        )
+        if self.last_vcs_poll_duration > config.VCS_POLL_INTERVAL:
+            log.warning(
+                "VCS poll cycle took longer than poll interval (%ss). Consider increasing VCS_POLL_CONCURRENCY",
+                config.VCS_POLL_INTERVAL
+            )
 
-        # Clear database session to avoid cached queries
-        Database.get_session().remove()
+    def check_task_result_timeouts(self):
+        """Queue runs with timed out task results"""
+        try:
+            TaskStage.handle_timed_out_task_results()
+        except Exception as exc:
+            log.error(f"Failed to check task result timeouts: {exc}")
+            Database.get_session().rollback()
+        finally:
+            Database.get_session().remove()
+
+    def recompress_legacy_blobs(self):
+        """
+        Compress a bounded batch of blobs written before compression was introduced
+        and combine the gzip members of a bounded batch of appended blobs
+        """
+        try:
+            Blob.recompress_legacy_blobs(limit=terrarun.config.Config().BLOB_COMPRESSION_BATCH_SIZE)
+            Blob.recompress_appended_blobs(limit=terrarun.config.Config().BLOB_COMPRESSION_BATCH_SIZE)
+        except Exception as exc:
+            log.error(f"Failed to recompress legacy blobs: {exc}")
+            Database.get_session().rollback()
+        finally:
+            Database.get_session().remove()
+
+    def sweep_blob_retention(self):
+        """Delete expired and orphaned blobs"""
+        try:
+            self._blob_retention_sweeper.sweep()
+        except Exception as exc:
+            log.error(f"Failed to sweep blobs: {exc}")
+            Database.get_session().rollback()
+        finally:
+            Database.get_session().remove()
+
+    def archive_audit_events(self):
+        """Move old audit events to the archive table"""
+        config = terrarun.config.Config()
+        if config.AUDIT_EVENT_ARCHIVE_AFTER_DAYS <= 0:
+            return
+        try:
+            older_than = datetime.datetime.now() - datetime.timedelta(days=config.AUDIT_EVENT_ARCHIVE_AFTER_DAYS)
+            while self._running:
+                archived = AuditEvent.archive_events(
+                    older_than=older_than,
+                    batch_size=config.AUDIT_EVENT_ARCHIVE_BATCH_SIZE
+                )
+                if not archived:
+                    break
+                log.info(f"Archived {archived} audit events")
+        except Exception as exc:
+            log.error(f"Failed to archive audit events: {exc}")
+            Database.get_session().rollback()
+        finally:
+            Database.get_session().remove()
+
+    def mirror_tools(self):
+        """Mirror tool archives into object storage"""
+        try:
+            Tool.mirror_pending_tools()
+        except Exception as exc:
+            log.error(f"Failed to mirror tools: {exc}")
+            Database.get_session().rollback()
+        finally:
+            Database.get_session().remove()
+
+    def reap_unreachable_agents(self):
+        """Mark agents that have stopped sending heartbeats and reclaim their jobs"""
+        try:
+            self._agent_reaper.reap()
+        except Exception as exc:
+            log.error(f"Failed to reap unreachable agents: {exc}")
+            Database.get_session().rollback()
+        finally:
+            Database.get_session().remove()
@@ -70,6 +70,12 @@ class UnableToDownloadToolChecksumFileError(TerrarunError):
     pass
 
 
+class ToolArchiveChecksumMismatchError(TerrarunError):
+    """Checksum of downloaded tool zip file does not match expected checksum"""
+
+    pass
+
+
 class LifecycleEnvironmentGroupHasLifecycleEnvironmentsError(TerrarunError):
     """Lifecycle environment group was attempted to be deleted whilst lifecycle environment were associated with it"""
 
@@ -0,0 +1,199 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+from collections import OrderedDict
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import requests
+import requests.adapters
+
+import terrarun.config
+from terrarun.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class GithubApiClient:
+    """
+    HTTP client for Github API requests.
+
+    Requests share a pooled session. GET responses are cached using
+    ETag/Last-Modified headers, as conditional requests that return
+    304 are not counted against the rate limit.
+    Requests are spaced out as the remaining rate limit of a token drops.
+    """
+
+    API_VERSION = "2022-11-28"
+
+    # Maximum number of cached responses
+    MAX_CACHED_RESPONSES = 1024
+    # Responses larger than this, in bytes, are not cached
+    MAX_CACHED_RESPONSE_SIZE = 1024 * 1024
+
+    _lock = threading.Lock()
+    _session: Optional[requests.Session] = None
+    # Cached responses, keyed by token, URL and params
+    _response_cache: 'OrderedDict[Tuple, requests.Response]' = OrderedDict()
+    # Rate limit state, keyed by token: remaining requests, reset time and time until which requests are blocked
+    _rate_limits: Dict[str, dict] = {}
+    # Request metrics, keyed by token metrics key
+    _metrics: Dict[str, Dict[str, int]] = {}
+
+    def __init__(self, token: str, metrics_key: str):
+        """Store member variables"""
+        self._token = token
+        self._metrics_key = metrics_key
+
+    @classmethod
+    def _get_session(cls) -> requests.Session:
+        """Return shared session, creating it if it does not exist"""
+        with cls._lock:
+            if cls._session is None:
+                pool_size = max(terrarun.config.Config().VCS_POLL_CONCURRENCY, 10)
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                cls._session = session
+            return cls._session
+
+    @classmethod
+    def get_metrics(cls) -> Dict[str, Dict[str, int]]:
+        """Return request metrics for each token"""
+        with cls._lock:
+            return {key: dict(metrics) for key, metrics in cls._metrics.items()}
+
+    def _increment_metric(self, name: str):
+        """Increment metric for token. Must be called with lock held"""
+        metrics = self._metrics.setdefault(self._metrics_key, {
+            "requests": 0,
+            "not-modified": 0,
+            "rate-limited": 0,
+            "delayed": 0,
+        })
+        metrics[name] += 1
+
+    def _get_rate_limit_delay(self) -> Optional[float]:
+        """
+        Return delay, in seconds, before a request should be made.
+        Returns None if the rate limit has been exhausted and requests should not be made.
+        """
+        config = terrarun.config.Config()
+        with self._lock:
+            rate_limit = self._rate_limits.get(self._token)
+        if not rate_limit:
+            return 0
+
+        now = time.time()
+        if rate_limit["blocked_until"] > now:
+            return None
+
+        remaining = rate_limit["remaining"]
+        reset_time = rate_limit["reset"]
+        if remaining is None or reset_time is None or reset_time <= now:
+            return 0
+        if remaining <= 0:
+            return None
+        if remaining >= config.GITHUB_RATE_LIMIT_BACKOFF_THRESHOLD:
+            return 0
+
+        # Spread remaining requests evenly until the rate limit resets
+        return min((reset_time - now) / remaining, config.GITHUB_RATE_LIMIT_MAX_DELAY)
+
+    def _update_rate_limit(self, response: requests.Response):
+        """Update rate limit state from response headers"""
+        headers = response.headers
+        blocked_until = 0
+        # Secondary rate limits respond with a retry-after header
+        if response.status_code in (403, 429) and (retry_after := headers.get("Retry-After")):
+            try:
+                blocked_until = time.time() + int(retry_after)
+            except ValueError:
+                pass
+
+        try:
+            remaining = int(headers["X-RateLimit-Remaining"]) if "X-RateLimit-Remaining" in headers else None
+            reset_time = int(headers["X-RateLimit-Reset"]) if "X-RateLimit-Reset" in headers else None
+        except ValueError:
+            remaining, reset_time = None, None
+
+        if remaining is None and not blocked_until:
+            return
+
+        with self._lock:
+            rate_limit = self._rate_limits.setdefault(
+                self._token, {"remaining": None, "reset": None, "blocked_until": 0}
+            )
+            if remaining is not None:
+                rate_limit["remaining"] = remaining
+                rate_limit["reset"] = reset_time
+            if blocked_until:
+                rate_limit["blocked_until"] = blocked_until
+                self._increment_metric("rate-limited")
+
+    @staticmethod
+    def _rate_limited_response(url: str) -> requests.Response:
+        """Return response for request that was not made due to rate limiting"""
+        response = requests.Response()
+        response.status_code = 429
+        response.url = url
+        response._content = b""
+        return response
+
+    def request(self, method: str, url: str, params: Optional[dict]=None, stream: bool=False) -> requests.Response:
+        """Perform request"""
+        headers = {
+            "X-GitHub-Api-Version": self.API_VERSION,
+            "Accept": "application/vnd.github+json",
+            "Authorization": f"Bearer {self._token}",
+        }
+
+        delay = self._get_rate_limit_delay()
+        if delay is None:
+            logger.warning("Github rate limit exhausted, not requesting: %s", url)
+            with self._lock:
+                self._increment_metric("rate-limited")
+            return self._rate_limited_response(url)
+        if delay:
+            logger.debug("Github rate limit low, delaying request by %.2fs", delay)
+            with self._lock:
+                self._increment_metric("delayed")
+            time.sleep(delay)
+
+        # Add conditional headers from cached response
+        cache_key = None
+        cached_response = None
+        if method == "GET" and not stream:
+            cache_key = (self._token, url, tuple(sorted((params or {}).items())))
+            with self._lock:
+                cached_response = self._response_cache.get(cache_key)
+            if cached_response is not None:
+                if etag := cached_response.headers.get("ETag"):
+                    headers["If-None-Match"] = etag
+                if last_modified := cached_response.headers.get("Last-Modified"):
+                    headers["If-Modified-Since"] = last_modified
+
+        logger.debug('Making github request to: %s', url)
+        logger.debug('params: %s', params)
+        response = self._get_session().request(method, url, headers=headers, params=params, stream=stream)
+        self._update_rate_limit(response)
+
+        with self._lock:
+            self._increment_metric("requests")
+            if cache_key is not None:
+                if response.status_code == 304 and cached_response is not None:
+                    self._increment_metric("not-modified")
+                    self._response_cache.move_to_end(cache_key)
+                    return cached_response
+
+                if (response.status_code == 200 and
+                        (response.headers.get("ETag") or response.headers.get("Last-Modified")) and
+                        len(response.content) <= self.MAX_CACHED_RESPONSE_SIZE):
+                    self._response_cache[cache_key] = response
+                    while len(self._response_cache) > self.MAX_CACHED_RESPONSES:
+                        self._response_cache.popitem(last=False)
+
+        return response
@@ -6,20 +6,23 @@ from typing import Tuple, Optional
 import sqlalchemy
 
 from terrarun.database import Database
-import terrarun.models.organisation
+from terrarun.logger import get_logger
+import terrarun.log_ingest
 import terrarun.models.agent
 import terrarun.models.apply
 import terrarun.models.configuration
-import terrarun.models.project
+import terrarun.models.plan
 import terrarun.models.run
 import terrarun.models.run_flow
 import terrarun.models.run_queue
 import terrarun.models.workspace
-import terrarun.models.environment
 import terrarun.terraform_command
 import terrarun.workspace_execution_mode
 
 
+logger = get_logger(__name__)
+
+
 class JobProcessor:
 
     @staticmethod
@@ -57,14 +60,6 @@ class JobProcessor:
             terrarun.models.run.Run.configuration_version
         ).join(
             terrarun.models.configuration.ConfigurationVersion.workspace
-        ).join(
-            terrarun.models.workspace.Workspace.project
-        ).join(
-            terrarun.models.workspace.Workspace.environment
-        ).join(
-            terrarun.models.workspace.Workspace.organisation
-        ).outerjoin(
-            terrarun.models.organisation.Organisation.default_agent_pool
         )
 
         # Filter jobs that are being handled by an agent
@@ -79,84 +74,36 @@ class JobProcessor:
         # any jobs with execution type of "remote"
         if agent.agent_pool.organisation is None:
             execution_mode = terrarun.workspace_execution_mode.WorkspaceExecutionMode.REMOTE
-            query = query.filter(sqlalchemy.or_(
-                sqlalchemy.and_(
-                    terrarun.models.workspace.Workspace._execution_mode==execution_mode,
-                ).self_group(),
-                sqlalchemy.and_(
-                    terrarun.models.workspace.Workspace._execution_mode==None,
-                    terrarun.models.project.Project._execution_mode==execution_mode,
-                ).self_group(),
-                sqlalchemy.and_(
-                    terrarun.models.workspace.Workspace._execution_mode==None,
-                    terrarun.models.project.Project._execution_mode==None,
-                    terrarun.models.organisation.Organisation.default_execution_mode==execution_mode,
-                ).self_group(),
-            ))
+            query = query.filter(
+                terrarun.models.workspace.Workspace.effective_execution_mode==execution_mode,
+            )
         else:
             execution_mode = terrarun.workspace_execution_mode.WorkspaceExecutionMode.AGENT
 
-            # Limit to organisation that this agent pool is tied to, ensuring
-            # the default agent pool is None or this agent pool
+            # Limit to organisation that this agent pool is tied to
+            # and workspaces with agent execution mode
             query = query.filter(
-                terrarun.models.workspace.Workspace.organisation==agent.agent_pool.organisation,
+                terrarun.models.workspace.Workspace.organisation_id==agent.agent_pool.organisation_id,
+                terrarun.models.workspace.Workspace.effective_execution_mode==execution_mode,
             )
 
-            # Limit by execution type of agent
-            query = query.filter(sqlalchemy.or_(
-                sqlalchemy.and_(
-                    terrarun.models.workspace.Workspace._execution_mode==execution_mode,
-                ).self_group(),
-                sqlalchemy.and_(
-                    terrarun.models.workspace.Workspace._execution_mode==None,
-                    terrarun.models.project.Project._execution_mode==execution_mode,
-                ).self_group(),
-                sqlalchemy.and_(
-                    terrarun.models.workspace.Workspace._execution_mode==None,
-                    terrarun.models.project.Project._execution_mode==None,
-                    terrarun.models.organisation.Organisation.default_execution_mode==execution_mode,
-                ).self_group(),
-            ))
-
             if agent.agent_pool.organisation_scoped:
-                # Limit by any workspace, project or environment that has the agent pool assigned
-                query = query.filter(sqlalchemy.or_(
-                    # If workspace is assigned to agent pool
-                    sqlalchemy.and_(
-                        terrarun.models.workspace.Workspace.agent_pool==agent.agent_pool,
-                    ).self_group(),
-                    # Or workspace is unassigned and project is assigned to agent pool
-                    sqlalchemy.and_(
-                        terrarun.models.workspace.Workspace.agent_pool==None,
-                        terrarun.models.project.Project.default_agent_pool==agent.agent_pool,
-                    ).self_group(),
-                    # Or assigned at environment
-                    sqlalchemy.and_(
-                        terrarun.models.workspace.Workspace.agent_pool==None,
-                        terrarun.models.project.Project.default_agent_pool==None,
-                        terrarun.models.environment.Environment.default_agent_pool==agent.agent_pool,
-                    ).self_group(),
-                    # Or assigned at org
-                    sqlalchemy.and_(
-                        terrarun.models.workspace.Workspace.agent_pool==None,
-                        terrarun.models.project.Project.default_agent_pool==None,
-                        terrarun.models.environment.Environment.default_agent_pool==None,
-                        terrarun.models.organisation.Organisation.default_agent_pool==agent.agent_pool,
-                    ).self_group(),
-                ))
+                # Limit by workspaces that have the agent pool assigned,
+                # either directly or inherited from project, environment or organisation
+                query = query.filter(
+                    terrarun.models.workspace.Workspace.effective_agent_pool_id==agent.agent_pool.id,
+                )
             else:
                 # Allow non-scoped agent pools to pick up jobs for workspaces
                 # that don't have an agent pool associated
                 # @TODO Verify this - should these be allowed at all?
                 query = query.filter(
-                    terrarun.models.workspace.Workspace.agent_pool==None,
-                    terrarun.models.project.Project.default_agent_pool==None,
-                    terrarun.models.environment.Environment.default_agent_pool==None,
-                    terrarun.models.organisation.Organisation.default_agent_pool==None,
+                    terrarun.models.workspace.Workspace.effective_agent_pool_id==None,
                 )
 
-        # Set to with_for_updates to lock row, avoiding any other requests taking the plan
-        query = query.with_for_update()
+        # Lock the queue row, skipping rows locked by other agents,
+        # avoiding any other requests taking the plan
+        query = query.with_for_update(skip_locked=True, of=terrarun.models.run_queue.RunQueue)
 
         job: Optional['terrarun.models.run_queue.RunQueue'] = query.first()
         # Add agent to row, if one has been returned
@@ -168,7 +115,7 @@ class JobProcessor:
         return job, execution_mode
 
     @classmethod
-    def handle_plan_status_update(self, job_status):
+    def handle_plan_status_update(self, job_status, agent=None):
         """Handle status update for plan"""
 
         job_data = job_status.get("data")
@@ -178,6 +125,15 @@ class JobProcessor:
         if not run:
             return {}, 404
 
+        # Ignore updates from agents that no longer own the job,
+        # e.g. after the job has been reclaimed from an unreachable agent
+        if agent is not None and run.plan.agent_id != agent.id:
+            logger.warning("Ignoring plan status update for run %s from unassigned agent %s", run.api_id, agent.api_id)
+            return {}, 409
+
+        # Write any buffered log output before the plan status changes
+        terrarun.log_ingest.LogIngest.flush(command_class=terrarun.models.plan.Plan, command_id=run.plan.id)
+
         # @TODO Handle error message
         plan_status = terrarun.terraform_command.TerraformCommandState(job_status.get("status"))
         # Update plan attributes
@@ -196,24 +152,30 @@ class JobProcessor:
             run.unlock_workspace()
             return
 
-        elif plan_status is terrarun.terraform_command.TerraformCommandState.RUNNING:
-            run.update_status(terrarun.models.run_flow.RunStatus.PLANNING)
+        # Only apply status changes if the run has not been modified,
+        # e.g. cancelled, since the status was checked
+        current_status = run.status
+        if plan_status is terrarun.terraform_command.TerraformCommandState.RUNNING:
+            run.update_status(terrarun.models.run_flow.RunStatus.PLANNING, expected_status=current_status)
 
         elif plan_status is terrarun.terraform_command.TerraformCommandState.ERRORED:
-            run.update_status(terrarun.models.run_flow.RunStatus.ERRORED)
+            if not run.update_status(terrarun.models.run_flow.RunStatus.ERRORED, expected_status=current_status):
+                return
             # Unlock workspace
             run.unlock_workspace()
             return
 
         elif plan_status is terrarun.terraform_command.TerraformCommandState.FINISHED:
             if run.plan_only or run.configuration_version.speculative or not run.plan.has_changes:
-                run.update_status(terrarun.models.run_flow.RunStatus.PLANNED_AND_FINISHED)
+                if not run.update_status(terrarun.models.run_flow.RunStatus.PLANNED_AND_FINISHED, expected_status=current_status):
+                    return
                 # Unlock workspace
                 run.unlock_workspace()
                 return
 
             else:
-                run.update_status(terrarun.models.run_flow.RunStatus.PLANNED)
+                if not run.update_status(terrarun.models.run_flow.RunStatus.PLANNED, expected_status=current_status):
+                    return
                 terrarun.models.apply.Apply.create(plan=run.plan)
 
                 # Queue worker job for next stages
@@ -223,7 +185,7 @@ class JobProcessor:
             raise Exception(f"Unhandled plan status: {plan_status}")
 
     @classmethod
-    def handle_apply_status_update(cls, job_status):
+    def handle_apply_status_update(cls, job_status, agent=None):
         """Handle status update for apply"""
         job_data = job_status.get("data")
 
@@ -232,6 +194,13 @@ class JobProcessor:
         if not run:
             return {}, 404
 
+        if agent is not None and (not run.plan.apply or run.plan.apply.agent_id != agent.id):
+            logger.warning("Ignoring apply status update for run %s from unassigned agent %s", run.api_id, agent.api_id)
+            return {}, 409
+
+        if run.plan.apply:
+            terrarun.log_ingest.LogIngest.flush(command_class=terrarun.models.apply.Apply, command_id=run.plan.apply.id)
+
         # @TODO Handle error message
         apply_status = terrarun.terraform_command.TerraformCommandState(job_status.get("status"))
         # Update plan attributes
@@ -246,17 +215,22 @@ class JobProcessor:
             run.unlock_workspace()
             return
 
-        elif apply_status is terrarun.terraform_command.TerraformCommandState.RUNNING:
-            run.update_status(terrarun.models.run_flow.RunStatus.APPLYING)
+        # Only apply status changes if the run has not been modified,
+        # e.g. cancelled, since the status was checked
+        current_status = run.status
+        if apply_status is terrarun.terraform_command.TerraformCommandState.RUNNING:
+            run.update_status(terrarun.models.run_flow.RunStatus.APPLYING, expected_status=current_status)
 
         elif apply_status is terrarun.terraform_command.TerraformCommandState.ERRORED:
-            run.update_status(terrarun.models.run_flow.RunStatus.ERRORED)
+            if not run.update_status(terrarun.models.run_flow.RunStatus.ERRORED, expected_status=current_status):
+                return
             # Unlock workspace
             run.unlock_workspace()
             return
 
         elif apply_status is terrarun.terraform_command.TerraformCommandState.FINISHED:
-            run.update_status(terrarun.models.run_flow.RunStatus.APPLIED)
+            if not run.update_status(terrarun.models.run_flow.RunStatus.APPLIED, expected_status=current_status):
+                return
             # Unlock workspace
             run.unlock_workspace()
 
@@ -0,0 +1,203 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import atexit
+from collections import OrderedDict
+import contextlib
+import threading
+from typing import Dict, List, Optional, Tuple, Type
+
+import terrarun.config
+from terrarun.database import Database
+from terrarun.logger import get_logger
+from terrarun.models.blob import Blob
+from terrarun.presign import Presign
+import terrarun.terraform_command
+
+
+logger = get_logger(__name__)
+
+
+class LogIngest:
+    """
+    Ingest log output streamed by agents for plans/applies.
+
+    Log streams are authenticated once and cached. Chunks are
+    buffered in memory and periodically written in a single batch.
+
+    Buffers are held per server process, so must be flushed
+    before log output is considered complete (e.g. on status updates).
+    A status update only flushes the buffer of the process receiving it, so
+    with multiple server processes, log and status requests of an agent must
+    be routed to the same process (e.g. sticky sessions by agent token),
+    otherwise AGENT_LOG_FLUSH_INTERVAL must be 0, writing each chunk immediately.
+    """
+
+    # Maximum number of authenticated log streams to cache
+    MAX_CACHED_STREAMS = 1024
+    # Number of flush locks, between which plans/applies are distributed
+    FLUSH_LOCK_COUNT = 64
+
+    _lock = threading.Lock()
+    # Held whilst writing output of a plan/apply, to retain ordering of its chunks between concurrent
+    # flushes, whilst allowing output of other plans/applies to be written concurrently
+    _flush_locks = [threading.Lock() for _ in range(FLUSH_LOCK_COUNT)]
+    # Plan/apply ID, keyed by plan/apply class, plan/apply API ID and run key
+    _streams: 'OrderedDict[Tuple[Type, str, str], int]' = OrderedDict()
+    # Buffered chunks and total size, keyed by plan/apply class and ID
+    _buffers: Dict[Tuple[Type, int], List[bytes]] = {}
+    _buffer_sizes: Dict[Tuple[Type, int], int] = {}
+    _flush_thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def authenticate(cls,
+                     command_class: Type['terrarun.terraform_command.TerraformCommand'],
+                     command_api_id: str,
+                     run_key: str) -> Optional[int]:
+        """Return ID of plan/apply, if run key is valid for it"""
+        cache_key = (command_class, command_api_id, run_key)
+        with cls._lock:
+            if (command_id := cls._streams.get(cache_key)) is not None:
+                cls._streams.move_to_end(cache_key)
+                return command_id
+
+        decrypted_run_id = Presign().decrypt(run_key)
+        if not decrypted_run_id:
+            return None
+
+        command = command_class.get_by_api_id(command_api_id)
+        if not command:
+            return None
+
+        # Check encrypted run ID in URL
+        if command.run.api_id != decrypted_run_id:
+            return None
+
+        with cls._lock:
+            cls._streams[cache_key] = command.id
+            while len(cls._streams) > cls.MAX_CACHED_STREAMS:
+                cls._streams.popitem(last=False)
+        return command.id
+
+    @classmethod
+    def append(cls, command_class: Type['terrarun.terraform_command.TerraformCommand'], command_id: int, data: bytes):
+        """Buffer log output for plan/apply"""
+        if not data:
+            return
+
+        config = terrarun.config.Config()
+        key = (command_class, command_id)
+        with cls._lock:
+            cls._buffers.setdefault(key, []).append(data)
+            cls._buffer_sizes[key] = cls._buffer_sizes.get(key, 0) + len(data)
+            should_flush = (
+                config.AGENT_LOG_FLUSH_INTERVAL <= 0 or
+                cls._buffer_sizes[key] >= config.AGENT_LOG_FLUSH_MAX_BYTES
+            )
+            if not should_flush:
+                cls._ensure_flush_thread()
+
+        if should_flush:
+            cls.flush(command_class=command_class, command_id=command_id)
+
+    @classmethod
+    def _get_flush_lock(cls, key: Tuple[Type, int]) -> threading.Lock:
+        """Return flush lock for plan/apply"""
+        return cls._flush_locks[cls._get_flush_lock_index(key)]
+
+    @classmethod
+    def _get_flush_lock_index(cls, key: Tuple[Type, int]) -> int:
+        """Return index of flush lock for plan/apply"""
+        return hash(key) % len(cls._flush_locks)
+
+    @classmethod
+    def replace(cls, command_class: Type['terrarun.terraform_command.TerraformCommand'], command_id: int, data: bytes):
+        """Replace log output of plan/apply, discarding any buffered output"""
+        with cls._get_flush_lock((command_class, command_id)):
+            with cls._lock:
+                cls._buffers.pop((command_class, command_id), None)
+                cls._buffer_sizes.pop((command_class, command_id), None)
+
+            session = Database.get_session()
+            command = session.query(command_class).filter(command_class.id==command_id).first()
+            if command:
+                command.append_output(data, no_append=True)
+
+    @classmethod
+    def _ensure_flush_thread(cls):
+        """Start background flush thread, if not already running. Must be called with lock held"""
+        if cls._flush_thread is not None:
+            return
+        cls._flush_thread = threading.Thread(target=cls._flush_loop, daemon=True, name="log-ingest-flush")
+        cls._flush_thread.start()
+        # Avoid losing buffered output on shutdown
+        atexit.register(cls.flush)
+
+    @classmethod
+    def _flush_loop(cls):
+        """Periodically flush buffered output"""
+        stop_event = threading.Event()
+        while not stop_event.wait(max(terrarun.config.Config().AGENT_LOG_FLUSH_INTERVAL, 0.1)):
+            try:
+                cls.flush()
+            except Exception as exc:
+                logger.error(f"Failed to flush agent logs: {exc}")
+            finally:
+                Database.get_session().remove()
+
+    @classmethod
+    def flush(cls,
+              command_class: Optional[Type['terrarun.terraform_command.TerraformCommand']]=None,
+              command_id: Optional[int]=None):
+        """
+        Write buffered output to logs.
+
+        If a plan/apply is provided, only output for it is written,
+        otherwise output for all plans/applies is written.
+        """
+        if command_class is None:
+            with cls._lock:
+                keys = list(cls._buffers)
+        else:
+            keys = [(command_class, command_id)]
+        # Acquire locks in a consistent order, avoiding deadlocks between concurrent flushes
+        flush_locks = [cls._flush_locks[index] for index in sorted({cls._get_flush_lock_index(key) for key in keys})]
+        with contextlib.ExitStack() as stack:
+            for flush_lock in flush_locks:
+                stack.enter_context(flush_lock)
+            with cls._lock:
+                buffers = {key: cls._buffers.pop(key) for key in keys if key in cls._buffers}
+                for key in keys:
+                    cls._buffer_sizes.pop(key, None)
+            if not buffers:
+                return
+
+            session = Database.get_session()
+            try:
+                for (buffer_command_class, buffer_command_id), chunks in buffers.items():
+                    # Ensure log is not stale, if flushing within a request
+                    command = session.query(buffer_command_class).filter(
+                        buffer_command_class.id==buffer_command_id
+                    ).populate_existing().first()
+                    if not command:
+                        continue
+                    data = b"".join(chunks)
+                    # Append to existing log in the database, without loading it
+                    if command.log_id is not None and Blob.append_data_by_id(command.log_id, data, session=session):
+                        continue
+                    if command.log is None:
+                        command.log = Blob(data=b"")
+                        session.add(command)
+                    else:
+                        session.refresh(command.log)
+                    command.log.append_data(data)
+                    session.add(command.log)
+                session.commit()
+            except Exception:
+                session.rollback()
+                # Retain output for next flush, ahead of any output received since
+                with cls._lock:
+                    for key, chunks in buffers.items():
+                        cls._buffers[key] = chunks + cls._buffers.get(key, [])
+                        cls._buffer_sizes[key] = sum(len(chunk) for chunk in cls._buffers[key])
+                raise
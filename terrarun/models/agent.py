@@ -8,6 +8,7 @@ import os
 import sqlalchemy
 import sqlalchemy.orm
 
+import terrarun.agent_heartbeat
 import terrarun.config
 import terrarun.database
 from terrarun.database import Base, Database
@@ -42,7 +43,7 @@ class Agent(Base, BaseObject):
     # @TODO
     # Should this be held in the datbase?!
     status: Optional[AgentStatus] = sqlalchemy.Column(sqlalchemy.Enum(AgentStatus), default=None)
-    last_ping_at: datetime = sqlalchemy.Column(sqlalchemy.DateTime, default=sqlalchemy.sql.func.now())
+    last_ping_at: datetime = sqlalchemy.Column(sqlalchemy.DateTime, default=sqlalchemy.sql.func.now(), index=True)
 
     plans = sqlalchemy.orm.relation("Plan", back_populates="agent")
     applies = sqlalchemy.orm.relation("Apply", back_populates="agent")
@@ -89,8 +90,18 @@ class Agent(Base, BaseObject):
 
     def update_status(self, new_status):
         """Update status of agent"""
+        now = datetime.now()
+
+        # Buffer heartbeats that do not change status,
+        # avoiding a write per heartbeat
+        if (new_status == self.status and
+                terrarun.config.Config().AGENT_HEARTBEAT_FLUSH_INTERVAL > 0):
+            terrarun.agent_heartbeat.AgentHeartbeatBuffer.record(self.id, now)
+            return
+
         session = Database.get_session()
         self.status = new_status
-        self.last_ping_at = datetime.now()
+        self.last_ping_at = now
         session.add(self)
         session.commit()
+        terrarun.agent_heartbeat.AgentHeartbeatBuffer.discard(self.id)
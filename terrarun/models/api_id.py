@@ -44,12 +44,20 @@ class ApiId(Base):
         return res.id
 
     @classmethod
-    def get_api_id(cls, obj):
-        """Return api ID for given object"""
+    def get_api_id(cls, obj, session=None):
+        """
+        Return api ID for given object.
+
+        If a session is provided, a newly generated API ID is
+        added to the session without being committed.
+        """
         if not 'ID_PREFIX' in dir(obj) or not obj.ID_PREFIX:
             raise Exception("Object does not have an ID prefix")
 
-        session = Database.get_session()
+        should_commit = False
+        if session is None:
+            session = Database.get_session()
+            should_commit = True
 
         if obj.api_id_obj is None:
             api_id_object = cls(
@@ -58,7 +66,8 @@ class ApiId(Base):
             session.add(api_id_object)
             obj.api_id_obj = api_id_object
             session.add(api_id_object)
-            session.commit()
+            if should_commit:
+                session.commit()
 
         return f"{obj.ID_PREFIX}-{obj.api_id_obj.api_id_suffix}"
 
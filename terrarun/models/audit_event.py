@@ -1,6 +1,7 @@
 # Copyright (C) 2024 Matt Comben - All Rights Reserved
 # SPDX-License-Identifier: GPL-2.0
 
+import datetime
 from enum import Enum
 import sqlalchemy
 import sqlalchemy.orm
@@ -27,12 +28,15 @@ class AuditEvent(Base, BaseObject):
     ID_PREFIX = 'ae'
 
     __tablename__ = 'audit_event'
+    __table_args__ = (
+        sqlalchemy.Index('ix_audit_event_object_type_object_id', 'object_type', 'object_id'),
+    )
 
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
     api_id_fk = sqlalchemy.Column(sqlalchemy.ForeignKey("api_id.id"), nullable=True)
     api_id_obj = sqlalchemy.orm.relationship("ApiId", foreign_keys=[api_id_fk])
 
-    timestamp = sqlalchemy.Column(sqlalchemy.DateTime, default=sqlalchemy.sql.func.now())
+    timestamp = sqlalchemy.Column(sqlalchemy.DateTime, default=sqlalchemy.sql.func.now(), index=True)
 
     organisation_id = sqlalchemy.Column(sqlalchemy.ForeignKey("organisation.id"), nullable=False)
     organisation = sqlalchemy.orm.relationship("Organisation", back_populates="audit_events")
@@ -42,8 +46,8 @@ class AuditEvent(Base, BaseObject):
     object_type = sqlalchemy.Column(terrarun.database.Database.GeneralString)
 
     # Used if a object value has changed
-    old_value = sqlalchemy.Column(sqlalchemy.LargeBinary)
-    new_value = sqlalchemy.Column(sqlalchemy.LargeBinary)
+    old_value = sqlalchemy.Column(terrarun.database.Database.GeneralString)
+    new_value = sqlalchemy.Column(terrarun.database.Database.GeneralString)
 
     event_type = sqlalchemy.Column(sqlalchemy.Enum(AuditEventType))
     event_description = sqlalchemy.Column(terrarun.database.Database.GeneralString)
@@ -51,17 +55,114 @@ class AuditEvent(Base, BaseObject):
     comment = sqlalchemy.Column(terrarun.database.Database.GeneralString)
 
     @classmethod
-    def get_by_object_type_and_object_id(cls, object_type, object_id):
-        """Return audit events for given object"""
+    def get_by_object_type_and_object_id(cls, object_type, object_id, event_type=None):
+        """
+        Return audit events for given object, including archived
+        audit events, optionally filtered by event type
+        """
         session = Database.get_session()
-        return session.query(cls).where(cls.object_type==object_type, cls.object_id==object_id)
+
+        def get_events(event_class):
+            query = session.query(event_class).where(
+                event_class.object_type==object_type,
+                event_class.object_id==object_id
+            )
+            if event_type is not None:
+                query = query.where(event_class.event_type==event_type)
+            return query.order_by(event_class.id).all()
+
+        events = get_events(cls)
+        # All audit events of an object are archived together, and are restored
+        # when the object receives a new audit event, so archived
+        # audit events only exist for objects without audit events
+        if not events:
+            events = get_events(AuditEventArchive)
+        return events
+
+    @classmethod
+    def archive_events(cls, older_than: datetime.datetime, batch_size: int) -> int:
+        """
+        Move audit events of a batch of objects, which have no audit events
+        since the given time, to the archive, returning number of audit events moved.
+
+        All audit events of an object are moved together.
+        """
+        session = Database.get_session()
+        recent_event = sqlalchemy.orm.aliased(cls)
+        objects = session.query(cls.object_type, cls.object_id).filter(
+            cls.timestamp < older_than,
+            ~sqlalchemy.exists().where(
+                recent_event.object_type==cls.object_type,
+                recent_event.object_id==cls.object_id,
+                recent_event.timestamp >= older_than,
+            )
+        ).order_by(cls.id).limit(batch_size).all()
+        if not objects:
+            return 0
+
+        object_ids_by_type = {}
+        for object_type, object_id in objects:
+            object_ids_by_type.setdefault(object_type, set()).add(object_id)
+        event_ids = [
+            event_id
+            for event_id, in session.query(cls.id).filter(
+                sqlalchemy.or_(*[
+                    sqlalchemy.and_(cls.object_type==object_type, cls.object_id.in_(object_ids))
+                    for object_type, object_ids in object_ids_by_type.items()
+                ])
+            )
+        ]
+
+        columns = [column.name for column in AuditEventArchive.__table__.columns]
+        session.execute(
+            AuditEventArchive.__table__.insert().from_select(
+                columns,
+                sqlalchemy.select(*[cls.__table__.c[column] for column in columns]).where(
+                    cls.__table__.c.id.in_(event_ids)
+                )
+            )
+        )
+        session.query(cls).filter(cls.id.in_(event_ids)).delete(synchronize_session=False)
+        session.commit()
+        return len(event_ids)
+
+    @classmethod
+    def restore_archived_events(cls, session, objects) -> int:
+        """
+        Move archived audit events of objects, given as object type and object ID pairs,
+        back to the audit event table, returning number of audit events moved
+        """
+        archive = AuditEventArchive.__table__
+        event_ids = [
+            event_id
+            for event_id, in session.execute(
+                sqlalchemy.select(archive.c.id).where(
+                    sqlalchemy.or_(*[
+                        sqlalchemy.and_(archive.c.object_type==object_type, archive.c.object_id==object_id)
+                        for object_type, object_id in objects
+                    ])
+                )
+            )
+        ]
+        if not event_ids:
+            return 0
+
+        columns = [column.name for column in archive.columns]
+        session.execute(
+            cls.__table__.insert().from_select(
+                columns,
+                sqlalchemy.select(*[archive.c[column] for column in columns]).where(archive.c.id.in_(event_ids))
+            )
+        )
+        session.execute(archive.delete().where(archive.c.id.in_(event_ids)))
+        return len(event_ids)
 
     def get_api_details(self):
         """Return API details for audit event"""
         return {
             "attributes": {
-                "old-value": Database.decode_blob(self.old_value),
-                "new-value": Database.decode_blob(self.new_value),
+                "old-value": self.old_value,
+                "new-value": self.new_value,
                 "type": self.event_type.value,
                 "description": self.event_description,
                 "comment": self.comment,
@@ -79,3 +180,49 @@ class AuditEvent(Base, BaseObject):
             },
             "type": "audit-events"
         }
+
+
+class AuditEventArchive(Base, BaseObject):
+    """Audit events moved from the audit event table, once older than the retention period"""
+
+    ID_PREFIX = 'ae'
+
+    __tablename__ = 'audit_event_archive'
+    __table_args__ = (
+        sqlalchemy.Index('ix_audit_event_archive_object_type_object_id', 'object_type', 'object_id'),
+    )
+
+    # Retains ID of original audit event
+    id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=False)
+    api_id_fk = sqlalchemy.Column(sqlalchemy.ForeignKey("api_id.id"), nullable=True)
+    api_id_obj = sqlalchemy.orm.relationship("ApiId", foreign_keys=[api_id_fk])
+
+    timestamp = sqlalchemy.Column(sqlalchemy.DateTime)
+
+    organisation_id = sqlalchemy.Column(sqlalchemy.ForeignKey("organisation.id"), nullable=False)
+
+    user_id = sqlalchemy.Column(sqlalchemy.Integer)
+    object_id = sqlalchemy.Column(sqlalchemy.Integer)
+    object_type = sqlalchemy.Column(terrarun.database.Database.GeneralString)
+
+    old_value = sqlalchemy.Column(terrarun.database.Database.GeneralString)
+    new_value = sqlalchemy.Column(terrarun.database.Database.GeneralString)
+
+    event_type = sqlalchemy.Column(sqlalchemy.Enum(AuditEventType))
+    event_description = sqlalchemy.Column(terrarun.database.Database.GeneralString)
+
+    comment = sqlalchemy.Column(terrarun.database.Database.GeneralString)
+
+    get_api_details = AuditEvent.get_api_details
+
+
+@sqlalchemy.event.listens_for(sqlalchemy.orm.Session, "before_flush")
+def _restore_archived_audit_events(session, flush_context, instances):
+    """Restore archived audit events of objects receiving new audit events, so that their history remains together"""
+    objects = {
+        (obj.object_type, obj.object_id)
+        for obj in session.new
+        if isinstance(obj, AuditEvent) and obj.object_id is not None
+    }
+    if objects:
+        AuditEvent.restore_archived_events(session, objects)
@@ -38,6 +38,11 @@ class AuthorisedRepo(Base, BaseObject):
 
     http_url = sqlalchemy.Column(terrarun.database.Database.GeneralString, nullable=True)
     webhook_id = sqlalchemy.Column(terrarun.database.Database.GeneralString, nullable=False)
+    # Secret used to sign webhook requests from VCS provider
+    webhook_secret = sqlalchemy.Column(terrarun.database.Database.GeneralString, nullable=True)
+    # Time of last valid webhook request. Once webhooks have been received,
+    # the repo is only polled periodically to reconcile missed events
+    webhook_received_at = sqlalchemy.Column(sqlalchemy.DateTime, nullable=True, default=None)
 
     oauth_token_id = sqlalchemy.Column(sqlalchemy.ForeignKey(
         "oauth_token.id", name="fk_authorised_repo_oauth_token_id_oauth_token_id"),
@@ -69,7 +74,8 @@ class AuthorisedRepo(Base, BaseObject):
             name=name,
             oauth_token=oauth_token,
             http_url=http_url,
-            webhook_id=str(uuid.uuid4())
+            webhook_id=str(uuid.uuid4()),
+            webhook_secret=terrarun.utils.generate_random_secret_string()
         )
         session.add(authorised_repo)
         if should_commit:
@@ -88,6 +94,12 @@ class AuthorisedRepo(Base, BaseObject):
         session = Database.get_session()
         return session.query(cls).filter(cls.oauth_token==oauth_token, cls.external_id==external_id).first()
 
+    @classmethod
+    def get_by_webhook_id(cls, webhook_id):
+        """Get authorised repo by webhook ID"""
+        session = Database.get_session()
+        return session.query(cls).filter(cls.webhook_id==webhook_id).first()
+
     @classmethod
     def get_all_utilised_repos(cls):
         """Get all repos that are used by a workspace or project"""
@@ -99,7 +111,7 @@ class AuthorisedRepo(Base, BaseObject):
     @property
     def vendor_configuration(self):
         """Return vendor configuration"""
-        if self._vendor_configuration and self._vendor_configuration.data:
+        if self._vendor_configuration and self._vendor_configuration.has_data:
             return json.loads(self._vendor_configuration.data.decode('utf-8'))
         return {}
 
@@ -5,6 +5,8 @@ from typing_extensions import Self
 
 from math import pow
 
+import sqlalchemy.orm.attributes
+
 import terrarun.database
 from terrarun.models.api_id import ApiId
 import terrarun.logger
@@ -68,28 +70,61 @@ class BaseObject:
             session.commit()
 
 
-def update_object_status(obj, new_status, current_user=None, session=None):
-    """Update state of run."""
+def transition_status(obj, new_status, session, expected_status) -> bool:
+    """
+    Update status of object, only if the status in the database matches
+    the expected status, using a single conditional UPDATE.
+
+    If the status has been changed by another session, the update is
+    not applied, the status of the object is expired and False is returned.
+    Callers must not perform further transitions after an update is lost.
+    """
+    cls = type(obj)
+    updated = session.query(cls).filter(
+        cls.id==obj.id,
+        cls.status.is_(None) if expected_status is None else cls.status==expected_status
+    ).update({cls.status: new_status}, synchronize_session=False)
+
+    if not updated:
+        logger.warning(
+            "Lost update of %s %s status from %s to %s, as status has been modified",
+            obj.ID_PREFIX, obj.id, expected_status, new_status
+        )
+        session.expire(obj, ["status"])
+        return False
+
+    # Set status without marking the object as modified, as the status has been written
+    sqlalchemy.orm.attributes.set_committed_value(obj, "status", new_status)
+    return True
+
+
+def update_object_status(obj, new_status, current_user=None, session=None, expected_status=None):
+    """
+    Update state of object, returning whether the status was updated.
+
+    The update is only applied if the status matches expected_status,
+    which defaults to the current status of the object.
+    """
     logger.debug("Updating %s to from %s to %s", obj, obj.status, new_status)
     should_commit = False
     if session is None:
         session = terrarun.database.Database.get_session()
-        session.refresh(obj)
         should_commit = True
 
-    audit_event = terrarun.models.audit_event.AuditEvent(
-        organisation=obj.organisation,
-        user_id=current_user.id if current_user else None,
-        object_id=obj.id,
-        object_type=obj.ID_PREFIX,
-        old_value=terrarun.database.Database.encode_value(obj.status.value) if obj.status else None,
-        new_value=terrarun.database.Database.encode_value(new_status.value),
-        event_type=terrarun.models.audit_event.AuditEventType.STATUS_CHANGE)
-
-    obj.update_attributes(status=new_status, session=session)
+    old_status = obj.status if expected_status is None else expected_status
+    updated = transition_status(obj, new_status, session=session, expected_status=old_status)
+    if updated:
+        audit_event = terrarun.models.audit_event.AuditEvent(
+            organisation=obj.organisation,
+            user_id=current_user.id if current_user else None,
+            object_id=obj.id,
+            object_type=obj.ID_PREFIX,
+            old_value=old_status.value if old_status else None,
+            new_value=new_status.value,
+            event_type=terrarun.models.audit_event.AuditEventType.STATUS_CHANGE)
+        session.add(audit_event)
 
-    session.add(obj)
-    session.add(audit_event)
     if should_commit:
         session.commit()
+    return updated
 
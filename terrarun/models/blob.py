@@ -1,11 +1,27 @@
 # Copyright (C) 2024 Matt Comben - All Rights Reserved
 # SPDX-License-Identifier: GPL-2.0
 
+import datetime
+from enum import Enum
+import gzip
+import hashlib
+
 import sqlalchemy
 
+import terrarun.config
 from terrarun.models.base_object import BaseObject
-from terrarun.database import Base
+from terrarun.database import Base, Database
+from terrarun.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class BlobCodec(Enum):
+    """Codec used to encode data stored in blob"""
 
+    NONE = "none"
+    GZIP = "gzip"
 
 
 class Blob(Base, BaseObject):
@@ -13,11 +29,234 @@ class Blob(Base, BaseObject):
 
     ID_PREFIX = 'blob'
 
+    # Data smaller than this is not worth compressing
+    COMPRESSION_MIN_SIZE = 256
+    # Favour write throughput, as logs are re-written frequently
+    GZIP_COMPRESSION_LEVEL = 6
+
     __tablename__ = 'blob'
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
 
     api_id_fk = sqlalchemy.Column(sqlalchemy.ForeignKey("api_id.id"), nullable=True)
     api_id_obj = sqlalchemy.orm.relationship("ApiId", foreign_keys=[api_id_fk])
 
+    # Codec of stored data. NULL indicates a legacy row,
+    # written before compression, which contains raw data.
+    codec = sqlalchemy.Column(sqlalchemy.Enum(BlobCodec), nullable=True, default=None)
+
+    # Set by application, as this is compared against application
+    # time when determining whether an unreferenced blob is orphaned
+    created_at = sqlalchemy.Column(sqlalchemy.DateTime, nullable=True, default=datetime.datetime.now)
+
+    # Size, in bytes, of decoded data.
+    # NULL for legacy rows, where the size is unknown.
+    size = sqlalchemy.Column(sqlalchemy.BigInteger, nullable=True, default=None)
+    # SHA256 hex digest of decoded data.
+    # NULL when unknown, e.g. after data has been appended.
+    checksum = sqlalchemy.Column(sqlalchemy.String(64), nullable=True, default=None)
+
     # Create blob of 200MB
-    data = sqlalchemy.Column(sqlalchemy.LargeBinary(length=((2**20) * 200)))
+    # Data is deferred, so that loading a blob or checking for the presence
+    # of data via the metadata columns does not transfer the payload
+    _data = sqlalchemy.orm.deferred(
+        sqlalchemy.Column("data", sqlalchemy.LargeBinary(length=((2**20) * 200)))
+    )
+
+    @staticmethod
+    def _get_write_codec(data):
+        """Return codec to be used for writing data"""
+        if not data or len(data) < Blob.COMPRESSION_MIN_SIZE:
+            return BlobCodec.NONE
+        try:
+            return BlobCodec(terrarun.config.Config().BLOB_COMPRESSION_CODEC)
+        except ValueError:
+            logger.warning("Unknown BLOB_COMPRESSION_CODEC, storing blob uncompressed")
+            return BlobCodec.NONE
+
+    @staticmethod
+    def _encode(data, codec):
+        """Encode raw data using codec"""
+        if codec is BlobCodec.GZIP:
+            return gzip.compress(data, compresslevel=Blob.GZIP_COMPRESSION_LEVEL, mtime=0)
+        return data
+
+    @staticmethod
+    def _decode(data, codec):
+        """Decode stored data using codec"""
+        if codec is BlobCodec.GZIP:
+            return gzip.decompress(data)
+        return data
+
+    @property
+    def has_data(self):
+        """Return whether blob contains any data, without loading it where possible"""
+        return self.get_data_size() > 0
+
+    def get_data_size(self):
+        """Return size of decoded data, without loading it where possible"""
+        if self.size is not None:
+            return self.size
+        data = self.data
+        return len(data) if data else 0
+
+    @property
+    def data(self):
+        """Return decoded data"""
+        raw_data = self._data
+        if raw_data is None:
+            return None
+        if self.codec in (None, BlobCodec.NONE):
+            return raw_data
+
+        # Cache decoded data against the stored value,
+        # so that repeated reads do not decompress again,
+        # whilst a refresh of the object invalidates it.
+        cache = getattr(self, "_decoded_data_cache", None)
+        if cache is not None and cache[0] is raw_data:
+            return cache[1]
+        decoded = self._decode(raw_data, self.codec)
+        self._decoded_data_cache = (raw_data, decoded)
+        return decoded
+
+    @data.setter
+    def data(self, value):
+        """Encode and store data"""
+        self._decoded_data_cache = None
+        if value is None:
+            self._data = None
+            self.codec = BlobCodec.NONE
+            self.size = 0
+            self.checksum = None
+            return
+
+        value = bytes(value)
+        codec = self._get_write_codec(value)
+        self._data = self._encode(value, codec)
+        self.codec = codec
+        self.size = len(value)
+        self.checksum = hashlib.sha256(value).hexdigest()
+
+    def append_data(self, value):
+        """
+        Append data to blob.
+
+        Gzip members may be concatenated, so compressed
+        data is appended without decoding existing data.
+        Members are combined by recompress_appended_blobs.
+        """
+        if not value:
+            return
+        if self.size is None or self._data is None or self.codec in (None, BlobCodec.NONE):
+            self.data = (self.data or b"") + value
+            return
+
+        self._decoded_data_cache = None
+        self._data = self._data + self._encode(bytes(value), self.codec)
+        self.size = self.size + len(value)
+        # Avoid decoding existing data to re-calculate checksum
+        self.checksum = None
+
+    @classmethod
+    def append_data_by_id(cls, blob_id, value, session):
+        """
+        Append data to blob using a single UPDATE, without loading existing data.
+
+        Only supported for gzip-encoded blobs, as gzip members may be concatenated.
+        Members are combined by recompress_appended_blobs.
+        Returns False if the blob does not support this, in which
+        case the blob must be loaded to append data.
+        """
+        if not value:
+            return True
+
+        value = bytes(value)
+        data_column = cls.__table__.c.data
+        updated = session.query(cls).filter(
+            cls.id==blob_id,
+            cls.codec==BlobCodec.GZIP,
+            cls.size.isnot(None),
+            data_column.isnot(None)
+        ).update({
+            # Cast, as some databases (e.g. SQLite) return text when concatenating
+            data_column: sqlalchemy.cast(
+                data_column.concat(cls._encode(value, BlobCodec.GZIP)),
+                sqlalchemy.LargeBinary
+            ),
+            cls.size: cls.size + len(value),
+            # Avoid decoding existing data to re-calculate checksum
+            cls.checksum: None,
+        }, synchronize_session=False)
+
+        if not updated:
+            return False
+
+        # Ensure blob is re-read, if it has already been loaded
+        if (blob := session.identity_map.get(sqlalchemy.orm.util.identity_key(cls, blob_id))) is not None:
+            session.expire(blob)
+        return True
+
+    @classmethod
+    def recompress_legacy_blobs(cls, limit):
+        """Encode a batch of legacy blobs using the configured codec, returning number processed"""
+        session = Database.get_session()
+        blobs = session.query(cls).options(
+            sqlalchemy.orm.undefer(cls._data)
+        ).filter(
+            cls.codec==None
+        ).order_by(cls.id).limit(limit).all()
+
+        saved_bytes = 0
+        for blob in blobs:
+            raw_data = blob._data
+            blob.data = raw_data
+            if raw_data is not None:
+                saved_bytes += len(raw_data) - len(blob._data)
+            session.add(blob)
+        session.commit()
+
+        if blobs:
+            logger.info("Recompressed %s legacy blobs, saving %s bytes", len(blobs), saved_bytes)
+        return len(blobs)
+
+    @classmethod
+    def recompress_appended_blobs(cls, limit):
+        """
+        Re-encode a batch of gzip blobs, that data has been appended to, as a single gzip member.
+
+        Each append adds a gzip member, which compresses poorly for small log chunks.
+        Appended blobs are identified by their cleared checksum, which is restored.
+        Blobs that are appended to whilst being re-encoded are left to the next batch.
+        Returns number of blobs re-encoded.
+        """
+        session = Database.get_session()
+        blobs = session.query(cls).options(
+            sqlalchemy.orm.undefer(cls._data)
+        ).filter(
+            cls.codec==BlobCodec.GZIP,
+            cls.checksum==None,
+            cls.size.isnot(None),
+            cls._data.isnot(None)
+        ).order_by(cls.id).limit(limit).all()
+
+        recompressed_count = 0
+        saved_bytes = 0
+        for blob in blobs:
+            raw_data = blob._data
+            decoded = cls._decode(raw_data, BlobCodec.GZIP)
+            encoded = cls._encode(decoded, BlobCodec.GZIP)
+            # Only replace data if the blob has not been appended to since being read
+            updated = session.query(cls).filter(
+                cls.id==blob.id,
+                cls.size==len(decoded)
+            ).update({
+                cls.__table__.c.data: encoded,
+                cls.checksum: hashlib.sha256(decoded).hexdigest(),
+            }, synchronize_session=False)
+            if updated:
+                recompressed_count += 1
+                saved_bytes += len(raw_data) - len(encoded)
+        session.commit()
+
+        if recompressed_count:
+            logger.info("Recompressed %s appended blobs, saving %s bytes", recompressed_count, saved_bytes)
+        return recompressed_count
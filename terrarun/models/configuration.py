@@ -3,6 +3,7 @@
 
 import os
 from enum import Enum
+from io import BytesIO
 from typing import Optional
 from tarfile import TarFile
 from tempfile import NamedTemporaryFile, TemporaryDirectory
@@ -13,7 +14,7 @@ from terrarun.api_error import ApiError
 from terrarun.api_request import ApiRequest
 from terrarun.logger import get_logger
 
-from terrarun.models.base_object import BaseObject
+from terrarun.models.base_object import BaseObject, transition_status
 from terrarun.database import Base, Database
 from terrarun.models.blob import Blob
 from terrarun.models.ingress_attribute import IngressAttribute
@@ -25,6 +26,7 @@ import terrarun.presign
 import terrarun.models.user
 import terrarun.models.run_queue
 import terrarun.auth_context
+import terrarun.config
 
 
 logger = get_logger(__name__)
@@ -84,7 +86,7 @@ class ConfigurationVersion(Base, BaseObject):
         return cv
 
     @classmethod
-    def generate_from_vcs(cls, workspace, speculative, commit_ref=None, branch=None, user=None, tag=None):
+    def generate_from_vcs(cls, workspace, speculative, commit_ref=None, branch=None, user=None, tag=None, pull_request_id=None):
         """Create configuration version from VCS"""
         service_provider = workspace.authorised_repo.oauth_token.oauth_client.service_provider_instance
 
@@ -115,36 +117,64 @@ class ConfigurationVersion(Base, BaseObject):
                 branch=branch,
                 creator=user,
                 tag=tag,
-                # @TODO Provide this whislt implementing
-                # PR triggers
-                pull_request_id=None
+                pull_request_id=pull_request_id
             )
 
-        archive_data = service_provider.get_targz_by_commit_ref(
-            authorised_repo=workspace.authorised_repo, commit_ref=commit_ref
+        path_prefix = None
+        if terrarun.config.Config().VCS_ARCHIVE_WORKING_DIRECTORY_ONLY and workspace.working_directory:
+            path_prefix = workspace.working_directory
+
+        archive_fh = service_provider.get_targz_by_commit_ref(
+            authorised_repo=workspace.authorised_repo, commit_ref=commit_ref, path_prefix=path_prefix
         )
-        if archive_data is None:
+        if archive_fh is None:
             return None
 
-        configuration_version = cls.create(
-            workspace=workspace,
-            auto_queue_runs=True,
-            speculative=speculative,
-            ingress_attribute=ingress_attributes
-        )
-        configuration_version.process_upload(archive_data)
+        with archive_fh:
+            configuration_version = cls.create(
+                workspace=workspace,
+                auto_queue_runs=True,
+                speculative=speculative,
+                ingress_attribute=ingress_attributes
+            )
+            configuration_version.process_upload_fileobj(archive_fh)
         return configuration_version
 
     @classmethod
-    def get_configuration_version_by_git_commit_sha(cls, workspace, git_commit_sha):
-        """Return configuration versions by workspace and git commit sha"""
+    def get_configuration_version_by_git_commit_sha(cls, workspace, git_commit_sha, speculative=None):
+        """
+        Return configuration versions by workspace and git commit sha,
+        optionally filtering by whether they are speculative
+        """
         session = Database.get_session()
-        return session.query(cls).join(
+        query = session.query(cls).join(
             IngressAttribute
         ).filter(
             cls.workspace==workspace,
             IngressAttribute.commit_sha==git_commit_sha
-        ).all()
+        )
+        if speculative is not None:
+            query = query.filter(cls.speculative==speculative)
+        return query.all()
+
+    @classmethod
+    def get_workspace_ids_by_git_commit_sha(cls, workspace_ids, git_commit_sha, speculative=None):
+        """
+        Return set of IDs of workspaces, from the given workspace IDs,
+        that have a configuration version for the git commit sha
+        """
+        if not workspace_ids:
+            return set()
+        session = Database.get_session()
+        query = session.query(cls.workspace_id).join(
+            IngressAttribute, cls.ingress_attribute_id==IngressAttribute.id
+        ).filter(
+            cls.workspace_id.in_(workspace_ids),
+            IngressAttribute.commit_sha==git_commit_sha
+        )
+        if speculative is not None:
+            query = query.filter(cls.speculative==speculative)
+        return {workspace_id for workspace_id, in query.distinct()}
 
     @property
     def plan_only(self):
@@ -162,12 +192,11 @@ class ConfigurationVersion(Base, BaseObject):
         self._extract_dir = None
 
     def update_status(self, new_status):
-        """Update state of configuration version."""
+        """Update state of configuration version, returning whether the status was updated."""
         session = Database.get_session()
-        session.refresh(self)
-        self.status = new_status
-        session.add(self)
+        updated = transition_status(self, new_status, session=session, expected_status=self.status)
         session.commit()
+        return updated
 
     def queue(self):
         """Queue."""
@@ -175,15 +204,24 @@ class ConfigurationVersion(Base, BaseObject):
 
     def process_upload(self, data):
         """Handle upload of archive."""
+        self.process_upload_fileobj(BytesIO(data))
+
+    def process_upload_fileobj(self, fileobj):
+        """Handle upload of archive from seekable file object"""
         if self.configuration_blob:
             raise Exception('Configuration version already uploaded')
 
-        # Upload configuration version to s3
-        self.update_to_object_storage(data=data)
-
-        # Create blob for configuration version
+        # Create blob for configuration version before uploading,
+        # as the file object is closed once uploaded.
+        # The archive is held in memory to do so, as the blob is
+        # used to serve the configuration to agents and the worker.
         session = Database.get_session()
-        blob = Blob(data=data)
+        blob = Blob(data=fileobj.read())
+
+        # Stream configuration version to s3
+        fileobj.seek(0)
+        ObjectStorage().upload_fileobj(path=self.storage_key, fileobj=fileobj)
+
         session.refresh(self)
         session.add(blob)
         self.configuration_blob = blob
@@ -218,7 +256,8 @@ class ConfigurationVersion(Base, BaseObject):
                 pass
             os.mkdir(extract_dir)
             tar_file = TarFile.open(tar_gz_file, 'r')
-            tar_file.extractall(extract_dir)
+            # Reject members, such as links, that would be extracted outside of the directory
+            tar_file.extractall(extract_dir, filter='data')
 
             # Create override file for reconfiguring backend
             with open(os.path.join(extract_dir, 'override.tf'), 'w') as override_fh:
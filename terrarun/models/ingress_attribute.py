@@ -93,7 +93,7 @@ class IngressAttribute(Base, BaseObject):
     @property
     def commit_message(self):
         """Return commit message blob"""
-        if self.commit_message_blob and self.commit_message_blob.data:
+        if self.commit_message_blob and self.commit_message_blob.has_data:
             return self.commit_message_blob.data.decode('utf-8')
         return None
 
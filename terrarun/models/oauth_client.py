@@ -2,12 +2,15 @@
 # SPDX-License-Identifier: GPL-2.0
 
 
+import hashlib
+import hmac
+import posixpath
 import secrets
 import tarfile
 import urllib.parse
 import uuid
 from enum import Enum
-from io import BytesIO
+from tempfile import SpooledTemporaryFile
 
 import requests
 import sqlalchemy
@@ -18,10 +21,12 @@ import terrarun.config
 import terrarun.database
 import terrarun.utils
 from terrarun.database import Base, Database
+from terrarun.github_client import GithubApiClient
 from terrarun.logger import get_logger
 from terrarun.models.authorised_repo import AuthorisedRepo
 from terrarun.models.base_object import BaseObject
 from terrarun.models.oauth_token import OauthToken
+from terrarun.vcs_webhook_event import VcsWebhookEvent, VcsWebhookEventType
 
 logger = get_logger(__name__)
 
@@ -78,8 +83,12 @@ class BaseOauthServiceProvider:
         """Get latest commit ref for branch"""
         raise NotImplementedError
 
-    def get_targz_by_commit_ref(self, authorised_repo, commit_ref):
-        """Download commit archive and return as targz data"""
+    def get_targz_by_commit_ref(self, authorised_repo, commit_ref, path_prefix=None):
+        """
+        Download commit archive, returning a file object containing targz data.
+
+        If path_prefix is provided, only files within the directory are included.
+        """
         raise NotImplementedError
 
     def get_tags(self, authorised_repo):
@@ -110,6 +119,14 @@ class BaseOauthServiceProvider:
         """Return HTML URL to profile for user"""
         raise NotImplementedError
 
+    def verify_webhook_signature(self, authorised_repo, headers, body):
+        """Return whether webhook request is signed using the webhook secret of the authorised repo"""
+        raise NotImplementedError
+
+    def parse_webhook_event(self, headers, payload):
+        """Return VcsWebhookEvent for webhook request, or None if the event is not handled"""
+        raise NotImplementedError
+
 
 class OauthServiceGithub(BaseOauthServiceProvider):
     """Oauth service for Github hosted"""
@@ -121,13 +138,8 @@ class OauthServiceGithub(BaseOauthServiceProvider):
 
     def _user_current_username(self, token):
         """Get username for authenticated user"""
-        res = requests.get(
-            f"{self._oauth_client.api_url}/user",
-            headers={
-                "X-GitHub-Api-Version": "2022-11-28",
-                "Authorization": f"Bearer {token}",
-                "Accept": "application/vnd.github+json"
-            }
+        res = GithubApiClient(token=token, metrics_key="authorisation").request(
+            "GET", f"{self._oauth_client.api_url}/user"
         )
 
         if res.status_code != 200:
@@ -155,26 +167,15 @@ class OauthServiceGithub(BaseOauthServiceProvider):
 
         return response_obj, session
 
-    def _make_github_api_request(self, oauth_token, method, endpoint, params=None):
+    def _make_github_api_request(self, oauth_token, method, endpoint, params=None, stream=False):
         """Make Github request"""
-        if params is None:
-            params = {}
-
-        url = f"{self._oauth_client.api_url}{endpoint}"
-        headers = {
-            "X-GitHub-Api-Version": "2022-11-28",
-            "Accept": "application/vnd.github+json",
-            "Authorization": f"Bearer {oauth_token.token}"
-        }
-        logger.debug('Making github request to: %s', url)
-        logger.debug('params: %s', params)
-        logger.debug('headers: %s', headers)
-        res = method(
-            url,
-            headers=headers,
-            params=params
+        client = GithubApiClient(token=oauth_token.token, metrics_key=f"oauth-token-{oauth_token.id}")
+        return client.request(
+            method,
+            f"{self._oauth_client.api_url}{endpoint}",
+            params=params,
+            stream=stream
         )
-        return res
 
     def _get_base_repo_endpoint(self, authorised_repo):
         """Return base endpoint for authorised repo"""
@@ -184,7 +185,7 @@ class OauthServiceGithub(BaseOauthServiceProvider):
         """Get default branch"""
         res = self._make_github_api_request(
             oauth_token=authorised_repo.oauth_token,
-            method=requests.get,
+            method="GET",
             endpoint=self._get_base_repo_endpoint(authorised_repo)
         )
         if res.status_code != 200:
@@ -196,7 +197,7 @@ class OauthServiceGithub(BaseOauthServiceProvider):
         """Get latest commit ref for branch"""
         res = self._make_github_api_request(
             oauth_token=authorised_repo.oauth_token,
-            method=requests.get,
+            method="GET",
             endpoint=f'{self._get_base_repo_endpoint(authorised_repo)}/commits',
             params={
                 "sha": branch,
@@ -215,48 +216,82 @@ class OauthServiceGithub(BaseOauthServiceProvider):
 
         return data[0].get("sha")
 
-    def get_targz_by_commit_ref(self, authorised_repo, commit_ref):
-        """Download commit archive and return as targz data"""
+    def get_targz_by_commit_ref(self, authorised_repo, commit_ref, path_prefix=None):
+        """
+        Download commit archive, returning a file object containing targz data.
+
+        If path_prefix is provided, only files within the directory are included.
+        """
         data_res = self._make_github_api_request(
             oauth_token=authorised_repo.oauth_token,
-            method=requests.get,
-            endpoint=f'{self._get_base_repo_endpoint(authorised_repo=authorised_repo)}/tarball/{commit_ref}'
+            method="GET",
+            endpoint=f'{self._get_base_repo_endpoint(authorised_repo=authorised_repo)}/tarball/{commit_ref}',
+            stream=True
         )
-        if data_res.status_code != 200:
-            logger.error('Failed to get archive. Status code: %s', data_res.status_code)
-            return None
+        with data_res:
+            if data_res.status_code != 200:
+                logger.error('Failed to get archive. Status code: %s', data_res.status_code)
+                return None
 
-        data = self._move_archive_into_root(archive_data=data_res.content)
-        return data
+            # Stream archive, spooling to disk if it exceeds the spool size
+            data_res.raw.decode_content = True
+            archive_fh = SpooledTemporaryFile(max_size=terrarun.config.Config().VCS_ARCHIVE_SPOOL_SIZE)
+            try:
+                self._move_archive_into_root(
+                    source_fh=data_res.raw,
+                    target_fh=archive_fh,
+                    path_prefix=path_prefix
+                )
+            except Exception:
+                archive_fh.close()
+                raise
+
+        archive_fh.seek(0)
+        return archive_fh
 
-    def _move_archive_into_root(self, archive_data):
+    @staticmethod
+    def _is_link_within_archive(path, link_target):
+        """Return whether symlink target, relative to the link path, is within the archive root"""
+        if posixpath.isabs(link_target):
+            return False
+        resolved_target = posixpath.normpath(posixpath.join(posixpath.dirname(path), link_target))
+        return resolved_target != ".." and not resolved_target.startswith("../")
+
+    def _move_archive_into_root(self, source_fh, target_fh, path_prefix=None):
         """
         Github places repo files into sub-directory of archive.
-        Moves contents of sub-directory into the root and
-        generates new archive
+        Moves contents of sub-directory into the root,
+        streaming members into new archive.
+
+        Symlinks pointing outside of the archive root are dropped.
         """
-        original_fh = BytesIO(initial_bytes=archive_data)
-        original_tar = tarfile.open(fileobj=original_fh, mode="r:gz")
-        new_fh = BytesIO(initial_bytes=None)
-        new_tar = tarfile.TarFile.open(fileobj=new_fh, mode="w|gz")
-
-        for member in original_tar.getmembers():
-            f = original_tar.extractfile(member)
-            if f is not None:
-                member.path = '/'.join(member.path.split('/')[1:])
-                new_tar.addfile(member, fileobj=f)
-        original_tar.close()
-        new_tar.close()
-
-        # Seek to beginning and return data from new bytes
-        new_fh.seek(0)
-        return new_fh.read()
+        if path_prefix:
+            path_prefix = path_prefix.strip("/")
+
+        with tarfile.open(fileobj=source_fh, mode="r|gz") as source_tar, \
+                tarfile.open(fileobj=target_fh, mode="w|gz") as target_tar:
+            for member in source_tar:
+                path = '/'.join(member.path.split('/')[1:])
+                if not path:
+                    continue
+                if path_prefix and path != path_prefix and not path.startswith(f"{path_prefix}/"):
+                    continue
+
+                if member.isfile():
+                    member.path = path
+                    target_tar.addfile(member, fileobj=source_tar.extractfile(member))
+                elif member.issym():
+                    if not self._is_link_within_archive(path, member.linkname):
+                        logger.warning('Dropping symlink to outside of archive: %s -> %s', path, member.linkname)
+                        continue
+                    member.path = path
+                    target_tar.addfile(member)
 
     def get_tags(self, authorised_repo):
         """Get dictionary of latest tags to commit ref"""
         res = self._make_github_api_request(
             oauth_token=authorised_repo.oauth_token,
-            method=requests.get,
+            method="GET",
             endpoint=f"{self._get_base_repo_endpoint(authorised_repo)}/tags",
             params={
                 "per_page": 100,
@@ -277,7 +312,7 @@ class OauthServiceGithub(BaseOauthServiceProvider):
         """Get list of changed files between two commits"""
         res = self._make_github_api_request(
             oauth_token=authorised_repo.oauth_token,
-            method=requests.get,
+            method="GET",
             endpoint=f"{self._get_base_repo_endpoint(authorised_repo)}/compare/{base}...{head}",
             params={
                 # Only require 1 commit, as we only care about files
@@ -305,7 +340,7 @@ class OauthServiceGithub(BaseOauthServiceProvider):
         """Return commit user details for given commit"""
         res = self._make_github_api_request(
             oauth_token=authorised_repo.oauth_token,
-            method=requests.get,
+            method="GET",
             endpoint=f'{self._get_base_repo_endpoint(authorised_repo)}/commits/{commit_sha}',
             params={
                 "sha": commit_sha,
@@ -336,7 +371,7 @@ class OauthServiceGithub(BaseOauthServiceProvider):
         while True:
             github_repos_res = self._make_github_api_request(
                 oauth_token=oauth_token,
-                method=requests.get,
+                method="GET",
                 #endpoint=f"/orgs/{oauth_token.service_provider_user}/repos",
                 endpoint="/user/repos",
                 params={
@@ -475,6 +510,59 @@ class OauthServiceGithub(BaseOauthServiceProvider):
         """Return HTML URL to profile for user"""
         return f"{self._oauth_client.http_url}/{username}"
 
+    def verify_webhook_signature(self, authorised_repo, headers, body):
+        """Return whether webhook request is signed using the webhook secret of the authorised repo"""
+        if not authorised_repo.webhook_secret:
+            return False
+        signature = headers.get("X-Hub-Signature-256", "")
+        expected_signature = "sha256=" + hmac.new(
+            authorised_repo.webhook_secret.encode("utf-8"), body, hashlib.sha256
+        ).hexdigest()
+        return hmac.compare_digest(signature, expected_signature)
+
+    def parse_webhook_event(self, headers, payload):
+        """Return VcsWebhookEvent for webhook request, or None if the event is not handled"""
+        event_name = headers.get("X-GitHub-Event")
+        if not payload:
+            return None
+
+        if event_name == "push":
+            # Ignore deletion of branches/tags
+            if payload.get("deleted"):
+                return None
+            ref = payload.get("ref", "")
+            if ref.startswith("refs/heads/"):
+                return VcsWebhookEvent(
+                    event_type=VcsWebhookEventType.PUSH,
+                    commit_sha=payload.get("after"),
+                    branch=ref[len("refs/heads/"):]
+                )
+            elif ref.startswith("refs/tags/"):
+                return VcsWebhookEvent(
+                    event_type=VcsWebhookEventType.TAG,
+                    commit_sha=payload.get("after"),
+                    tag=ref[len("refs/tags/"):]
+                )
+
+        elif event_name == "pull_request":
+            if payload.get("action") not in ["opened", "reopened", "synchronize"]:
+                return None
+            pull_request = payload.get("pull_request", {})
+            head = pull_request.get("head", {})
+            base = pull_request.get("base", {})
+            # Head repository is null if the fork has been deleted
+            head_repo_name = (head.get("repo") or {}).get("full_name")
+            base_repo_name = (base.get("repo") or {}).get("full_name")
+            return VcsWebhookEvent(
+                event_type=VcsWebhookEventType.PULL_REQUEST,
+                commit_sha=head.get("sha"),
+                branch=base.get("ref"),
+                pull_request_id=pull_request.get("number"),
+                from_fork=head_repo_name is None or head_repo_name != base_repo_name
+            )
+
+        return None
+
 
 class ServiceProviderFactory:
 
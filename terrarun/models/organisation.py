@@ -97,6 +97,14 @@ class Organisation(Base, BaseObject):
     send_passing_statuses_for_untriggered_speculative_plans = sqlalchemy.Column(sqlalchemy.Boolean, default=False)
     owners_team_saml_role_id = sqlalchemy.Column(terrarun.database.Database.GeneralString, default=None)
 
+    # Retention policies for stored data. None retains data indefinitely.
+    # Number of finalised state versions to retain per workspace
+    state_version_retention_count: Optional[int] = sqlalchemy.Column(sqlalchemy.Integer, nullable=True, default=None)
+    # Number of days to retain JSON plan output and provider schemas for
+    plan_json_retention_days: Optional[int] = sqlalchemy.Column(sqlalchemy.Integer, nullable=True, default=None)
+    # Number of days to retain plan and apply logs for
+    log_retention_days: Optional[int] = sqlalchemy.Column(sqlalchemy.Integer, nullable=True, default=None)
+
     workspaces = sqlalchemy.orm.relationship("Workspace", back_populates="organisation")
     tags = sqlalchemy.orm.relationship("Tag", back_populates="organisation")
     audit_events = sqlalchemy.orm.relationship("AuditEvent", back_populates="organisation")
@@ -15,6 +15,7 @@ import terrarun.utils
 import terrarun.models.apply
 import terrarun.models.agent
 from terrarun.database import Base, Database
+from terrarun.models.api_id import ApiId
 from terrarun.logger import get_logger
 from terrarun.models.blob import Blob
 import terrarun.workspace_execution_mode
@@ -64,18 +65,27 @@ class Plan(TerraformCommand, Base):
     _resource_destructions = sqlalchemy.Column(sqlalchemy.Integer, default=None, nullable=True, name="resource_destructions")
 
     @classmethod
-    def create(cls, run):
-        """Create plan and return instance."""
+    def create(cls, run, session=None):
+        """
+        Create plan and return instance.
+
+        If a session is provided, the plan is added to the session without being committed.
+        """
         plan = cls(run=run)
-        session = Database.get_session()
+        should_commit = False
+        if session is None:
+            session = Database.get_session()
+            should_commit = True
         session.add(plan)
-        session.commit()
+        session.flush()
 
         # Generate API ID, so that it can't be performed silently on multiple
         # duplicate requests, causing the API ID to be generated twice and
         # different values returned in different responses
-        plan.api_id
-        plan.update_status(TerraformCommandState.PENDING)
+        ApiId.get_api_id(plan, session=session)
+        plan.update_status(TerraformCommandState.PENDING, session=session)
+        if should_commit:
+            session.commit()
         return plan
 
     @property
@@ -96,7 +106,7 @@ class Plan(TerraformCommand, Base):
     @property
     def plan_output(self):
         """Return plan output value"""
-        if self._plan_output and self._plan_output.data:
+        if self._plan_output and self._plan_output.has_data:
             return json.loads(self._plan_output.data.decode('utf-8'))
         return {}
 
@@ -122,7 +132,7 @@ class Plan(TerraformCommand, Base):
     @property
     def providers_schemas(self):
         """Return plan output value"""
-        if self._providers_schemas and self._providers_schemas.data:
+        if self._providers_schemas and self._providers_schemas.has_data:
             return json.loads(self._providers_schemas.data.decode('utf-8'))
         return {}
 
@@ -148,7 +158,7 @@ class Plan(TerraformCommand, Base):
     @property
     def plan_output_binary(self):
         """Return plan output value"""
-        if self._plan_output_binary and self._plan_output_binary.data:
+        if self._plan_output_binary and self._plan_output_binary.has_data:
             return self._plan_output_binary.data
         return {}
 
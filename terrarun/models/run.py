@@ -10,6 +10,7 @@ import sqlalchemy
 import sqlalchemy.orm
 import sqlalchemy.sql
 
+import terrarun.agent_job_waiter
 import terrarun.config
 import terrarun.database
 import terrarun.models.apply
@@ -26,6 +27,7 @@ import terrarun.models.configuration
 import terrarun.models.user
 import terrarun.models.task_stage
 import terrarun.auth_context
+import terrarun.task_dispatcher
 from terrarun.models.workspace_task import WorkspaceTaskEnforcementLevel, WorkspaceTaskStage
 from terrarun.api_request import ApiRequest
 from terrarun.database import Base, Database
@@ -38,7 +40,8 @@ from terrarun.errors import (
 )
 from terrarun.logger import get_logger
 import terrarun.models.audit_event
-from terrarun.models.base_object import BaseObject
+from terrarun.models.api_id import ApiId
+from terrarun.models.base_object import BaseObject, transition_status
 from terrarun.models.run_queue import JobQueueAgentType, JobQueueType, RunQueue
 from terrarun.models.task_stage import TaskStage
 from terrarun.models.workspace_task import (
@@ -62,6 +65,11 @@ class Run(Base, BaseObject):
     ID_PREFIX = 'run'
 
     __tablename__ = 'run'
+
+    # Whether worker jobs are being deferred by the worker, and whether one has been queued
+    _defer_worker_jobs = False
+    _deferred_worker_job = False
+
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
     api_id_fk = sqlalchemy.Column(sqlalchemy.ForeignKey("api_id.id"), nullable=True)
     api_id_obj = sqlalchemy.orm.relationship("ApiId", foreign_keys=[api_id_fk])
@@ -69,6 +77,9 @@ class Run(Base, BaseObject):
     configuration_version_id: int = sqlalchemy.Column(sqlalchemy.ForeignKey("configuration_version.id"), nullable=False)
     configuration_version: 'terrarun.models.configuration.ConfigurationVersion' = sqlalchemy.orm.relationship("ConfigurationVersion", back_populates="runs")
 
+    # Organisation of the run's workspace, stored to avoid loading the workspace for audit events
+    organisation_id: Optional[int] = sqlalchemy.Column(sqlalchemy.ForeignKey("organisation.id", name="fk_run_organisation_id_organisation_id"), nullable=True)
+
     state_versions: List['terrarun.models.state_version.StateVersion'] = sqlalchemy.orm.relationship("StateVersion", back_populates="run")
     plans = sqlalchemy.orm.relationship("Plan", back_populates="run")
 
@@ -154,38 +165,52 @@ class Run(Base, BaseObject):
         if can_create_run is not True:
             raise can_create_run
 
-        run = Run(
-            configuration_version=configuration_version,
-            created_by=created_by,
-            message=message,
-            **attributes)
-        session.add(run)
-
-        session.commit()
-        session.refresh(run)
-
-        # Generate API ID, so that it can't be performed silently on multiple
-        # duplicate requests, causing the API ID to be generated twice and
-        # different values returned in different responses
-        run.api_id
-        run.update_status(terrarun.models.run_flow.RunStatus.PENDING, current_user=created_by)
-
-        # Create all task stages
-        TaskStage.create(
-            run=run,
-            stage=WorkspaceTaskStage.PRE_PLAN,
-            workspace_tasks=run.pre_plan_workspace_tasks)
-        TaskStage.create(
-            run=run,
-            stage=WorkspaceTaskStage.POST_PLAN,
-            workspace_tasks=run.post_plan_workspace_tasks)
-        TaskStage.create(
-            run=run,
-            stage=WorkspaceTaskStage.PRE_APPLY,
-            workspace_tasks=run.pre_apply_workspace_tasks)
-
-        # Queue to be processed
-        run.queue_worker_job()
+        # Create run and all related objects in a single transaction,
+        # discarding partially created objects on failure, so that they
+        # are not committed by a subsequent commit of the session
+        try:
+            run = Run(
+                configuration_version=configuration_version,
+                organisation_id=configuration_version.workspace.organisation_id,
+                created_by=created_by,
+                message=message,
+                **attributes)
+            session.add(run)
+            session.flush()
+
+            # Generate API ID, so that it can't be performed silently on multiple
+            # duplicate requests, causing the API ID to be generated twice and
+            # different values returned in different responses
+            ApiId.get_api_id(run, session=session)
+            run.update_status(terrarun.models.run_flow.RunStatus.PENDING, current_user=created_by, session=session)
+
+            # Create plan, as the terraform client expects this
+            # to immediately exist
+            terrarun.models.plan.Plan.create(run=run, session=session)
+
+            # Create all task stages
+            TaskStage.create(
+                run=run,
+                stage=WorkspaceTaskStage.PRE_PLAN,
+                workspace_tasks=run.pre_plan_workspace_tasks,
+                session=session)
+            TaskStage.create(
+                run=run,
+                stage=WorkspaceTaskStage.POST_PLAN,
+                workspace_tasks=run.post_plan_workspace_tasks,
+                session=session)
+            TaskStage.create(
+                run=run,
+                stage=WorkspaceTaskStage.PRE_APPLY,
+                workspace_tasks=run.pre_apply_workspace_tasks,
+                session=session)
+
+            # Queue to be processed
+            run.queue_worker_job(session=session)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
         return run
 
     def cancel(self, user):
@@ -243,18 +268,20 @@ class Run(Base, BaseObject):
             self.queue_worker_job()
             return
 
-        # Create plan, as the terraform client expects this
-        # to immediately exist
-        terrarun.models.plan.Plan.create(run=self)
-        self.update_status(terrarun.models.run_flow.RunStatus.PRE_PLAN_RUNNING)
+        # Create plan for runs created before plans were created with the run
+        if self.plan is None:
+            terrarun.models.plan.Plan.create(run=self)
+        if not self.update_status(
+                terrarun.models.run_flow.RunStatus.PRE_PLAN_RUNNING,
+                expected_status=terrarun.models.run_flow.RunStatus.PENDING):
+            return
 
         # Handle pre-run tasks.
         if self.pre_plan_workspace_tasks:
             task_stage = [task_stage for task_stage in self.task_stages if task_stage.stage is WorkspaceTaskStage.PRE_PLAN][0]
 
-            # Iterate over task results and execute
-            for task_result in task_stage.task_results:
-                task_result.execute()
+            # Dispatch calls to remote task URLs
+            terrarun.task_dispatcher.TaskDispatcher.dispatch(task_stage.task_results)
 
         # Queue plan
         self.queue_worker_job()
@@ -272,21 +299,26 @@ class Run(Base, BaseObject):
             task_stage = task_stages[0]
             should_continue, completed = task_stage.check_status()
 
-        if should_continue:
-            if completed:
-                self.update_status(terrarun.models.run_flow.RunStatus.PRE_PLAN_COMPLETED)
-            self.queue_worker_job()
+        # If tasks are still running, the run is queued again
+        # once task results are updated or time out
+        if should_continue and completed:
+            if self.update_status(
+                    terrarun.models.run_flow.RunStatus.PRE_PLAN_COMPLETED,
+                    expected_status=terrarun.models.run_flow.RunStatus.PRE_PLAN_RUNNING):
+                self.queue_worker_job()
 
     def handle_planned(self):
         """Handle planned state"""
         # If successfully planned, move to pre-plan tasks
-        self.update_status(terrarun.models.run_flow.RunStatus.POST_PLAN_RUNNING)
+        if not self.update_status(
+                terrarun.models.run_flow.RunStatus.POST_PLAN_RUNNING,
+                expected_status=terrarun.models.run_flow.RunStatus.PLANNED):
+            return
         if self.post_plan_workspace_tasks:
             task_stage = [task_stage for task_stage in self.task_stages if task_stage.stage is WorkspaceTaskStage.POST_PLAN][0]
 
-            # Iterate over task results and execute
-            for task_result in task_stage.task_results:
-                task_result.execute()
+            # Dispatch calls to remote task URLs
+            terrarun.task_dispatcher.TaskDispatcher.dispatch(task_stage.task_results)
 
         self.queue_worker_job()
 
@@ -303,33 +335,38 @@ class Run(Base, BaseObject):
             task_stage = task_stages[0]
             should_continue, completed = task_stage.check_status()
 
-        if should_continue:
-            if completed:
-                self.update_status(terrarun.models.run_flow.RunStatus.POST_PLAN_COMPLETED)
-            self.queue_worker_job()
+        # If tasks are still running, the run is queued again
+        # once task results are updated or time out
+        if should_continue and completed:
+            if self.update_status(
+                    terrarun.models.run_flow.RunStatus.POST_PLAN_COMPLETED,
+                    expected_status=terrarun.models.run_flow.RunStatus.POST_PLAN_RUNNING):
+                self.queue_worker_job()
 
     def handle_post_plan_completed(self):
         """Handle post plan completed, waiting for run to be confirmed"""
         # Check if plan was confirmed before entering the state
         if self.auto_apply or self.confirmed:
-            self.update_status(
-                terrarun.models.run_flow.RunStatus.CONFIRMED,
-                current_user=self.confirmed_by
-            )
-            self.queue_worker_job()
+            if self.update_status(
+                    terrarun.models.run_flow.RunStatus.CONFIRMED,
+                    current_user=self.confirmed_by,
+                    expected_status=terrarun.models.run_flow.RunStatus.POST_PLAN_COMPLETED):
+                self.queue_worker_job()
 
     def handle_confirmed(self):
         """Handle confirmed state"""
+        if not self.update_status(
+                terrarun.models.run_flow.RunStatus.PRE_APPLY_RUNNING,
+                expected_status=terrarun.models.run_flow.RunStatus.CONFIRMED):
+            return
+
         # Handle pre-apply tasks.
         if self.pre_apply_workspace_tasks:
             task_stage = [task_stage for task_stage in self.task_stages if task_stage.stage is WorkspaceTaskStage.PRE_APPLY][0]
 
-            # Iterate over task results and execute
-            for task_result in task_stage.task_results:
-                task_result.execute()
-
+            # Dispatch calls to remote task URLs
+            terrarun.task_dispatcher.TaskDispatcher.dispatch(task_stage.task_results)
 
-        self.update_status(terrarun.models.run_flow.RunStatus.PRE_APPLY_RUNNING)
         self.queue_worker_job()
 
     def handle_pre_apply_running(self):
@@ -345,41 +382,59 @@ class Run(Base, BaseObject):
             task_stage = task_stages[0]
             should_continue, completed = task_stage.check_status()
 
-        if should_continue:
-            if completed:
-                self.update_status(terrarun.models.run_flow.RunStatus.PRE_APPLY_COMPLETED)
-                self.update_status(terrarun.models.run_flow.RunStatus.APPLY_QUEUED)
-                self.queue_agent_job(job_type=JobQueueType.APPLY)
-            else:
-                self.queue_worker_job()
-
-    def update_status(self, new_status, current_user=None, session=None):
-        """Update state of run."""
+        # If tasks are still running, the run is queued again
+        # once task results are updated or time out
+        if should_continue and completed:
+            if not self.update_status(
+                    terrarun.models.run_flow.RunStatus.PRE_APPLY_COMPLETED,
+                    expected_status=terrarun.models.run_flow.RunStatus.PRE_APPLY_RUNNING):
+                return
+            if not self.update_status(
+                    terrarun.models.run_flow.RunStatus.APPLY_QUEUED,
+                    expected_status=terrarun.models.run_flow.RunStatus.PRE_APPLY_COMPLETED):
+                return
+            self.queue_agent_job(job_type=JobQueueType.APPLY)
+
+    def update_status(self, new_status, current_user=None, session=None, expected_status=None):
+        """
+        Update state of run, returning whether the status was updated.
+
+        The update is only applied if the status matches expected_status,
+        which defaults to the current status of the run.
+        """
         if self.status is terrarun.models.run_flow.RunStatus.CANCELED:
             logger.warning("Ignoring run status update to %s as status is CANCELLED", new_status)
+            return False
 
         logger.info("Updating job status to from %s to %s", self.status, new_status)
         should_commit = False
         if session is None:
             session = Database.get_session()
-            session.refresh(self)
             should_commit = True
 
-        audit_event = terrarun.models.audit_event.AuditEvent(
-            organisation=self.configuration_version.workspace.organisation,
-            user_id=current_user.id if current_user else None,
-            object_id=self.id,
-            object_type=self.ID_PREFIX,
-            old_value=Database.encode_value(self.status.value) if self.status else None,
-            new_value=Database.encode_value(new_status.value),
-            event_type=terrarun.models.audit_event.AuditEventType.STATUS_CHANGE)
+        old_status = self.status if expected_status is None else expected_status
+        updated = transition_status(self, new_status, session=session, expected_status=old_status)
+        if updated:
+            audit_event = terrarun.models.audit_event.AuditEvent(
+                organisation_id=self.get_organisation_id(),
+                user_id=current_user.id if current_user else None,
+                object_id=self.id,
+                object_type=self.ID_PREFIX,
+                old_value=old_status.value if old_status else None,
+                new_value=new_status.value,
+                event_type=terrarun.models.audit_event.AuditEventType.STATUS_CHANGE)
+            session.add(audit_event)
 
-        self.status = new_status
-
-        session.add(self)
-        session.add(audit_event)
         if should_commit:
             session.commit()
+        return updated
+
+    def get_organisation_id(self):
+        """Return organisation ID, without loading the workspace where possible"""
+        if self.organisation_id is None:
+            # Runs created before organisation ID was stored against the run
+            return self.configuration_version.workspace.organisation_id
+        return self.organisation_id
 
     def unlock_workspace(self):
         """Unlock workspace after run completes/errors"""
@@ -388,8 +443,14 @@ class Run(Base, BaseObject):
 
     def queue_plan(self):
         """Queue for plan"""
-        self.update_status(terrarun.models.run_flow.RunStatus.QUEUING)
-        self.update_status(terrarun.models.run_flow.RunStatus.PLAN_QUEUED)
+        if not self.update_status(
+                terrarun.models.run_flow.RunStatus.QUEUING,
+                expected_status=terrarun.models.run_flow.RunStatus.PRE_PLAN_COMPLETED):
+            return
+        if not self.update_status(
+                terrarun.models.run_flow.RunStatus.PLAN_QUEUED,
+                expected_status=terrarun.models.run_flow.RunStatus.QUEUING):
+            return
 
         # Requeue to be applied
         self.queue_agent_job(job_type=JobQueueType.PLAN)
@@ -410,17 +471,55 @@ class Run(Base, BaseObject):
     def queue_agent_job(self, job_type):
         """Queue a run to be executed."""
         self._queue_job(agent_type=JobQueueAgentType.AGENT, job_type=job_type)
+        # Wake any agent job requests, long-polling in this process
+        terrarun.agent_job_waiter.AgentJobWaiter.notify(
+            self.configuration_version.workspace.effective_agent_pool_id
+        )
+
+    def defer_worker_jobs(self):
+        """
+        Record worker jobs queued for the run, rather than queueing them,
+        so that the worker can handle the run again without requeueing it
+        """
+        self._defer_worker_jobs = True
+        self._deferred_worker_job = False
+
+    def pop_deferred_worker_job(self):
+        """Stop deferring worker jobs, returning whether a worker job was deferred"""
+        deferred_worker_job = self._deferred_worker_job
+        self._defer_worker_jobs = False
+        self._deferred_worker_job = False
+        return deferred_worker_job
+
+    def queue_worker_job(self, skip_if_queued=False, session=None):
+        """
+        Queue a run to be executed.
+
+        If skip_if_queued is set, the run is not queued if
+        it is already queued for the worker.
+        If a session is provided, the job is added to the session without being committed.
+        """
+        if self._defer_worker_jobs:
+            self._deferred_worker_job = True
+            return
 
-    def queue_worker_job(self):
-        """Queue a run to be executed."""
-        self._queue_job(agent_type=JobQueueAgentType.WORKER, job_type=None)
+        if skip_if_queued:
+            if (session or Database.get_session()).query(RunQueue.id).filter(
+                    RunQueue.run_id==self.id,
+                    RunQueue.agent_type==JobQueueAgentType.WORKER).first():
+                return
+        self._queue_job(agent_type=JobQueueAgentType.WORKER, job_type=None, session=session)
 
-    def _queue_job(self, agent_type, job_type):
+    def _queue_job(self, agent_type, job_type, session=None):
         """Queue a run to be executed"""
-        session = Database.get_session()
+        should_commit = False
+        if session is None:
+            session = Database.get_session()
+            should_commit = True
         run_queue = RunQueue(run_id=self.id, agent_type=agent_type, job_type=job_type)
         session.add(run_queue)
-        session.commit()
+        if should_commit:
+            session.commit()
 
     @property
     def plan(self) -> Optional['terrarun.models.plan.Plan']:
@@ -437,7 +536,6 @@ class Run(Base, BaseObject):
     def get_api_details(self, auth_context: 'terrarun.auth_context.AuthContext', api_request: ApiRequest | None = None):
         """Return API details."""
         # Get status change audit events
-        session = Database.get_session()
         audit_events_types = {
             "pending-at": terrarun.models.run_flow.RunStatus.PENDING,
             "applied-at": terrarun.models.run_flow.RunStatus.APPLIED,
@@ -454,11 +552,11 @@ class Run(Base, BaseObject):
             "cost-estimating-at": terrarun.models.run_flow.RunStatus.COST_ESTIMATING
         }
         all_audit_events = {
-            terrarun.models.run_flow.RunStatus(Database.decode_blob(event.new_value)): terrarun.utils.datetime_to_json(event.timestamp)
-            for event in session.query(terrarun.models.audit_event.AuditEvent).where(
-                terrarun.models.audit_event.AuditEvent.object_id==self.id,
-                terrarun.models.audit_event.AuditEvent.object_type==self.ID_PREFIX,
-                terrarun.models.audit_event.AuditEvent.event_type==terrarun.models.audit_event.AuditEventType.STATUS_CHANGE)
+            terrarun.models.run_flow.RunStatus(event.new_value): terrarun.utils.datetime_to_json(event.timestamp)
+            for event in terrarun.models.audit_event.AuditEvent.get_by_object_type_and_object_id(
+                object_type=self.ID_PREFIX,
+                object_id=self.id,
+                event_type=terrarun.models.audit_event.AuditEventType.STATUS_CHANGE)
         }
         audit_events = {
             label: all_audit_events[enum_val]
@@ -44,7 +44,7 @@ class RunQueue(Base, BaseObject):
     agent_type: JobQueueAgentType = sqlalchemy.Column(sqlalchemy.Enum(JobQueueAgentType))
     job_type: JobQueueType = sqlalchemy.Column(sqlalchemy.Enum(JobQueueType))
 
-    agent_id: Optional[int] = sqlalchemy.Column(sqlalchemy.ForeignKey("agent.id"), nullable=True)
+    agent_id: Optional[int] = sqlalchemy.Column(sqlalchemy.ForeignKey("agent.id"), nullable=True, index=True)
     agent: Optional['terrarun.models.agent.Agent'] = sqlalchemy.orm.relationship("Agent")
 
     user_token: Optional['terrarun.models.user_token.UserToken'] = sqlalchemy.orm.relationship("UserToken", uselist=False)
@@ -1,10 +1,13 @@
 # Copyright (C) 2024 Matt Comben - All Rights Reserved
 # SPDX-License-Identifier: GPL-2.0
 
+from collections import OrderedDict
 from enum import Enum
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from typing_extensions import Self
+import hashlib
 import json
+import threading
 
 import sqlalchemy
 import sqlalchemy.orm
@@ -39,6 +42,13 @@ class StateVersion(Base, BaseObject):
 
     ID_PREFIX = 'sv'
 
+    # In-process cache of rendered outputs documents, keyed by state version ID.
+    # Documents are only cached once resources have been processed, after which
+    # the outputs of a state version do not change.
+    OUTPUTS_DOCUMENT_CACHE_SIZE = 256
+    _OUTPUTS_DOCUMENT_CACHE: 'OrderedDict[int, Tuple[bytes, str]]' = OrderedDict()
+    _OUTPUTS_DOCUMENT_CACHE_LOCK = threading.Lock()
+
     __tablename__ = 'state_version'
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
     api_id_fk = sqlalchemy.Column(sqlalchemy.ForeignKey("api_id.id"), nullable=True)
@@ -67,6 +77,12 @@ class StateVersion(Base, BaseObject):
     json_state_outputs_id = sqlalchemy.Column(sqlalchemy.ForeignKey("blob.id", name="fk_blob_state_version_json_state_outputs"), nullable=True)
     _json_state_outputs = sqlalchemy.orm.relationship("Blob", foreign_keys=[json_state_outputs_id])
 
+    # Pre-rendered API response for workspace outputs, generated once resources
+    # have been processed. Sensitive values are never stored in this document.
+    outputs_document_id = sqlalchemy.Column(sqlalchemy.ForeignKey("blob.id", name="fk_blob_state_version_outputs_document"), nullable=True)
+    _outputs_document = sqlalchemy.orm.relationship("Blob", foreign_keys=[outputs_document_id])
+    outputs_document_etag: Optional[str] = sqlalchemy.Column(Database.GeneralString, nullable=True, default=None)
+
     # Attributes provided by user to verify state
     lineage: Optional[str] = sqlalchemy.Column(terrarun.database.Database.GeneralString, nullable=True, default=None)
     md5: Optional[str] = sqlalchemy.Column(terrarun.database.Database.GeneralString, nullable=True, default=None)
@@ -90,7 +106,7 @@ class StateVersion(Base, BaseObject):
     @property
     def state(self) -> Optional[Dict[str, Any]]:
         """Return state JSON"""
-        if self._state and self._state.data:
+        if self._state and self._state.has_data:
             return json.loads(self._state.data.decode('utf-8'))
         return None
 
@@ -120,7 +136,7 @@ class StateVersion(Base, BaseObject):
     @property
     def json_state(self) -> Optional[Dict[str, Any]]:
         """Return plan output value"""
-        if self._json_state and self._json_state.data:
+        if self._json_state and self._json_state.has_data:
             return json.loads(self._json_state.data.decode('utf-8'))
         return None
 
@@ -150,7 +166,7 @@ class StateVersion(Base, BaseObject):
     @property
     def json_state_outputs(self) -> Optional[Dict[str, Any]]:
         """Return plan output value"""
-        if self._json_state_outputs and self._json_state_outputs.data:
+        if self._json_state_outputs and self._json_state_outputs.has_data:
             return json.loads(self._json_state_outputs.data.decode('utf-8'))
         return None
 
@@ -177,6 +193,67 @@ class StateVersion(Base, BaseObject):
         session.add(self)
         session.commit()
 
+    def _render_outputs_document(self) -> bytes:
+        """Render API response for state version outputs, excluding sensitive values"""
+        return json.dumps({
+            "data": [
+                output.get_api_details(include_sensitive=False)
+                for output in self.state_version_outputs
+            ]
+        }).encode('utf-8')
+
+    @staticmethod
+    def _generate_outputs_document_etag(document: bytes) -> str:
+        """Generate ETag for outputs document"""
+        return hashlib.sha256(document).hexdigest()
+
+    def build_outputs_document(self, session: Optional['sqlalchemy.orm.Session']=None):
+        """Render and store outputs document"""
+        should_commit = False
+        if session is None:
+            session = Database.get_session()
+            should_commit = True
+
+        document = self._render_outputs_document()
+
+        outputs_document_blob = self._outputs_document if self._outputs_document else Blob()
+        outputs_document_blob.data = document
+        session.add(outputs_document_blob)
+
+        self._outputs_document = outputs_document_blob
+        self.outputs_document_etag = self._generate_outputs_document_etag(document)
+        session.add(self)
+        if should_commit:
+            session.commit()
+
+    def get_outputs_document(self) -> Tuple[bytes, str]:
+        """
+        Return rendered outputs document and ETag.
+
+        Documents for processed state versions are served from the in-process
+        cache or the stored document, only rendering outputs for state versions
+        that were processed before documents were generated.
+        """
+        if not self.resources_processed:
+            # Outputs have not yet been created, so render without caching
+            document = self._render_outputs_document()
+            return document, self._generate_outputs_document_etag(document)
+
+        with self._OUTPUTS_DOCUMENT_CACHE_LOCK:
+            if (cached := self._OUTPUTS_DOCUMENT_CACHE.get(self.id)) is not None:
+                self._OUTPUTS_DOCUMENT_CACHE.move_to_end(self.id)
+                return cached
+
+        if self._outputs_document is None or self.outputs_document_etag is None:
+            self.build_outputs_document()
+
+        cached = (self._outputs_document.data, self.outputs_document_etag)
+        with self._OUTPUTS_DOCUMENT_CACHE_LOCK:
+            self._OUTPUTS_DOCUMENT_CACHE[self.id] = cached
+            while len(self._OUTPUTS_DOCUMENT_CACHE) > self.OUTPUTS_DOCUMENT_CACHE_SIZE:
+                self._OUTPUTS_DOCUMENT_CACHE.popitem(last=False)
+        return cached
+
     @classmethod
     def create(cls, run, workspace, created_by, state, json_state, session=None):
         """Create StateVersion from state_json."""
@@ -377,6 +454,10 @@ class StateVersion(Base, BaseObject):
                 terraform_version=state.get("terraform_version"),
         )
 
+        # Render outputs document, so workspace outputs can be served
+        # without loading each output
+        self.build_outputs_document()
+
         # Set resources_processed to True and mark as finalized
         self.update_attributes(
             resources_processed=True,
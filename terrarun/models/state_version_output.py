@@ -58,7 +58,7 @@ class StateVersionOutput(Base, BaseObject):
     @property
     def value(self):
         """Return plan output value"""
-        if self._value and self._value.data:
+        if self._value and self._value.has_data:
             return json.loads(self._value.data.decode('utf-8'))
         return {}
 
@@ -122,6 +122,6 @@ class StateVersionOutput(Base, BaseObject):
                 "detailed-type": json.loads(self.detailed_type)
             },
             "links": {
-                "self": "/api/v2/state-version-outputs/wsout-xFAmCR3VkBGepcee"
+                "self": f"/api/v2/state-version-outputs/{self.api_id}"
             }
         }
@@ -8,13 +8,13 @@ import json
 import uuid
 from enum import Enum
 
-import requests
 import sqlalchemy
 import sqlalchemy.orm
 from ansi2html import Ansi2HTMLConverter
 
 import terrarun.config
 import terrarun.database
+import terrarun.task_dispatcher
 import terrarun.utils
 from terrarun.database import Base, Database
 from terrarun.logger import get_logger
@@ -75,7 +75,7 @@ class TaskResult(Base, BaseObject):
     @property
     def message(self):
         """Return plan output value"""
-        if self._message and self._message.data:
+        if self._message and self._message.has_data:
             return self._message.data
         return {}
 
@@ -105,6 +105,13 @@ class TaskResult(Base, BaseObject):
 
     def execute(self):
         """Execute task"""
+        terrarun.task_dispatcher.TaskDispatcher.dispatch([self])
+
+    def prepare_dispatch(self):
+        """
+        Record dispatch of task, returning URL, payload and headers
+        for request to remote task URL
+        """
         payload = json.dumps(self.generate_payload())
 
         hmac_signature = None
@@ -115,34 +122,32 @@ class TaskResult(Base, BaseObject):
                 hashlib.sha512
             ).hexdigest()
 
+        # Set start time, so that task times out if the remote URL does not respond
+        self.update_attributes(start_time=datetime.datetime.now())
+
         config = terrarun.config.Config()
+        headers = {
+            'Content-Type': 'application/json',
+            'User-Agent': f'TRC/1.0 (+%${config.BASE_URL}; TRC)',
+            'X-TFC-Task-Signature': hmac_signature
+        }
+        return self.workspace_task.task.url, payload, headers
 
-        # Attempt to call external URL
-        for _ in range(config.TASK_CALL_MAX_ATTEMPTS):
-            try:
-                res = requests.post(
-                    self.workspace_task.task.url,
-                    data=payload,
-                    headers={
-                        'Content-Type': 'application/json',
-                        'User-Agent': f'TRC/1.0 (+%${config.BASE_URL}; TRC)',
-                        'X-TFC-Task-Signature': hmac_signature
-                    })
-                if res.status_code == 200:
-                    break
-                else:
-                    logger.error("Got invalid response from task result: %s", res.status_code)
-            except requests.exceptions.ConnectionError:
-                logger.exception('Exception occurred whilst calling task result.')
+    def handle_dispatch_result(self, success):
+        """Update status after calling remote task URL"""
+        session = Database.get_session()
+        session.refresh(self)
+        # Do not overwrite status if callback has already been received
+        if self.status is not TaskResultStatus.PENDING:
+            return
+
+        if success:
+            update_object_status(self, TaskResultStatus.RUNNING)
         else:
             # If unable to get 200 response from remote,
-            # mark task result as failed
+            # mark task result as failed and re-evaluate task stage
             update_object_status(self, TaskResultStatus.FAILED)
-            return
-
-        # Update start time of request and mark as running
-        self.update_attributes(start_time=datetime.datetime.now())
-        update_object_status(self, TaskResultStatus.RUNNING)
+            self.task_stage.handle_task_result_update()
 
     def generate_payload(self):
         """Create payload to sent to remote endpoint"""
@@ -222,19 +227,23 @@ class TaskResult(Base, BaseObject):
 
     def handle_callback(self, status, message, url):
         """Handle callback"""
+        status_changed = status is not self.status
         self.update_attributes(url=url)
         update_object_status(self, status)
         self.message = message
 
+        # Re-evaluate task stage, if the task result has changed status
+        if status_changed:
+            self.task_stage.handle_task_result_update()
+
     def get_api_details(self):
         """Return API details for task"""
-        session = Database.get_session()
         audit_events = {
-            '{}-at'.format(Database.decode_blob(event.new_value).replace('_', '-')): terrarun.utils.datetime_to_json(event.timestamp)
-            for event in session.query(AuditEvent).where(
-                AuditEvent.object_id==self.id,
-                AuditEvent.object_type==self.ID_PREFIX,
-                AuditEvent.event_type==AuditEventType.STATUS_CHANGE)
+            '{}-at'.format(event.new_value.replace('_', '-')): terrarun.utils.datetime_to_json(event.timestamp)
+            for event in AuditEvent.get_by_object_type_and_object_id(
+                object_type=self.ID_PREFIX,
+                object_id=self.id,
+                event_type=AuditEventType.STATUS_CHANGE)
         }
         return {
             "id": self.api_id,
@@ -8,6 +8,7 @@ from typing import List
 import sqlalchemy
 import sqlalchemy.orm
 
+import terrarun.config
 import terrarun.models.run
 import terrarun.models.run_flow
 import terrarun.terraform_command
@@ -56,10 +57,18 @@ class TaskStage(Base, BaseObject):
     task_results: List['terrarun.models.task_result.TaskResult'] = sqlalchemy.orm.relationship("TaskResult", back_populates="task_stage")
 
     @classmethod
-    def create(cls, run, stage, workspace_tasks):
-        """Create task stage and task result objects"""
+    def create(cls, run, stage, workspace_tasks, session=None):
+        """
+        Create task stage and task result objects.
+
+        If a session is provided, the objects are added to the session without being committed.
+        """
+        should_commit = False
+        if session is None:
+            session = Database.get_session()
+            should_commit = True
+
         # Create task stage
-        session = Database.get_session()
         task_stage = cls(run=run, stage=stage, status=TaskStageStatus.PENDING)
         session.add(task_stage)
 
@@ -67,7 +76,8 @@ class TaskStage(Base, BaseObject):
         for workspace_task in workspace_tasks:
             task_result = TaskResult(workspace_task=workspace_task, task_stage=task_stage, status=TaskResultStatus.PENDING)
             session.add(task_result)
-        session.commit()
+        if should_commit:
+            session.commit()
 
         return task_stage
 
@@ -76,6 +86,45 @@ class TaskStage(Base, BaseObject):
         """Return organisation."""
         return self.run.configuration_version.workspace.organisation
 
+    @property
+    def running_run_status(self):
+        """Return run status whilst run is waiting on task stage"""
+        return {
+            WorkspaceTaskStage.PRE_PLAN: terrarun.models.run_flow.RunStatus.PRE_PLAN_RUNNING,
+            WorkspaceTaskStage.POST_PLAN: terrarun.models.run_flow.RunStatus.POST_PLAN_RUNNING,
+            WorkspaceTaskStage.PRE_APPLY: terrarun.models.run_flow.RunStatus.PRE_APPLY_RUNNING,
+        }.get(self.stage)
+
+    def handle_task_result_update(self):
+        """Queue run to check status of task stage, if the run is waiting on the task stage"""
+        session = Database.get_session()
+        session.refresh(self.run)
+        if self.run.status is self.running_run_status:
+            self.run.queue_worker_job(skip_if_queued=True)
+
+    @classmethod
+    def handle_timed_out_task_results(cls):
+        """Queue runs waiting on task stages with timed out task results, to mark them as errored"""
+        session = Database.get_session()
+        timeout_cutoff = datetime.datetime.now() - datetime.timedelta(
+            seconds=terrarun.config.Config().TASK_RESULT_TIMEOUT
+        )
+        task_stages = session.query(cls).join(
+            TaskResult, TaskResult.task_stage_id==cls.id
+        ).join(
+            terrarun.models.run.Run, terrarun.models.run.Run.id==cls.run_id
+        ).filter(
+            TaskResult.status.in_([TaskResultStatus.PENDING, TaskResultStatus.RUNNING]),
+            TaskResult.start_time < timeout_cutoff,
+            terrarun.models.run.Run.status.in_([
+                terrarun.models.run_flow.RunStatus.PRE_PLAN_RUNNING,
+                terrarun.models.run_flow.RunStatus.POST_PLAN_RUNNING,
+                terrarun.models.run_flow.RunStatus.PRE_APPLY_RUNNING,
+            ])
+        ).distinct().all()
+        for task_stage in task_stages:
+            task_stage.handle_task_result_update()
+
     def check_status(self):
         """Check status of tasks and update statuses accordingly"""
         # Iterate through each task stage result
@@ -114,7 +163,7 @@ class TaskStage(Base, BaseObject):
             # If task is still running, check if time has elapsed
             elif task_result.status in [TaskResultStatus.PENDING, TaskResultStatus.RUNNING]:
                 if (task_result.start_time and
-                        (task_result.start_time + datetime.timedelta(minutes=10)) <
+                        (task_result.start_time + datetime.timedelta(seconds=terrarun.config.Config().TASK_RESULT_TIMEOUT)) <
                         datetime.datetime.now()):
                     # Update task result status to errored
                     update_object_status(task_result, TaskResultStatus.ERRORED)
@@ -1,14 +1,21 @@
 # Copyright (C) 2024 Matt Comben - All Rights Reserved
 # SPDX-License-Identifier: GPL-2.0
 
+import datetime
+import hashlib
+import json
 import re
+import threading
+import time
 from enum import Enum
+from typing import Dict, Optional, Tuple
 
 import requests
 import semantic_version
 import sqlalchemy
 import sqlalchemy.orm
 
+import terrarun.config
 import terrarun.database
 import terrarun.models.configuration
 import terrarun.models.organisation
@@ -17,6 +24,7 @@ import terrarun.utils
 from terrarun.database import Base, Database
 from terrarun.errors import (
     InvalidVersionNumberError,
+    ToolArchiveChecksumMismatchError,
     ToolChecksumUrlPlaceholderError,
     ToolUrlPlaceholderError,
     ToolVersionAlreadyExistsError,
@@ -25,6 +33,7 @@ from terrarun.errors import (
 )
 from terrarun.logger import get_logger
 from terrarun.models.base_object import BaseObject
+from terrarun.models.blob import Blob
 from terrarun.object_storage import ObjectStorage
 
 logger = get_logger(__name__)
@@ -37,6 +46,34 @@ class ToolType(Enum):
 ToolType.TERRAFORM_VERSION.display_name = "terraform"
 
 
+class ToolMirrorStatus(Enum):
+    """Status of mirroring tool archive into object storage"""
+
+    PENDING = "pending"
+    MIRRORING = "mirroring"
+    MIRRORED = "mirrored"
+    ERRORED = "errored"
+
+
+class _ChecksumReader:
+    """File-like wrapper, calculating SHA256 of data as it is read"""
+
+    def __init__(self, fileobj):
+        """Store member variables"""
+        self._fileobj = fileobj
+        self._hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        """Read from underlying file, updating checksum"""
+        data = self._fileobj.read(size)
+        self._hash.update(data)
+        return data
+
+    def hexdigest(self):
+        """Return checksum of data read"""
+        return self._hash.hexdigest()
+
+
 class Tool(Base, BaseObject):
 
     ZIP_FORMAT = "terraform_{version}_{platform}_{arch}.zip"
@@ -46,6 +83,15 @@ class Tool(Base, BaseObject):
     S3_KEY_CHECKSUM = "tools/{type}/{api_id}/terraform_{version}_SHA256SUMS"
     CHECKSUM_FILE_RE = re.compile(r"^([a-z0-9]+)\s+(.*)")
 
+    # Expiry of pre-signed archive URLs, which are re-used by
+    # jobs until the re-use margin before they expire
+    PRESIGNED_URL_EXPIRY = 300
+    PRESIGNED_URL_REUSE_MARGIN = 60
+    # Timeout, in seconds, for connecting to and reading from upstream
+    DOWNLOAD_TIMEOUT = 60
+    _PRESIGNED_URL_CACHE: Dict[str, Tuple[str, float]] = {}
+    _PRESIGNED_URL_CACHE_LOCK = threading.Lock()
+
     ID_PREFIX = 'tool'
 
     __tablename__ = 'tool'
@@ -75,6 +121,22 @@ class Tool(Base, BaseObject):
     created_at = sqlalchemy.Column(
         sqlalchemy.DateTime, default=sqlalchemy.sql.func.now())
 
+    # Status of mirroring archive into object storage.
+    # NULL for tools created before mirroring was introduced
+    mirror_status = sqlalchemy.Column(
+        sqlalchemy.Enum(ToolMirrorStatus), nullable=True, default=ToolMirrorStatus.PENDING)
+    mirror_error = sqlalchemy.Column(
+        terrarun.database.Database.LargeString, nullable=True, default=None)
+    # Number of consecutive failed mirror attempts and time
+    # after which the next attempt is made, backing off after each failure
+    mirror_attempts = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0, server_default="0")
+    mirror_retry_at = sqlalchemy.Column(sqlalchemy.DateTime, nullable=True, default=None)
+
+    # Checksums, parsed from checksum file, keyed by zip file name
+    checksums_id = sqlalchemy.Column(
+        sqlalchemy.ForeignKey("blob.id", name="fk_tool_checksums_id_blob_id"), nullable=True)
+    _checksums = sqlalchemy.orm.relationship("Blob", foreign_keys=[checksums_id])
+
     # @TODO Implement usage count
     usage = 0
 
@@ -108,16 +170,22 @@ class Tool(Base, BaseObject):
             # Validate custom URL
             self._validate_url(kwargs['custom_url'])
             # Set the objects' custom URL and
-            # attempt a download to ensure that it works
-            self.custom_url = kwargs['custom_url']
-            self.get_presigned_download_url(force_download=True)
+            # re-mirror the archive from the new URL
             update_kwargs['custom_url'] = kwargs['custom_url']
+            update_kwargs['mirror_status'] = ToolMirrorStatus.PENDING
+            update_kwargs['mirror_error'] = None
+            update_kwargs['mirror_attempts'] = 0
+            update_kwargs['mirror_retry_at'] = None
+            self._set_cached_presigned_url(self._get_archive_object_key(), None)
 
         if 'custom_checksum_url' in kwargs:
             self._validate_checksum_url(kwargs['custom_checksum_url'])
             # Set the objects' custom checksum URL and
             # attempt a download to ensure that it works
             self.custom_checksum_url = kwargs['custom_checksum_url']
+            # Discard previously parsed checksums, so that they
+            # are obtained from the new URL
+            self._checksums = None
 
         if 'sha' in kwargs:
             update_kwargs['sha'] = kwargs['sha']
@@ -200,29 +268,54 @@ class Tool(Base, BaseObject):
         session.add(tool_version)
         session.commit()
 
-        # Attempt to download archive
-        try:
-            tool_version.get_presigned_download_url(force_download=True)
-        except Exception:
-            # If a file fails to be downloaded,
-            # remove from database and raise exception
-            session.delete(tool_version)
-            session.commit()
-            raise
-
-        # Attempt to download checksum
+        # Attempt to download checksum, ensuring the version exists.
+        # The archive is mirrored in the background (see mirror_pending_tools).
         try:
             tool_version.get_checksum(force_download=True)
         except Exception:
             # If a file fails to be downloaded,
             # remove from database and raise exception
-            tool_version.remove_file_archive()
             session.delete(tool_version)
             session.commit()
             raise
 
         return tool_version
 
+    @classmethod
+    def reset_interrupted_mirrors(cls):
+        """Return tools, that were being mirrored when the mirroring process stopped, to pending"""
+        session = Database.get_session()
+        session.query(cls).filter(
+            cls.mirror_status==ToolMirrorStatus.MIRRORING
+        ).update({cls.mirror_status: ToolMirrorStatus.PENDING}, synchronize_session=False)
+        session.commit()
+
+    @classmethod
+    def mirror_pending_tools(cls, limit=5):
+        """Mirror archives of enabled tools that have not yet been mirrored, retrying failed mirrors once due"""
+        session = Database.get_session()
+        tools = session.query(cls).filter(
+            cls.enabled==True,
+            sqlalchemy.or_(
+                cls.mirror_status==None,
+                cls.mirror_status==ToolMirrorStatus.PENDING,
+                sqlalchemy.and_(
+                    cls.mirror_status==ToolMirrorStatus.ERRORED,
+                    sqlalchemy.or_(
+                        cls.mirror_retry_at==None,
+                        cls.mirror_retry_at<=datetime.datetime.now()
+                    )
+                )
+            )
+        ).order_by(cls.id).limit(limit).all()
+        for tool in tools:
+            tool.mirror_archive()
+
+    @property
+    def archive_mirrored(self):
+        """Whether the archive is available in object storage"""
+        return self.mirror_status is ToolMirrorStatus.MIRRORED
+
     @property
     def official(self):
         """Determine if the release is official, based on whether the URL has been overriden"""
@@ -254,6 +347,31 @@ class Tool(Base, BaseObject):
             # format zip file, retaining placeholders for platform and arch
             return self.CHECKSUM_UPSTREAM_URL.format(version=self.version)
 
+    @property
+    def checksums(self) -> Optional[Dict[str, str]]:
+        """Return cached checksums, keyed by zip file name"""
+        if self._checksums and self._checksums.has_data:
+            return json.loads(self._checksums.data.decode('utf-8'))
+        return None
+
+    @checksums.setter
+    def checksums(self, value: Dict[str, str]):
+        """Store checksums"""
+        session = Database.get_session()
+
+        if self._checksums:
+            checksums_blob = self._checksums
+            session.refresh(checksums_blob)
+        else:
+            checksums_blob = Blob()
+
+        checksums_blob.data = bytes(json.dumps(value), 'utf-8')
+
+        session.add(checksums_blob)
+        self._checksums = checksums_blob
+        session.add(self)
+        session.commit()
+
     def delete(self):
         """Delete tool"""
         session = Database.get_session()
@@ -278,48 +396,140 @@ class Tool(Base, BaseObject):
             }
         }
 
-    def get_presigned_download_url(self, force_download=False):
-        """Obtain pre-signed URL for terraform binary"""
-        object_storage = ObjectStorage()
-
-        # Generate keys in s3
+    def _get_archive_object_key(self):
+        """Return object storage key for linux amd64 archive"""
         zip_file = self.ZIP_FORMAT.format(
             version=self.version, platform="linux", arch="amd64")
-        object_key = self.S3_KEY_ZIP.format(
+        return self.S3_KEY_ZIP.format(
             zip_file=zip_file, type=self.tool_type.value, api_id=self.api_id)
 
-        logger.debug(f'Getting pre-signed URL for {zip_file}')
+    @classmethod
+    def _get_cached_presigned_url(cls, object_key: str) -> Optional[str]:
+        """Return cached pre-signed URL, if it is not close to expiry"""
+        with cls._PRESIGNED_URL_CACHE_LOCK:
+            if cached := cls._PRESIGNED_URL_CACHE.get(object_key):
+                url, reuse_until = cached
+                if time.monotonic() < reuse_until:
+                    return url
+                del cls._PRESIGNED_URL_CACHE[object_key]
+        return None
 
-        # Check if file exists in s3
-        # If file does not exist, download and upload to s3
-        if not object_storage.file_exists(object_key) or force_download:
-            download_url = self.url.format(arch="amd64", platform="linux")
+    @classmethod
+    def _set_cached_presigned_url(cls, object_key: str, url: Optional[str]):
+        """Cache pre-signed URL, or remove from cache if URL is None"""
+        with cls._PRESIGNED_URL_CACHE_LOCK:
+            if url is None:
+                cls._PRESIGNED_URL_CACHE.pop(object_key, None)
+            else:
+                cls._PRESIGNED_URL_CACHE[object_key] = (
+                    url,
+                    time.monotonic() + cls.PRESIGNED_URL_EXPIRY - cls.PRESIGNED_URL_REUSE_MARGIN
+                )
 
-            logger.debug(
-                f'Terraform zip does not exist.. downloading: {download_url}')
-            # Get binary
+    def _set_mirror_status(self, status: ToolMirrorStatus, error: Optional[str]=None):
+        """Update mirror status, scheduling a retry of failed mirrors with exponential backoff"""
+        self.mirror_status = status
+        self.mirror_error = error
+        if status is ToolMirrorStatus.ERRORED:
+            config = terrarun.config.Config()
+            self.mirror_attempts = (self.mirror_attempts or 0) + 1
+            retry_delay = min(
+                config.TOOL_MIRROR_RETRY_INTERVAL * 2 ** (self.mirror_attempts - 1),
+                config.TOOL_MIRROR_RETRY_MAX_INTERVAL
+            )
+            self.mirror_retry_at = datetime.datetime.now() + datetime.timedelta(seconds=retry_delay)
+        elif status is ToolMirrorStatus.MIRRORED:
+            self.mirror_attempts = 0
+            self.mirror_retry_at = None
+        session = Database.get_session()
+        session.add(self)
+        session.commit()
+
+    def mirror_archive(self) -> bool:
+        """
+        Stream archive from upstream into object storage, verifying checksum.
+
+        Returns whether the archive was mirrored.
+        """
+        object_key = self._get_archive_object_key()
+        object_storage = ObjectStorage()
+
+        # Tools created before mirroring was introduced
+        # may already have an archive in object storage
+        if self.mirror_status is None and object_storage.file_exists(object_key):
+            self._set_mirror_status(ToolMirrorStatus.MIRRORED)
+            return True
+
+        self._set_mirror_status(ToolMirrorStatus.MIRRORING)
+        self._set_cached_presigned_url(object_key, None)
+        try:
+            expected_checksum = self.get_checksum()
+
+            download_url = self.url.format(arch="amd64", platform="linux")
+            logger.info(f'Mirroring tool archive: {download_url}')
             try:
                 res = requests.get(
                     download_url,
                     headers={
                         "User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/112.0"
-                    }
+                    },
+                    stream=True,
+                    timeout=self.DOWNLOAD_TIMEOUT
                 )
-            except:
+            except requests.RequestException:
                 raise UnableToDownloadToolArchiveError(
                     "An error occured whilst downloading Terraform zip")
-            if res.status_code != 200:
-                raise UnableToDownloadToolArchiveError(
-                    "Non-200 response whilst downloading Terraform zip")
 
-            logger.debug('Downloaded.. uploading to s3')
-            object_storage.upload_file(path=object_key, content=res.content)
-            logger.debug('Uploaded to s3')
+            with res:
+                if res.status_code != 200:
+                    raise UnableToDownloadToolArchiveError(
+                        "Non-200 response whilst downloading Terraform zip")
+
+                # Stream response into object storage, calculating checksum
+                res.raw.decode_content = True
+                reader = _ChecksumReader(res.raw)
+                object_storage.upload_fileobj(path=object_key, fileobj=reader)
+
+            if expected_checksum and reader.hexdigest() != expected_checksum:
+                object_storage.delete_file(object_key)
+                raise ToolArchiveChecksumMismatchError(
+                    f"Checksum of Terraform zip ({reader.hexdigest()}) does not match expected checksum ({expected_checksum})")
+
+        except Exception as exc:
+            logger.error(f'Failed to mirror tool {self.version}: {exc}')
+            Database.get_session().rollback()
+            self._set_mirror_status(
+                ToolMirrorStatus.ERRORED, str(exc)[:terrarun.database.Database.LARGE_COLUMN_SIZE])
+            return False
+
+        logger.info(f'Mirrored tool archive: {object_key}')
+        self._set_mirror_status(ToolMirrorStatus.MIRRORED)
+        return True
+
+    def get_presigned_download_url(self) -> Optional[str]:
+        """
+        Obtain URL for terraform binary.
+
+        Provides pre-signed URL for mirrored archive, otherwise
+        falls back to the upstream URL, if enabled.
+        Returns None if the archive has not been mirrored and fallback is disabled.
+        """
+        if not self.archive_mirrored:
+            if not terrarun.config.Config().TOOL_UPSTREAM_URL_FALLBACK:
+                logger.debug(f'Tool {self.version} not mirrored and upstream URL fallback is disabled')
+                return None
+            logger.debug(f'Tool {self.version} not mirrored, using upstream URL')
+            return self.url.format(arch="amd64", platform="linux")
+
+        # Re-use previously generated URL
+        object_key = self._get_archive_object_key()
+        if url := self._get_cached_presigned_url(object_key):
+            return url
 
         # Create pre-signed URL
-        logger.debug('Creating pre-signed URL')
-        url = object_storage.create_presigned_download_url(path=object_key)
-        logger.debug(f'URL: {url}')
+        logger.debug(f'Creating pre-signed URL for {object_key}')
+        url = ObjectStorage().create_presigned_download_url(path=object_key, expiry=self.PRESIGNED_URL_EXPIRY)
+        self._set_cached_presigned_url(object_key, url)
         return url
 
     def get_checksum(self, platform="linux", arch="amd64", force_download=False):
@@ -328,9 +538,14 @@ class Tool(Base, BaseObject):
         if self.sha:
             return self.sha
 
-        object_storage = ObjectStorage()
         zip_file = self.ZIP_FORMAT.format(
             version=self.version, platform=platform, arch=arch)
+
+        # Use checksums parsed from a previous download of the checksum file
+        if not force_download and (checksums := self.checksums) is not None:
+            return checksums.get(zip_file)
+
+        object_storage = ObjectStorage()
         checksum_key = self.S3_KEY_CHECKSUM.format(
             version=self.version,
             type=self.tool_type.value,
@@ -364,28 +579,18 @@ class Tool(Base, BaseObject):
 
         logger.debug('Downloading checksum file from s3')
         checksum_file_content = object_storage.get_file(checksum_key)
-        logger.debug(checksum_file_content)
         logger.debug('Download complete')
 
+        # Parse and store all checksums, avoiding further downloads
+        checksums = {}
         for line in checksum_file_content.decode("utf-8").split("\n"):
-            logger.debug(f'Checking line: {line}')
             if checksum_line_match := self.CHECKSUM_FILE_RE.match(line):
-                if checksum_line_match.group(2) == zip_file:
-                    logger.debug(
-                        f'Found match for terraform {checksum_line_match.group(2)}: {checksum_line_match.group(1)}')
-                    return checksum_line_match.group(1)
+                checksums[checksum_line_match.group(2)] = checksum_line_match.group(1)
+        self.checksums = checksums
+
+        if zip_file in checksums:
+            logger.debug(f'Found match for terraform {zip_file}: {checksums[zip_file]}')
+            return checksums[zip_file]
 
         logger.debug('No checksum found for zip')
         return None
-
-    def remove_file_archive(self):
-        """Remove file from archive"""
-        object_storage = ObjectStorage()
-
-        # Generate keys in s3
-        zip_file = self.ZIP_FORMAT.format(
-            version=self.version, platform="linux", arch="amd64")
-        object_key = self.S3_KEY_ZIP.format(
-            zip_file=zip_file, type=self.tool_type.value, api_id=self.api_id)
-        if object_storage.file_exists(object_key):
-            object_storage.delete_file(object_key)
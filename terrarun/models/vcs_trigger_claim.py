@@ -0,0 +1,54 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import datetime
+from typing import Optional
+
+import sqlalchemy
+import sqlalchemy.exc
+import sqlalchemy.orm
+
+from terrarun.database import Base, Database
+import terrarun.models.workspace
+
+
+class VcsTriggerClaim(Base):
+    """
+    Claim on creating a configuration version for a workspace commit from VCS.
+
+    Webhook events and the VCS poller may handle the same commit concurrently,
+    in separate processes, so a claim is inserted before creating the
+    configuration version and the unique constraint ensures that only one succeeds.
+    """
+
+    __tablename__ = 'vcs_trigger_claim'
+    __table_args__ = (
+        sqlalchemy.UniqueConstraint("workspace_id", "commit_sha", "speculative", name="uq_vcs_trigger_claim_workspace_commit"),
+    )
+
+    id: int = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True)
+    workspace_id: int = sqlalchemy.Column(
+        sqlalchemy.ForeignKey("workspace.id", name="fk_vcs_trigger_claim_workspace_id"), nullable=False)
+    workspace: 'terrarun.models.workspace.Workspace' = sqlalchemy.orm.relationship("Workspace")
+    commit_sha: str = sqlalchemy.Column(Database.GeneralString, nullable=False)
+    speculative: bool = sqlalchemy.Column(sqlalchemy.Boolean, nullable=False)
+    created_at = sqlalchemy.Column(sqlalchemy.DateTime, nullable=False, default=datetime.datetime.now)
+
+    @classmethod
+    def claim(cls, workspace: 'terrarun.models.workspace.Workspace', commit_sha: str, speculative: bool) -> Optional['VcsTriggerClaim']:
+        """Claim commit for workspace, returning None if it has already been claimed"""
+        session = Database.get_session()
+        claim = cls(workspace_id=workspace.id, commit_sha=commit_sha, speculative=speculative)
+        session.add(claim)
+        try:
+            session.commit()
+        except sqlalchemy.exc.IntegrityError:
+            session.rollback()
+            return None
+        return claim
+
+    def release(self):
+        """Release claim, e.g. if the configuration version could not be created, so that it may be retried"""
+        session = Database.get_session()
+        session.delete(self)
+        session.commit()
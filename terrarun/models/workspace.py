@@ -102,6 +102,24 @@ class Workspace(Base, BaseObject):
     agent_pool_id: Optional[int] = sqlalchemy.Column(sqlalchemy.ForeignKey("agent_pool.id", name="fk_workspace_agent_pool_id"), nullable=True)
     agent_pool: Optional['terrarun.models.agent_pool.AgentPool'] = sqlalchemy.orm.relationship("AgentPool", foreign_keys=[agent_pool_id])
 
+    # Execution mode and agent pool, resolved from the workspace, project, environment
+    # and organisation. These are maintained on flush (see
+    # _update_effective_execution_settings) to allow agent jobs to be matched using indexed columns.
+    effective_execution_mode: Optional[WorkspaceExecutionMode] = sqlalchemy.Column(
+        sqlalchemy.Enum(WorkspaceExecutionMode), nullable=True, default=None, index=True)
+    effective_agent_pool_id: Optional[int] = sqlalchemy.Column(
+        sqlalchemy.ForeignKey("agent_pool.id", name="fk_workspace_effective_agent_pool_id"),
+        nullable=True, index=True)
+    effective_agent_pool: Optional['terrarun.models.agent_pool.AgentPool'] = sqlalchemy.orm.relationship(
+        "AgentPool", foreign_keys=[effective_agent_pool_id])
+
+    # Attributes of workspace that affect effective execution settings
+    EFFECTIVE_EXECUTION_ATTRIBUTES = (
+        "_execution_mode", "agent_pool", "agent_pool_id",
+        "project", "project_id", "environment", "environment_id",
+        "organisation", "organisation_id",
+    )
+
     _latest_state = None
     _latest_run = None
 
@@ -263,6 +281,24 @@ class Workspace(Base, BaseObject):
         """Set execution_mode"""
         self._execution_mode = value
 
+    def update_effective_execution_settings(self):
+        """Resolve and store execution mode and agent pool, inherited from project, environment and organisation"""
+        project = _get_related(self, "project")
+        environment = _get_related(self, "environment")
+        organisation = _get_related(self, "organisation")
+
+        self.effective_execution_mode = (
+            self._execution_mode or
+            (project._execution_mode if project else None) or
+            (organisation.default_execution_mode if organisation else None)
+        )
+        self.effective_agent_pool = (
+            _get_related(self, "agent_pool") or
+            (_get_related(project, "default_agent_pool") if project else None) or
+            (_get_related(environment, "default_agent_pool") if environment else None) or
+            (_get_related(organisation, "default_agent_pool") if organisation else None)
+        )
+
     @property
     def file_triggers_enabled(self):
         """Return if file_triggers_enabled"""
@@ -693,6 +729,12 @@ class Workspace(Base, BaseObject):
                     "display-identifier": self.authorised_repo.display_identifier,
                     "oauth-token-id": self.authorised_repo.oauth_token.api_id,
                     "webhook-url": f"{terrarun.config.Config().BASE_URL}/webhooks/vcs/{self.authorised_repo.webhook_id}",
+                    # Custom terrarun attribute, required to configure webhook in VCS provider
+                    "webhook-secret": (
+                        self.authorised_repo.webhook_secret
+                        if workspace_permissions.check_permission(WorkspacePermissions.Permissions.CAN_UPDATE) else
+                        None
+                    ),
                     "repository-http-url": self.authorised_repo.http_url,
                     "service-provider": self.authorised_repo.oauth_token.oauth_client.service_provider.value
                 } if self.authorised_repo else None,
@@ -854,3 +896,53 @@ class Workspace(Base, BaseObject):
             }
 
         return api_details, include_details
+
+
+def _has_attribute_changes(obj, attributes):
+    """Return whether any of the given attributes of an object have been modified"""
+    state = sqlalchemy.inspect(obj)
+    return any(state.attrs[attribute].history.has_changes() for attribute in attributes)
+
+
+def _get_related(obj, relationship):
+    """
+    Return object of many-to-one relationship.
+
+    If only the foreign key has been modified, the loaded relationship is stale until
+    flushed, so the related object is obtained using the new foreign key value.
+    """
+    state = sqlalchemy.inspect(obj)
+    relationship_property = state.mapper.relationships[relationship]
+    foreign_key_column, = relationship_property.local_columns
+    foreign_key = state.mapper.get_property_by_column(foreign_key_column).key
+    if (state.session is not None and
+            state.attrs[foreign_key].history.has_changes() and
+            not state.attrs[relationship].history.has_changes()):
+        foreign_key_value = getattr(obj, foreign_key)
+        if foreign_key_value is None:
+            return None
+        return state.session.get(relationship_property.mapper.class_, foreign_key_value)
+    return getattr(obj, relationship)
+
+
+@sqlalchemy.event.listens_for(sqlalchemy.orm.Session, "before_flush")
+def _update_effective_execution_settings(session, flush_context, instances):
+    """Update effective execution settings of workspaces affected by pending changes"""
+    # Objects do not support hashing, so key by identity
+    workspaces = {}
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Workspace):
+            if obj in session.new or _has_attribute_changes(obj, Workspace.EFFECTIVE_EXECUTION_ATTRIBUTES):
+                workspaces[id(obj)] = obj
+        elif isinstance(obj, terrarun.models.project.Project):
+            if _has_attribute_changes(obj, ("_execution_mode", "default_agent_pool", "default_agent_pool_id")):
+                workspaces.update({id(workspace): workspace for workspace in obj.workspaces})
+        elif isinstance(obj, terrarun.models.environment.Environment):
+            if _has_attribute_changes(obj, ("default_agent_pool", "default_agent_pool_id")):
+                workspaces.update({id(workspace): workspace for workspace in obj.workspaces})
+        elif isinstance(obj, terrarun.models.organisation.Organisation):
+            if _has_attribute_changes(obj, ("default_execution_mode", "default_agent_pool", "default_agent_pool_id")):
+                workspaces.update({id(workspace): workspace for workspace in obj.workspaces})
+
+    for workspace in workspaces.values():
+        workspace.update_effective_execution_settings()
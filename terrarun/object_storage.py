@@ -46,6 +46,14 @@ class ObjectStorage:
             Body=content
         )
 
+    def upload_fileobj(self, path, fileobj):
+        """Upload file-like object to s3, using multipart upload for large objects"""
+        self._s3_client.upload_fileobj(
+            Fileobj=fileobj,
+            Bucket=self.bucket_name,
+            Key=path
+        )
+
     def file_exists(self, path):
         """Check if file exists in s3"""
         try:
@@ -73,6 +81,19 @@ class ObjectStorage:
         content.seek(0)
         return content.read()
 
+    def get_file_stream(self, path):
+        """
+        Return streaming body and content length of file,
+        without reading content, or None if the file does not exist
+        """
+        try:
+            response = self._s3_client.get_object(Bucket=self.bucket_name, Key=path)
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ("404", "NoSuchKey"):
+                return None
+            raise
+        return response['Body'], response.get('ContentLength')
+
     def create_presigned_download_url(self, path, expiry=300):
         """Create pre-signed URL for object downoad"""
         return self._s3_client.generate_presigned_url(
@@ -91,4 +112,4 @@ class ObjectStorage:
 
     def delete_file(self, path):
         """Delete file from storage"""
-        return self._get_bucket().delete_key(path)
+        return self._s3_client.delete_object(Bucket=self.bucket_name, Key=path)
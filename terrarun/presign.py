@@ -3,30 +3,58 @@
 
 
 import base64
+import hashlib
+import hmac
 import json
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Optional
+import time
+from typing import Dict, Optional
 
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken
 from werkzeug.wrappers.request import Request
 
 import terrarun.config
 import terrarun.auth_context
-from terrarun.models.user import User
-from terrarun.models.run_queue import RunQueue
 from terrarun.utils import datetime_from_json
 
 
 class Presign:
     """Interface to encrypt/decrypt pre-sign keys"""
 
+    # Fernet instances, keyed by encryption key, to avoid
+    # decoding the key for each encryption/decryption
+    _fernet_cache: Dict[str, Fernet] = {}
+
+    @staticmethod
+    def _get_encryption_key():
+        """Return encryption key"""
+        if not terrarun.config.Config().AGENT_PRESIGN_ENCRYPTION_KEY:
+            raise Exception('AGENT_PRESIGN_ENCRYPTION_KEY must be set')
+        return terrarun.config.Config().AGENT_PRESIGN_ENCRYPTION_KEY
+
     @property
     def fernet(self):
         """Obtain instance of farnet"""
-        if not terrarun.config.Config().AGENT_PRESIGN_ENCRYPTION_KEY:
-            raise Exception('AGENT_PRESIGN_ENCRYPTION_KEY must be set')
-        return Fernet(base64.b64encode(terrarun.config.Config().AGENT_PRESIGN_ENCRYPTION_KEY.encode('utf-8')))
+        encryption_key = self._get_encryption_key()
+        if (fernet := self._fernet_cache.get(encryption_key)) is None:
+            fernet = Fernet(base64.b64encode(encryption_key.encode('utf-8')))
+            self._fernet_cache[encryption_key] = fernet
+        return fernet
+
+    @property
+    def _signing_key(self):
+        """Return key for signing, derived from the encryption key"""
+        return hashlib.sha256(b"terrarun-signature:" + self._get_encryption_key().encode('utf-8')).digest()
+
+    @staticmethod
+    def _b64encode(data: bytes) -> str:
+        """Encode data as URL-safe base64, without padding"""
+        return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+    @staticmethod
+    def _b64decode(data: str) -> bytes:
+        """Decode URL-safe base64, without padding"""
+        return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
 
     def encrypt(self, input):
         """Encrypt token"""
@@ -36,6 +64,28 @@ class Presign:
         """Decrypt token"""
         try:
             return self.fernet.decrypt(bytes.fromhex(input)).decode()
+        except (ValueError, InvalidToken):
+            return None
+
+    def sign(self, input):
+        """Return input, encoded with a HMAC signature. The input is not encrypted."""
+        payload = self._b64encode(input.encode())
+        signature = hmac.new(self._signing_key, payload.encode(), hashlib.sha256).digest()
+        return f"{payload}.{self._b64encode(signature)}"
+
+    def verify(self, input):
+        """Verify signature of signed input, returning the original input or None if invalid"""
+        payload, _, signature = input.partition(".")
+        if not payload or not signature:
+            return None
+
+        expected_signature = self._b64encode(
+            hmac.new(self._signing_key, payload.encode(), hashlib.sha256).digest()
+        )
+        if not hmac.compare_digest(expected_signature, signature):
+            return None
+        try:
+            return self._b64decode(payload).decode()
         except ValueError:
             return None
 
@@ -44,40 +94,50 @@ class Presign:
 class RequestSignature:
     """Class containing the request signature data."""
 
-    user: Optional[User]
-    job: Optional[RunQueue]
+    user_id: Optional[str]
+    job_id: Optional[str]
     path: str
-    created_at: datetime
+    # Unix timestamp after which the signature is no longer valid
+    expires_at: int
 
     def serialize(self) -> str:
-        data = {
-            "user_id": self.user.api_id if self.user else None,
-            "job_id": self.job.api_id if self.job else None,
-            "path": self.path,
-            "created_at": self.created_at.isoformat(),
-        }
-        return json.dumps(data)
+        return json.dumps([self.user_id, self.job_id, self.path, self.expires_at], separators=(",", ":"))
 
     @staticmethod
     def deserialise(serialized: str):
-        data = json.loads(serialized)
+        try:
+            data = json.loads(serialized)
+            user_id, job_id, path, expires_at = data
+        except (ValueError, TypeError):
+            return None
 
-        if data is None or not isinstance(data, dict):
+        return RequestSignature(
+            user_id=user_id,
+            job_id=job_id,
+            path=path,
+            expires_at=expires_at,
+        )
+
+    @staticmethod
+    def deserialise_legacy(serialized: str):
+        """Deserialise signature data created before expiry was added to signatures"""
+        try:
+            data = json.loads(serialized)
+        except ValueError:
             return None
 
-        user = None
-        if user_id := data.get("user_id"):
-            user = User.get_by_api_id(user_id)
+        if data is None or not isinstance(data, dict):
+            return None
 
-        job = None
-        if job_id := data.get("job_id"):
-            job = RunQueue.get_by_api_id(job_id)
+        created_at = datetime_from_json(data.get("created_at"))
+        if created_at is None:
+            return None
 
         return RequestSignature(
-            user=user,
-            job=job,
+            user_id=data.get("user_id"),
+            job_id=data.get("job_id"),
             path=data.get("path"),
-            created_at=datetime_from_json(data.get("created_at")),
+            expires_at=int(created_at.timestamp()) + terrarun.config.Config().PRESIGNED_URL_EXPIRY,
         )
 
 
@@ -90,14 +150,13 @@ class PresignedUrlGenerator:
         """Return signature for the url"""
 
         signature_data = RequestSignature(
-            user=auth_context.user,
-            job=auth_context.job,
+            user_id=auth_context.user.api_id if auth_context.user else None,
+            job_id=auth_context.job.api_id if auth_context.job else None,
             path=path,
-            created_at=datetime.now()
+            expires_at=int(time.time()) + terrarun.config.Config().PRESIGNED_URL_EXPIRY
         )
 
-        presign = Presign()
-        signature = presign.encrypt(signature_data.serialize())
+        signature = Presign().sign(signature_data.serialize())
 
         return f"{terrarun.config.Config().BASE_URL}{path}?{self.ARG_NAME}={signature}"
 
@@ -118,21 +177,32 @@ class PresignedRequestValidator:
             raise PresignedRequestValidatorError("Multiple signatures found.")
 
         presign = Presign()
-        signature_data_json = presign.decrypt(signature_list[0])
-
-        if signature_data_json is None:
-            raise PresignedRequestValidatorError("Failed to decode signature.")
+        if "." in signature_list[0]:
+            signature_data_json = presign.verify(signature_list[0])
+            if signature_data_json is None:
+                raise PresignedRequestValidatorError("Failed to verify signature.")
+            signature_data = RequestSignature.deserialise(signature_data_json)
+
+        else:
+            # Handle encrypted signatures, generated before signing was introduced
+            signature_data_json = presign.decrypt(signature_list[0])
+            if signature_data_json is None:
+                raise PresignedRequestValidatorError("Failed to decode signature.")
+            signature_data = RequestSignature.deserialise_legacy(signature_data_json)
 
-        signature_data = RequestSignature.deserialise(signature_data_json)
         if signature_data is None:
             raise PresignedRequestValidatorError("Failed to parse signature data.")
 
         if signature_data.path != request.path:
             raise PresignedRequestValidatorError("Signature path does not match.")
 
-        # @TODO Check the creation date and add a time limit
+        if signature_data.expires_at < time.time():
+            raise PresignedRequestValidatorError("Signature has expired.")
 
+        # User and job are only obtained if used by the endpoint
         return terrarun.auth_context.AuthContext(
-            user=signature_data.user,
-            job=signature_data.job,
+            user=None,
+            job=None,
+            user_api_id=signature_data.user_id,
+            job_api_id=signature_data.job_id,
         )
@@ -0,0 +1,126 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from terrarun.logger import get_logger
+from terrarun.models.configuration import ConfigurationVersion
+from terrarun.trigger_matcher import TriggerMatcher
+
+
+log = get_logger(__name__)
+
+
+class RepositorySnapshot:
+    """
+    Metadata of an authorised repo, shared by all workspaces using
+    the repo whilst it is checked for changes.
+
+    Tags, branch heads and compare results are obtained from the VCS provider
+    at most once per snapshot, and existing configuration versions are
+    looked up for all workspaces of the snapshot in a single query per commit.
+    """
+
+    def __init__(self, authorised_repo, workspaces, branch_shas: Optional[Dict[str, Optional[str]]]=None):
+        """Store member variables"""
+        self._authorised_repo = authorised_repo
+        self._service_provider = authorised_repo.oauth_token.oauth_client.service_provider_instance
+        self._workspace_ids = [workspace.id for workspace in workspaces]
+        # Branch heads may be provided, e.g. from a webhook event
+        self._branch_shas: Dict[str, Optional[str]] = dict(branch_shas or {})
+        self._tags: Optional[Dict[str, str]] = None
+        self._matching_tags: Dict[str, Optional[Tuple[str, str]]] = {}
+        self._changed_files: Dict[Tuple[str, str], List[str]] = {}
+        # Whether changed files match trigger matcher, keyed by base, head and matcher
+        self._trigger_matches: Dict[Tuple[str, str, TriggerMatcher], bool] = {}
+        # IDs of workspaces with non-speculative configuration versions, keyed by commit sha
+        self._configuration_version_workspace_ids: Dict[str, Set[int]] = {}
+
+        self.api_calls = 0
+        self.saved_api_calls = 0
+
+    @property
+    def service_provider(self):
+        """Return service provider of authorised repo"""
+        return self._service_provider
+
+    def get_latest_commit_ref(self, branch: str) -> Optional[str]:
+        """Return latest commit sha for branch"""
+        if branch in self._branch_shas:
+            self.saved_api_calls += 1
+        else:
+            self.api_calls += 1
+            self._branch_shas[branch] = self._service_provider.get_latest_commit_ref(
+                authorised_repo=self._authorised_repo, branch=branch
+            )
+        return self._branch_shas[branch]
+
+    def get_tags(self) -> Dict[str, str]:
+        """Return dictionary of latest tags to commit sha"""
+        if self._tags is not None:
+            self.saved_api_calls += 1
+        else:
+            self.api_calls += 1
+            self._tags = self._service_provider.get_tags(authorised_repo=self._authorised_repo)
+        return self._tags
+
+    def get_latest_matching_tag(self, tags_regex: str) -> Optional[Tuple[str, str]]:
+        """Return latest tag, and its commit sha, that matches regex"""
+        if tags_regex in self._matching_tags:
+            self.saved_api_calls += 1
+            return self._matching_tags[tags_regex]
+
+        tag_re = re.compile(tags_regex)
+        tags = self.get_tags()
+        matching_tag = None
+        for tag in tags:
+            log.debug(f"Checking tag: {tag}")
+            if tag_re.match(tag):
+                log.debug("Tag matches regex")
+                matching_tag = (tag, tags[tag])
+                break
+            log.debug("Tag does not match regex")
+
+        self._matching_tags[tags_regex] = matching_tag
+        return matching_tag
+
+    def get_changed_files(self, base: str, head: str) -> List[str]:
+        """Return list of files changed between two commits"""
+        if (base, head) in self._changed_files:
+            self.saved_api_calls += 1
+        else:
+            self.api_calls += 1
+            self._changed_files[(base, head)] = self._service_provider.get_changed_files(
+                authorised_repo=self._authorised_repo, base=base, head=head
+            )
+        return self._changed_files[(base, head)]
+
+    def changed_files_match(self, base: str, head: str, matcher: TriggerMatcher) -> bool:
+        """
+        Return whether files changed between two commits match trigger matcher.
+        Workspaces sharing triggers share matchers, so the result is reused between them.
+        """
+        key = (base, head, matcher)
+        if key not in self._trigger_matches:
+            file_changes = self.get_changed_files(base=base, head=head)
+            log.debug(f"Found file changes: {len(file_changes)}")
+            self._trigger_matches[key] = matcher.matches(file_changes)
+        return self._trigger_matches[key]
+
+    def has_configuration_version(self, workspace, git_commit_sha: str) -> bool:
+        """Return whether workspace has a non-speculative configuration version for commit"""
+        if git_commit_sha not in self._configuration_version_workspace_ids:
+            self._configuration_version_workspace_ids[git_commit_sha] = (
+                ConfigurationVersion.get_workspace_ids_by_git_commit_sha(
+                    workspace_ids=self._workspace_ids,
+                    git_commit_sha=git_commit_sha,
+                    speculative=False
+                )
+            )
+        return workspace.id in self._configuration_version_workspace_ids[git_commit_sha]
+
+    def add_configuration_version(self, workspace, git_commit_sha: str):
+        """Record configuration version created for workspace"""
+        if git_commit_sha in self._configuration_version_workspace_ids:
+            self._configuration_version_workspace_ids[git_commit_sha].add(workspace.id)
@@ -57,6 +57,8 @@ from terrarun.models.team_workspace_access import TeamWorkspaceRunsPermission, T
 from terrarun.models.workspace_task import WorkspaceTask, WorkspaceTaskEnforcementLevel, WorkspaceTaskStage
 from terrarun.models.environment import Environment
 from terrarun.agent_filesystem import AgentFilesystem
+from terrarun.agent_job_waiter import AgentJobWaiter
+from terrarun.log_ingest import LogIngest
 from terrarun.presign import Presign
 from terrarun.api_error import ApiError, api_error_response
 from terrarun.server.authenticated_endpoint import AuthenticatedEndpoint
@@ -2460,7 +2462,8 @@ class ApiTerraformPlanLog(Resource):
             session.refresh(plan)
             if plan.log:
                 session.refresh(plan.log)
-                if plan.log.data:
+                # Only load log data once it extends beyond the requested offset
+                if plan.log.get_data_size() > args.offset:
                     plan_output = plan.log.data
                     if args.limit >= 0:
                         plan_output = plan_output[args.offset:(args.offset+args.limit)]
@@ -2546,10 +2549,13 @@ class ApiTerraformWorkspaceLatestStateVersionOutputs(AuthenticatedEndpoint):
         if not state:
             return {}, 404
 
-        return {'data': [
-            output.get_api_details()
-            for output in state.state_version_outputs
-        ]} #include_sensitive=True
+        # Serve pre-rendered outputs document, which does not contain
+        # sensitive values
+        document, etag = state.get_outputs_document()
+        response = make_response(document)
+        response.headers['Content-Type'] = 'application/json'
+        response.set_etag(etag)
+        return response.make_conditional(request)
 
 
 class ApiTerraformWorkspaceActionsLock(AuthenticatedEndpoint):
@@ -2822,7 +2828,8 @@ class ApiTerraformApplyLog(Resource):
             if apply.log:
                 session.refresh(apply.log)
 
-                if apply.log.data:
+                # Only load log data once it extends beyond the requested offset
+                if apply.log.get_data_size() > args.offset:
                     output = apply.log.data
                     if args.limit >= 0:
                         output = output[args.offset:(args.offset+args.limit)]
@@ -3388,12 +3395,13 @@ class ApiAgentStatus(Resource, AgentEndpoint):
         except ValueError:
             return {}, 400
 
+        job_status_result = None
         if job_status := request.json.get("job"):
             # Get plan
             if job_status.get("type") == "plan":
-                JobProcessor.handle_plan_status_update(job_status)
+                job_status_result = JobProcessor.handle_plan_status_update(job_status, agent=agent)
             elif job_status.get("type") == "apply":
-                JobProcessor.handle_apply_status_update(job_status)
+                job_status_result = JobProcessor.handle_apply_status_update(job_status, agent=agent)
             else:
                 logger.error("Unknown job type: %s", job_status.get('type'))
                 return {}, 500
@@ -3402,6 +3410,10 @@ class ApiAgentStatus(Resource, AgentEndpoint):
             agent_status
         )
 
+        # Return error from job status update, e.g. if the agent no longer owns the job
+        if job_status_result is not None:
+            return job_status_result
+
         res = make_response({}, 200)
         # @TODO Confirm what this is.. does it ever get passed as a non-zero number?
         res.headers['Tfc-Agent-Message-Index'] = request.headers.get('Tfc-Agent-Message-Index', 0)
@@ -3424,7 +3436,11 @@ class ApiAgentJobs(Resource, AgentEndpoint):
         if not agent:
             return {}, 403
 
-        job, execution_mode = JobProcessor.get_job_by_agent_and_job_types(agent=agent, job_types=accepted_job_types)
+        # If no job is available, hold request until one is queued
+        job, execution_mode = AgentJobWaiter.wait_for_job(
+            agent_pool_id=agent.agent_pool_id,
+            get_job=lambda: JobProcessor.get_job_by_agent_and_job_types(agent=agent, job_types=accepted_job_types)
+        )
 
         if job:
             if job.job_type is JobQueueType.PLAN:
@@ -3443,6 +3459,13 @@ class ApiAgentJobs(Resource, AgentEndpoint):
             if not tool:
                 return {}, 204
 
+            # Leave job queued until the tool has been mirrored,
+            # if agents may not download it from upstream
+            terraform_url = tool.get_presigned_download_url()
+            if not terraform_url:
+                logger.info('Tool %s for job (id: %s) has not been mirrored', tool.version, job.id)
+                return {}, 204
+
             # Generate user token for run
             token = UserToken.create_agent_job_token(job=job)
 
@@ -3473,7 +3496,7 @@ class ApiAgentJobs(Resource, AgentEndpoint):
                     "operation": job.job_type.value,
                     "organization_name": job.run.configuration_version.workspace.organisation.name_id,
                     "workspace_name": job.run.configuration_version.workspace.name,
-                    "terraform_url": tool.get_presigned_download_url(),
+                    "terraform_url": terraform_url,
                     "terraform_checksum": tool.get_checksum(),
                     "terraform_log_url": f"{terrarun.config.Config().BASE_URL}/api/agent/log/{job.job_type.value}/{job_sub_task_id}?key={run_key}",
                     "configuration_version_url": job.run.configuration_version.get_download_url(),
@@ -3499,36 +3522,20 @@ class ApiAgentPlanLog(Resource):
 
     def put(self, plan_id):
         """Handle log upload"""
-        decrypted_run_id = Presign().decrypt(request.args.get('key', ''))
-        if not decrypted_run_id:
-            return {}, 404
-
-        plan = Plan.get_by_api_id(plan_id)
-        if not plan:
+        plan_db_id = LogIngest.authenticate(Plan, plan_id, request.args.get('key', ''))
+        if plan_db_id is None:
             return {}, 404
 
-        # Check encrypted run ID in URL
-        if plan.run.api_id != decrypted_run_id:
-            return {}, 404
-
-        plan.append_output(request.data, no_append=True)
+        LogIngest.replace(Plan, plan_db_id, request.data)
         return {}, 200
 
     def patch(self, plan_id):
         """Handle log upload"""
-        decrypted_run_id = Presign().decrypt(request.args.get('key', ''))
-        if not decrypted_run_id:
-            return {}, 404
-
-        plan = Plan.get_by_api_id(plan_id)
-        if not plan:
-            return {}, 404
-
-        # Check encrypted run ID in URL
-        if plan.run.api_id != decrypted_run_id:
+        plan_db_id = LogIngest.authenticate(Plan, plan_id, request.args.get('key', ''))
+        if plan_db_id is None:
             return {}, 404
 
-        plan.append_output(request.data)
+        LogIngest.append(Plan, plan_db_id, request.data)
         return {}, 200
 
 
@@ -3537,36 +3544,20 @@ class ApiAgentApplyLog(Resource):
 
     def put(self, apply_id):
         """Handle log upload"""
-        decrypted_run_id = Presign().decrypt(request.args.get('key', ''))
-        if not decrypted_run_id:
-            return {}, 404
-
-        apply = Apply.get_by_api_id(apply_id)
-        if not apply:
-            return {}, 404
-
-        # Check encrypted run ID in URL
-        if apply.plan.run.api_id != decrypted_run_id:
+        apply_db_id = LogIngest.authenticate(Apply, apply_id, request.args.get('key', ''))
+        if apply_db_id is None:
             return {}, 404
 
-        apply.append_output(request.data, no_append=True)
+        LogIngest.replace(Apply, apply_db_id, request.data)
         return {}, 200
 
     def patch(self, apply_id):
         """Handle log upload"""
-        decrypted_run_id = Presign().decrypt(request.args.get('key', ''))
-        if not decrypted_run_id:
+        apply_db_id = LogIngest.authenticate(Apply, apply_id, request.args.get('key', ''))
+        if apply_db_id is None:
             return {}, 404
 
-        apply = Apply.get_by_api_id(apply_id)
-        if not apply:
-            return {}, 404
-
-        # Check encrypted run ID in URL
-        if apply.plan.run.api_id != decrypted_run_id:
-            return {}, 404
-
-        apply.append_output(request.data)
+        LogIngest.append(Apply, apply_db_id, request.data)
         return {}, 200
 
 
@@ -3586,7 +3577,18 @@ class ApiAgentFilesystem(Resource):
             return {}, 404
 
         agent_filesystem = AgentFilesystem(run=run)
-        return make_response(agent_filesystem.get_content())
+
+        # Redirect agent to download directly from object storage,
+        # where available, to avoid proxying large filesystems
+        if terrarun.config.Config().AGENT_FILESYSTEM_PRESIGNED_REDIRECT:
+            if download_url := agent_filesystem.get_download_url():
+                return flask.redirect(download_url, code=302)
+
+        content, content_length = agent_filesystem.get_content_stream()
+        headers = {}
+        if content_length is not None:
+            headers["Content-Length"] = str(content_length)
+        return flask.Response(content, mimetype="application/octet-stream", headers=headers)
 
     def put(self):
         """Handle upload of new filesystem image"""
@@ -3602,7 +3604,8 @@ class ApiAgentFilesystem(Resource):
             return {}, 404
 
         agent_filesystem = AgentFilesystem(run=run)
-        agent_filesystem.upload_content(request.data)
+        # Stream request body to object storage, rather than buffering it in memory
+        agent_filesystem.upload_content(request.stream)
         return {}, 200
 
 
@@ -51,7 +51,7 @@ class AuthenticatedEndpoint(Resource):
 
     def _validate_authentication(self, auth_context: 'terrarun.auth_context.AuthContext') -> bool:
         """Validate authentication"""
-        if auth_context.user is None and auth_context.job is None:
+        if not auth_context.has_identity:
             logger.warning('Unauthenticated request.')
             return False
         return True
@@ -65,6 +65,12 @@ class AuthenticatedEndpoint(Resource):
         if not self._validate_authentication(auth_context=auth_context):
             return {}, 403
 
+        # Ensure user/job still exist, which are obtained
+        # here so that they are cached for the permission check
+        if not auth_context.has_valid_identity:
+            logger.warning('Authenticated user or job no longer exists.')
+            return {}, 401
+
         check_permissions_method = f"check_permissions_{method_name}"
         if not getattr(self, check_permissions_method)(*args, auth_context=auth_context, **kwargs):
             return {}, 404
@@ -3,4 +3,5 @@
 
 from .admin_settings import *
 from .admin_terraform_versions import *
-from .state_version import *
\ No newline at end of file
+from .state_version import *
+from .vcs_webhook import *
@@ -0,0 +1,64 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import datetime
+
+import flask
+import flask_restful
+from flask import request
+
+from terrarun.database import Database
+from terrarun.logger import get_logger
+from terrarun.models.authorised_repo import AuthorisedRepo
+from terrarun.server.route_registration import RouteRegistration
+from terrarun.vcs_trigger import VcsTrigger
+
+
+logger = get_logger(__name__)
+
+
+class VcsWebhookRouteRegistration(RouteRegistration):
+    """Register VCS webhook routes"""
+
+    def register_routes(self, app: 'flask.app', api: 'flask_restful.Api'):
+        """Register routes"""
+        api.add_resource(
+            ApiVcsWebhook,
+            '/webhooks/vcs/<string:webhook_id>'
+        )
+
+
+class ApiVcsWebhook(flask_restful.Resource):
+    """Interface to receive webhooks from VCS providers"""
+
+    def post(self, webhook_id):
+        """Handle webhook event"""
+        authorised_repo = AuthorisedRepo.get_by_webhook_id(webhook_id)
+        if not authorised_repo:
+            return {}, 404
+
+        service_provider = authorised_repo.oauth_token.oauth_client.service_provider_instance
+        if not service_provider.verify_webhook_signature(
+                authorised_repo=authorised_repo,
+                headers=request.headers,
+                body=request.get_data()):
+            logger.warning("Invalid webhook signature for authorised repo: %s", authorised_repo.name)
+            return {}, 403
+
+        # Record that webhooks are being received, reducing the frequency of polling
+        session = Database.get_session()
+        authorised_repo.webhook_received_at = datetime.datetime.now()
+        session.add(authorised_repo)
+        session.commit()
+
+        event = service_provider.parse_webhook_event(
+            headers=request.headers,
+            payload=request.get_json(silent=True)
+        )
+        if event is None:
+            return {}, 200
+
+        # Obtaining configuration from the provider may take longer than
+        # the provider waits for a response, so handle the event in the background
+        VcsTrigger.submit_webhook_event(authorised_repo_id=authorised_repo.id, event=event)
+        return {}, 202
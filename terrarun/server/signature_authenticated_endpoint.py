@@ -21,9 +21,7 @@ class SignatureAuthenticatedEndpoint(AuthenticatedEndpoint):
         """Verify the signature and return an auth context based on the signature data"""
 
         try:
-            presign_data = PresignedRequestValidator().validate(request)
+            return PresignedRequestValidator().validate(request)
         except PresignedRequestValidatorError as e:
             logger.warning("Failed to authenticate with signature. Error: %s", e)
             return terrarun.auth_context.AuthContext(user=None, job=None)
-
-        return terrarun.auth_context.AuthContext(user=presign_data.user, job=presign_data.job)
@@ -0,0 +1,121 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import itertools
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+import requests
+import requests.adapters
+
+import terrarun.config
+from terrarun.database import Database
+from terrarun.logger import get_logger
+import terrarun.models.task_result
+
+
+logger = get_logger(__name__)
+
+
+class TaskDispatcher:
+    """
+    Call remote task URLs for task results in background threads.
+
+    Payloads are generated by the caller, so that task callback credentials
+    are created within the caller's transaction. The calls to remote URLs, and
+    retries, are then performed concurrently, without blocking the caller.
+
+    Each attempt is a separate call in the executor. Failed attempts are
+    scheduled for retry by a single background thread once the backoff
+    interval has elapsed, so that waiting retries do not occupy executor threads.
+    """
+
+    _lock = threading.Lock()
+    _executor: Optional[ThreadPoolExecutor] = None
+    _session: Optional[requests.Session] = None
+    # Scheduled retries, as a heap of due time, sequence number and call arguments
+    _retries: List[Tuple[float, int, tuple]] = []
+    _retry_sequence = itertools.count()
+    _retry_condition = threading.Condition(_lock)
+    _retry_thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        """Return executor and HTTP session, creating them if they do not exist"""
+        with cls._lock:
+            if cls._executor is None:
+                concurrency = terrarun.config.Config().TASK_DISPATCH_CONCURRENCY
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                cls._session = session
+                cls._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="task-dispatch")
+            return cls._executor
+
+    @classmethod
+    def dispatch(cls, task_results: Iterable['terrarun.models.task_result.TaskResult']):
+        """Queue calls to remote task URLs of task results"""
+        executor = cls._get_executor()
+        for task_result in task_results:
+            url, payload, headers = task_result.prepare_dispatch()
+            executor.submit(cls._call_task, task_result.id, url, payload, headers)
+
+    @classmethod
+    def _schedule_retry(cls, delay: float, args: tuple):
+        """Schedule call to be submitted to the executor once the delay has elapsed"""
+        with cls._retry_condition:
+            heapq.heappush(cls._retries, (time.monotonic() + delay, next(cls._retry_sequence), args))
+            if cls._retry_thread is None:
+                cls._retry_thread = threading.Thread(target=cls._retry_loop, daemon=True, name="task-dispatch-retry")
+                cls._retry_thread.start()
+            cls._retry_condition.notify()
+
+    @classmethod
+    def _retry_loop(cls):
+        """Submit scheduled retries to the executor once due"""
+        while True:
+            with cls._retry_condition:
+                while not cls._retries or cls._retries[0][0] > time.monotonic():
+                    cls._retry_condition.wait(
+                        timeout=(cls._retries[0][0] - time.monotonic()) if cls._retries else None
+                    )
+                _, _, args = heapq.heappop(cls._retries)
+            cls._get_executor().submit(cls._call_task, *args)
+
+    @classmethod
+    def _call_task(cls, task_result_id: int, url: str, payload: str, headers: dict, attempt: int=0):
+        """
+        Call remote task URL and update the task result,
+        scheduling a retry, with exponential backoff, on failure
+        """
+        config = terrarun.config.Config()
+        success = False
+        try:
+            try:
+                res = cls._session.post(url, data=payload, headers=headers, timeout=config.TASK_CALL_TIMEOUT)
+                if res.status_code == 200:
+                    success = True
+                else:
+                    logger.error("Got invalid response from task result: %s", res.status_code)
+            except requests.exceptions.RequestException:
+                logger.exception('Exception occurred whilst calling task result.')
+
+            if not success and attempt + 1 < config.TASK_CALL_MAX_ATTEMPTS:
+                cls._schedule_retry(
+                    delay=config.TASK_CALL_ATTEMPT_INTERVAL * (2 ** attempt),
+                    args=(task_result_id, url, payload, headers, attempt + 1)
+                )
+                return
+
+            task_result = terrarun.models.task_result.TaskResult.get_by_id(task_result_id)
+            if task_result:
+                task_result.handle_dispatch_result(success=success)
+        except Exception as exc:
+            logger.error(f"Failed to dispatch task result {task_result_id}: {exc}")
+            Database.get_session().rollback()
+        finally:
+            Database.get_session().remove()
@@ -17,7 +17,7 @@ import terrarun.models.run
 import terrarun.models.run_flow
 from terrarun.database import Database
 from terrarun.logger import get_logger
-from terrarun.models.base_object import BaseObject
+from terrarun.models.base_object import BaseObject, transition_status
 from terrarun.models.blob import Blob
 import terrarun.utils
 
@@ -42,6 +42,11 @@ class TerraformCommand(BaseObject):
     def append_output(self, data, no_append=False):
         """Append to output"""
         session = Database.get_session()
+        # Append to existing log in the database, without loading it
+        if not no_append and self.log_id is not None and Blob.append_data_by_id(self.log_id, data, session=session):
+            session.commit()
+            return
+
         session.refresh(self)
         if self.log_id is None:
             log = Blob(data=b"")
@@ -53,41 +58,46 @@ class TerraformCommand(BaseObject):
         if no_append:
             log.data = data
         else:
-            log.data += data
+            log.append_data(data)
         session.add(log)
         session.commit()
 
-    def update_status(self, new_status, session=None):
-        """Update state of plan."""
+    def update_status(self, new_status, session=None, expected_status=None):
+        """
+        Update state of plan, returning whether the status was updated.
+
+        The update is only applied if the status matches expected_status,
+        which defaults to the current status.
+        """
         logger.info("Updating %s status to from %s to %s", self.ID_PREFIX, self.status, new_status)
         should_commit = False
         if session is None:
             session = Database.get_session()
-            session.refresh(self)
             should_commit = True
 
-        audit_event = terrarun.models.audit_event.AuditEvent(
-            organisation=self.run.configuration_version.workspace.organisation,
-            object_id=self.id,
-            object_type=self.ID_PREFIX,
-            old_value=Database.encode_value(self.status.value) if self.status else None,
-            new_value=Database.encode_value(new_status.value),
-            event_type=terrarun.models.audit_event.AuditEventType.STATUS_CHANGE)
-
-        self.status = new_status
-        session.add(self)
-        session.add(audit_event)
+        old_status = self.status if expected_status is None else expected_status
+        updated = transition_status(self, new_status, session=session, expected_status=old_status)
+        if updated:
+            audit_event = terrarun.models.audit_event.AuditEvent(
+                organisation_id=self.run.get_organisation_id(),
+                object_id=self.id,
+                object_type=self.ID_PREFIX,
+                old_value=old_status.value if old_status else None,
+                new_value=new_status.value,
+                event_type=terrarun.models.audit_event.AuditEventType.STATUS_CHANGE)
+            session.add(audit_event)
+
         if should_commit:
             session.commit()
+        return updated
 
     def get_status_change_timestamps(self) -> Dict[TerraformCommandState, datetime.datetime]:
         """Get timestamps for status changes"""
-        session = Database.get_session()
         return {
-            TerraformCommandState(Database.decode_blob(event.new_value)): event.timestamp
-            for event in session.query(terrarun.models.audit_event.AuditEvent).where(
-                terrarun.models.audit_event.AuditEvent.object_id==self.id,
-                terrarun.models.audit_event.AuditEvent.object_type==self.ID_PREFIX,
-                terrarun.models.audit_event.AuditEvent.event_type==terrarun.models.audit_event.AuditEventType.STATUS_CHANGE
+            TerraformCommandState(event.new_value): event.timestamp
+            for event in terrarun.models.audit_event.AuditEvent.get_by_object_type_and_object_id(
+                object_type=self.ID_PREFIX,
+                object_id=self.id,
+                event_type=terrarun.models.audit_event.AuditEventType.STATUS_CHANGE
             )
         }
@@ -0,0 +1,67 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+from collections import OrderedDict
+import fnmatch
+import re
+import threading
+from typing import Iterable, Optional, Tuple
+
+
+class TriggerMatcher:
+    """
+    Match changed files against trigger patterns or prefixes of a workspace.
+
+    Patterns are combined into a single regular expression, and prefixes
+    are checked using a single startswith, so each file is checked once.
+    Matchers are cached by their patterns/prefixes, so workspaces with the
+    same triggers share a matcher and changes to triggers use a new matcher.
+    """
+
+    # Maximum number of cached matchers
+    MAX_CACHED_MATCHERS = 1024
+
+    _lock = threading.Lock()
+    _cache: 'OrderedDict[Tuple[Tuple[str, ...], Tuple[str, ...]], TriggerMatcher]' = OrderedDict()
+
+    def __init__(self, patterns: Tuple[str, ...], prefixes: Tuple[str, ...]):
+        """Compile patterns/prefixes"""
+        self._prefixes = prefixes
+        self._pattern_re = re.compile(
+            "|".join(f"(?:{fnmatch.translate(pattern)})" for pattern in patterns)
+        ) if patterns else None
+
+    @classmethod
+    def get_for_workspace(cls, workspace) -> Optional['TriggerMatcher']:
+        """
+        Return matcher for workspace trigger patterns or, if no patterns are set, trigger prefixes.
+        Returns None if workspace has no triggers.
+        """
+        if workspace.trigger_patterns:
+            key = (tuple(workspace.trigger_patterns), ())
+        elif workspace.trigger_prefixes:
+            key = ((), tuple(workspace.trigger_prefixes))
+        else:
+            return None
+
+        with cls._lock:
+            if (matcher := cls._cache.get(key)) is not None:
+                cls._cache.move_to_end(key)
+                return matcher
+
+        matcher = cls(patterns=key[0], prefixes=key[1])
+        with cls._lock:
+            cls._cache[key] = matcher
+            while len(cls._cache) > cls.MAX_CACHED_MATCHERS:
+                cls._cache.popitem(last=False)
+        return matcher
+
+    def matches(self, file_paths: Iterable[str]) -> bool:
+        """Return whether any of the file paths match"""
+        if self._pattern_re is not None:
+            pattern_match = self._pattern_re.match
+            return any(pattern_match(file_path) for file_path in file_paths)
+        if self._prefixes:
+            prefixes = self._prefixes
+            return any(file_path.startswith(prefixes) for file_path in file_paths)
+        return False
@@ -0,0 +1,252 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+from concurrent.futures import ThreadPoolExecutor
+import re
+
+import terrarun.config
+from terrarun.database import Database
+from terrarun.logger import get_logger
+from terrarun.models.authorised_repo import AuthorisedRepo
+from terrarun.models.configuration import ConfigurationVersion
+from terrarun.models.run import Run
+from terrarun.models.vcs_trigger_claim import VcsTriggerClaim
+from terrarun.repository_snapshot import RepositorySnapshot
+from terrarun.trigger_matcher import TriggerMatcher
+from terrarun.vcs_webhook_event import VcsWebhookEvent, VcsWebhookEventType
+
+
+log = get_logger(__name__)
+
+
+class VcsTrigger:
+    """Create configuration versions and runs for workspaces, based on changes in VCS repositories"""
+
+    # Webhook events are handled by a single thread, so that events
+    # for the same repository are processed in the order they are received
+    _webhook_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vcs-webhook")
+
+    @staticmethod
+    def get_workspaces(authorised_repo):
+        """Return workspaces using authorised repo, either directly or via their project"""
+        workspaces = []
+        for project in authorised_repo.projects:
+            log.debug(f'Handling project: {project.name}')
+            workspaces += project.workspaces
+
+        # Direct member workspaces
+        workspaces += authorised_repo.workspaces
+        return workspaces
+
+    def process_workspace(self, workspace, snapshot: RepositorySnapshot):
+        """Handle checking workspace for new commits to create run for"""
+        log.debug(f'Handling workspace: {workspace.name}')
+
+        commit_sha = None
+        workspace_branch = None
+        workspace_tag = None
+
+        # Handle workspaces with git tag regex
+        if workspace.vcs_repo_tags_regex:
+            log.debug("Handling tag-based search")
+            matching_tag = snapshot.get_latest_matching_tag(workspace.vcs_repo_tags_regex)
+            # Once a match tag is found, check if there is a run for it.
+            # Otherwise, the commit sha is not set, as all other tags are older
+            if matching_tag:
+                tag, tag_commit_sha = matching_tag
+                if not snapshot.has_configuration_version(workspace=workspace, git_commit_sha=tag_commit_sha):
+                    # If there wasn't, perform a run with the commit sha
+                    commit_sha = tag_commit_sha
+                    workspace_tag = tag
+                    log.debug(f"Using tag commit {tag_commit_sha}")
+                else:
+                    log.debug(f"Run already exists for commit {tag_commit_sha}")
+
+        else:
+            workspace_branch = workspace.get_branch()
+
+            # Obtain latest sha for branch, if not already obtained for another workspace
+            branch_sha = snapshot.get_latest_commit_ref(workspace_branch)
+            if not branch_sha:
+                log.warning(f'Could not find latest commit for branch: {workspace_branch}')
+                return
+
+            if not snapshot.has_configuration_version(workspace=workspace, git_commit_sha=branch_sha):
+                commit_sha = branch_sha
+
+                # Check if filters match
+                trigger_matcher = TriggerMatcher.get_for_workspace(workspace)
+                if trigger_matcher:
+                    log.debug("Trigger pattern/prefixes enabled")
+                    latest_configuration_version = workspace.latest_configuration_version
+                    # If there is a configuration version and it contains a git sha...
+                    if latest_configuration_version and latest_configuration_version.git_commit_sha:
+                        # Check file changes between the commits against triggers
+                        if snapshot.changed_files_match(
+                                base=latest_configuration_version.git_commit_sha,
+                                head=commit_sha,
+                                matcher=trigger_matcher):
+                            log.debug("Trigger pattern/prefix matched")
+                        else:
+                            # If no match was found, unset commit sha to avoid build
+                            log.debug('No trigger patterns/prefixes matched')
+                            commit_sha = None
+
+                    else:
+                        log.warning("No latest configuration version found or "
+                                    "latest configuration version has no commit ID")
+
+        if commit_sha is not None:
+            # Ensure that the commit is not also being handled by a webhook event or the VCS poller
+            claim = VcsTriggerClaim.claim(workspace=workspace, commit_sha=commit_sha, speculative=False)
+            if not claim:
+                log.debug(f"Configuration version already created for commit {commit_sha}")
+                return
+
+            log.info(f"Creating configuration version for commit {commit_sha}")
+            # If there is not a configuration version for the git commit,
+            # create one
+            cv = self._generate_configuration_version(
+                claim=claim,
+                workspace=workspace,
+                commit_ref=commit_sha,
+                # Allow all runs to be queued to be applied
+                speculative=False,
+                branch=workspace_branch,
+                tag=workspace_tag
+            )
+            if not cv:
+                log.info('Unable to create configuration version')
+                return
+            snapshot.add_configuration_version(workspace=workspace, git_commit_sha=commit_sha)
+
+            # Create run
+            if workspace.queue_all_runs:
+                log.info(f"Creating run")
+                try:
+                    Run.create(
+                        configuration_version=cv,
+                        created_by=None,
+                        is_destroy=False,
+                        refresh=True,
+                        refresh_only=False,
+                        auto_apply=workspace.auto_apply,
+                        plan_only=False,
+                        message="Initiated from SCM change"
+                    )
+                # @TODO Limit to legitimate errors, such as environment progression
+                # errors
+                except Exception as exc:
+                    log.error(f"failed to start run: {exc}")
+            else:
+                log.info("Skipping run creation as workspace not configured with queue_all_runs")
+
+    @staticmethod
+    def _generate_configuration_version(claim: VcsTriggerClaim, **kwargs):
+        """Generate configuration version from VCS, releasing the claim on the commit if this fails"""
+        try:
+            cv = ConfigurationVersion.generate_from_vcs(**kwargs)
+        except Exception:
+            Database.get_session().rollback()
+            claim.release()
+            raise
+        if not cv:
+            claim.release()
+        return cv
+
+    def create_speculative_run(self, authorised_repo, workspace, commit_sha, branch, pull_request_id):
+        """Create speculative plan for pull request commit"""
+        if ConfigurationVersion.get_configuration_version_by_git_commit_sha(
+                workspace=workspace,
+                git_commit_sha=commit_sha,
+                speculative=True):
+            log.debug(f"Speculative run already exists for commit {commit_sha}")
+            return
+
+        claim = VcsTriggerClaim.claim(workspace=workspace, commit_sha=commit_sha, speculative=True)
+        if not claim:
+            log.debug(f"Speculative run already being created for commit {commit_sha}")
+            return
+
+        log.info(f"Creating speculative configuration version for pull request {pull_request_id} commit {commit_sha}")
+        cv = self._generate_configuration_version(
+            claim=claim,
+            workspace=workspace,
+            commit_ref=commit_sha,
+            speculative=True,
+            branch=branch,
+            pull_request_id=str(pull_request_id) if pull_request_id is not None else None
+        )
+        if not cv:
+            log.info('Unable to create configuration version')
+            return
+
+        try:
+            Run.create(
+                configuration_version=cv,
+                created_by=None,
+                is_destroy=False,
+                refresh=True,
+                refresh_only=False,
+                auto_apply=False,
+                plan_only=True,
+                message=f"Speculative plan for pull request {pull_request_id}"
+            )
+        except Exception as exc:
+            log.error(f"failed to start run: {exc}")
+
+    def handle_webhook_event(self, authorised_repo, event: VcsWebhookEvent):
+        """Create configuration versions/runs for workspaces affected by webhook event"""
+        workspaces = self.get_workspaces(authorised_repo)
+        # Provide commit from push events, avoiding querying the provider for the latest commit
+        snapshot = RepositorySnapshot(
+            authorised_repo=authorised_repo,
+            workspaces=workspaces,
+            branch_shas=(
+                {event.branch: event.commit_sha}
+                if event.event_type is VcsWebhookEventType.PUSH else
+                None
+            )
+        )
+        for workspace in workspaces:
+            if event.event_type is VcsWebhookEventType.TAG:
+                if workspace.vcs_repo_tags_regex and re.match(workspace.vcs_repo_tags_regex, event.tag):
+                    self.process_workspace(workspace=workspace, snapshot=snapshot)
+
+            # Workspaces triggered by tags ignore commits to branches
+            elif workspace.vcs_repo_tags_regex or workspace.get_branch() != event.branch:
+                continue
+
+            elif event.event_type is VcsWebhookEventType.PUSH:
+                self.process_workspace(workspace=workspace, snapshot=snapshot)
+
+            elif event.event_type is VcsWebhookEventType.PULL_REQUEST and workspace.speculative_enabled:
+                # Pull requests from forks contain untrusted code, which would
+                # be run with the credentials and variables of the workspace
+                if event.from_fork and not terrarun.config.Config().VCS_SPECULATIVE_PLANS_FOR_FORKS:
+                    log.info(f"Skipping speculative plan for pull request {event.pull_request_id} from fork")
+                    continue
+                self.create_speculative_run(
+                    authorised_repo=authorised_repo,
+                    workspace=workspace,
+                    commit_sha=event.commit_sha,
+                    branch=event.branch,
+                    pull_request_id=event.pull_request_id
+                )
+
+    def _process_webhook_event(self, authorised_repo_id, event: VcsWebhookEvent):
+        """Handle webhook event in background thread, using the thread's own session"""
+        try:
+            authorised_repo = AuthorisedRepo.get_by_id(authorised_repo_id)
+            if authorised_repo:
+                self.handle_webhook_event(authorised_repo=authorised_repo, event=event)
+        except Exception as exc:
+            log.error(f"Failed to handle webhook event for authorised repo {authorised_repo_id}: {exc}")
+            Database.get_session().rollback()
+        finally:
+            Database.get_session().remove()
+
+    @classmethod
+    def submit_webhook_event(cls, authorised_repo_id, event: VcsWebhookEvent):
+        """Queue webhook event to be handled in the background"""
+        cls._webhook_executor.submit(cls()._process_webhook_event, authorised_repo_id, event)
@@ -0,0 +1,28 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+from dataclasses import dataclass
+from enum import Enum
+from typing import Optional
+
+
+class VcsWebhookEventType(Enum):
+    """Type of VCS webhook event"""
+
+    PUSH = "push"
+    TAG = "tag"
+    PULL_REQUEST = "pull_request"
+
+
+@dataclass
+class VcsWebhookEvent:
+    """Provider-agnostic details of VCS webhook event"""
+
+    event_type: VcsWebhookEventType
+    commit_sha: str
+    # Branch pushed to or, for pull requests, the base branch
+    branch: Optional[str] = None
+    tag: Optional[str] = None
+    pull_request_id: Optional[int] = None
+    # Whether the pull request head is in a different repository to the base
+    from_fork: bool = False
@@ -19,6 +19,9 @@ logger = get_logger(__name__)
 class Worker:
     """Provide functionality for internal worker"""
 
+    # Maximum number of run states handled for a single worker job
+    MAX_INLINE_TRANSITIONS = 10
+
     def __init__(self):
         """Store member variables"""
         self.__running = True
@@ -39,15 +42,43 @@ class Worker:
             Database.get_session().remove()
 
     def _check_for_jobs(self):
-        """Check for jobs to run"""
+        """
+        Check for jobs to run.
+
+        Returns whether a run progressed, in which case the queue is checked
+        again immediately, rather than waiting for the next check.
+        """
         logger.debug('Checking for jobs...')
         run = JobProcessor.get_worker_job()
         if not run:
             logger.debug('No run in queue')
             return None
 
-        logger.info('Handling run. Id: %s. Status: %s', run.api_id, run.status)
-
+        # Handle consecutive states of the run within this job, whilst
+        # each state queues the run for the worker again, e.g. for runs without tasks
+        for _ in range(self.MAX_INLINE_TRANSITIONS):
+            logger.info('Handling run. Id: %s. Status: %s', run.api_id, run.status)
+            previous_status = run.status
+            run.defer_worker_jobs()
+            try:
+                self._handle_run(run)
+            finally:
+                requeue = run.pop_deferred_worker_job()
+
+            if not requeue:
+                return True
+            # If the run did not change state, e.g. whilst waiting
+            # for a workspace lock, requeue the run to be handled later,
+            # waiting before checking the queue again
+            if run.status is previous_status:
+                run.queue_worker_job()
+                return False
+
+        run.queue_worker_job()
+        return True
+
+    def _handle_run(self, run):
+        """Handle current state of run"""
         if run.status is RunStatus.PENDING:
             run.handling_pending()
 
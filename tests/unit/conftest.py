@@ -0,0 +1,128 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import contextlib
+import os
+import tempfile
+
+import pytest
+
+# Configure terrarun before it is imported
+_DATABASE_PATH = os.path.join(tempfile.mkdtemp(prefix="terrarun-tests-"), "terrarun.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DATABASE_PATH}"
+os.environ.setdefault("AGENT_PRESIGN_ENCRYPTION_KEY", "a" * 32)
+os.environ.setdefault("BASE_URL", "http://localhost")
+
+import sqlalchemy.event
+
+import terrarun
+from terrarun.database import Base, Database
+
+
+@pytest.fixture(autouse=True)
+def database():
+    """Create empty database schema for each test"""
+    Base.metadata.create_all(Database.get_engine())
+    yield
+    Database.get_session().remove()
+    Database.get_engine().dispose()
+    os.unlink(_DATABASE_PATH)
+
+
+class QueryCounter:
+    """Record SQL statements and commits executed against the database"""
+
+    def __init__(self):
+        """Store member variables"""
+        self.statements = []
+        self.commits = 0
+
+    @property
+    def count(self):
+        """Return number of statements executed"""
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        """Record statement"""
+        self.statements.append(statement)
+
+    def _commit(self, conn):
+        """Record commit"""
+        self.commits += 1
+
+
+@pytest.fixture
+def count_queries():
+    """Return context manager that counts statements and commits executed within it"""
+    @contextlib.contextmanager
+    def _count_queries():
+        counter = QueryCounter()
+        engine = Database.get_engine()
+        sqlalchemy.event.listen(engine, "before_cursor_execute", counter._before_cursor_execute)
+        sqlalchemy.event.listen(engine, "commit", counter._commit)
+        try:
+            yield counter
+        finally:
+            sqlalchemy.event.remove(engine, "before_cursor_execute", counter._before_cursor_execute)
+            sqlalchemy.event.remove(engine, "commit", counter._commit)
+    return _count_queries
+
+
+@pytest.fixture
+def organisation():
+    """Create organisation with a default lifecycle containing a single environment"""
+    organisation = terrarun.Organisation.create(name="test-org", email="test@example.com")
+    lifecycle = terrarun.Lifecycle.create(organisation=organisation, name="default")
+    organisation.update_attributes(default_lifecycle=lifecycle)
+    lifecycle_environment_group = terrarun.LifecycleEnvironmentGroup.create(lifecycle=lifecycle)
+    environment = terrarun.Environment.create(organisation=organisation, name="dev")
+    lifecycle_environment_group.associate_environment(environment=environment)
+    return organisation
+
+
+@pytest.fixture
+def workspace(organisation):
+    """Create workspace, with a Terraform version configured"""
+    terrarun.Project.create(organisation=organisation, name="test-project", lifecycle=organisation.default_lifecycle)
+    workspace = terrarun.Workspace.get_by_organisation_and_name(organisation, "test-project-dev")
+    tool = terrarun.models.tool.Tool(
+        tool_type=terrarun.models.tool.ToolType.TERRAFORM_VERSION,
+        version="1.5.0",
+        enabled=True
+    )
+    session = Database.get_session()
+    session.add(tool)
+    workspace.tool = tool
+    session.add(workspace)
+    session.commit()
+    return workspace
+
+
+@pytest.fixture
+def configuration_version(workspace):
+    """Create configuration version for workspace"""
+    return terrarun.models.configuration.ConfigurationVersion.create(workspace=workspace)
+
+
+@pytest.fixture
+def create_run(configuration_version):
+    """Return factory creating runs for the configuration version, with attributes overridable by keyword arguments"""
+    def _create_run(**attributes):
+        return terrarun.models.run.Run.create(**{
+            "configuration_version": configuration_version,
+            "created_by": None,
+            "message": "test",
+            "plan_only": False,
+            "refresh": True,
+            "refresh_only": False,
+            "is_destroy": False,
+            "auto_apply": False,
+            **attributes,
+        })
+    return _create_run
+
+
+@pytest.fixture
+def run(create_run):
+    """Create run"""
+    return create_run()
@@ -0,0 +1,109 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import http.server
+import json
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class FakeGithubServer:
+    """
+    Local HTTP server imitating the Github API.
+
+    Responses are registered per path. GET requests with a matching
+    If-None-Match header receive a 304, without consuming the rate limit,
+    as Github does. Each response includes rate limit headers.
+    """
+
+    def __init__(self, rate_limit: int=5000):
+        """Store member variables"""
+        self.rate_limit_remaining = rate_limit
+        self.rate_limit_reset = int(time.time()) + 3600
+        # Response body, ETag and status code, keyed by path
+        self._responses: Dict[str, dict] = {}
+        # Retry-After value to respond with, simulating a secondary rate limit
+        self.retry_after: Optional[int] = None
+        # Path and headers of each request received
+        self.requests: List[dict] = []
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._get_handler_class())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        """Return base URL of server"""
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Start serving requests"""
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving requests"""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def set_response(self, path: str, body, etag: Optional[str]=None, status: int=200):
+        """Register response for path"""
+        self._responses[path] = {"body": json.dumps(body).encode(), "etag": etag, "status": status}
+
+    def _handle(self, handler: http.server.BaseHTTPRequestHandler):
+        """Respond to request"""
+        path = handler.path.split("?", 1)[0]
+        # Consume request body, so that the connection may be re-used
+        handler.rfile.read(int(handler.headers.get("Content-Length", 0)))
+        self.requests.append({"method": handler.command, "path": path, "headers": dict(handler.headers)})
+
+        response = self._responses.get(path)
+        headers = {}
+        if self.retry_after is not None:
+            status, body = 403, b'{"message": "You have exceeded a secondary rate limit"}'
+            headers["Retry-After"] = str(self.retry_after)
+        elif response is None:
+            status, body = 404, b'{"message": "Not Found"}'
+        elif response["etag"] and handler.headers.get("If-None-Match") == response["etag"]:
+            status, body = 304, b""
+            headers["ETag"] = response["etag"]
+        else:
+            status, body = response["status"], response["body"]
+            if response["etag"]:
+                headers["ETag"] = response["etag"]
+            self.rate_limit_remaining = max(self.rate_limit_remaining - 1, 0)
+
+        headers["X-RateLimit-Remaining"] = str(self.rate_limit_remaining)
+        headers["X-RateLimit-Reset"] = str(self.rate_limit_reset)
+
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        if status != 304:
+            handler.send_header("Content-Type", "application/json")
+            handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        if status != 304:
+            handler.wfile.write(body)
+
+    def _get_handler_class(self):
+        """Return request handler class, dispatching requests to server"""
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            """Pass requests to fake server"""
+
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                """Handle GET request"""
+                server._handle(self)
+
+            def do_POST(self):
+                """Handle POST request"""
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                """Suppress request logging"""
+
+        return Handler
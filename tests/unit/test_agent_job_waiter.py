@@ -0,0 +1,188 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import threading
+import time
+
+import pytest
+import sqlalchemy.event
+
+from terrarun.agent_job_waiter import AgentJobWaiter
+from terrarun.database import Database
+from terrarun.models.agent_pool import AgentPool
+from terrarun.models.run_queue import JobQueueAgentType, JobQueueType, RunQueue
+
+
+@pytest.fixture(autouse=True)
+def long_poll(monkeypatch):
+    """Enable long-polling, with a short poll interval"""
+    monkeypatch.setenv("AGENT_JOB_LONG_POLL_TIMEOUT", "10")
+    monkeypatch.setattr(AgentJobWaiter, "POLL_INTERVAL", 0.05)
+
+
+@pytest.fixture
+def agent_pools(organisation):
+    """Create two workspace-scoped agent pools and an unscoped agent pool, returning their IDs"""
+    return [
+        AgentPool.create(name=name, organisation=organisation, organisation_scoped=organisation_scoped).id
+        for name, organisation_scoped in (("scoped-1", True), ("scoped-2", True), ("unscoped", False))
+    ]
+
+
+@pytest.fixture
+def checked_out_connections():
+    """Track number of database connections checked out of the pool"""
+    checked_out = [0]
+
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out[0] += 1
+
+    def _checkin(dbapi_connection, connection_record):
+        checked_out[0] -= 1
+
+    engine = Database.get_engine()
+    sqlalchemy.event.listen(engine, "checkout", _checkout)
+    sqlalchemy.event.listen(engine, "checkin", _checkin)
+    yield checked_out
+    sqlalchemy.event.remove(engine, "checkout", _checkout)
+    sqlalchemy.event.remove(engine, "checkin", _checkin)
+
+
+def _queue_agent_job(run):
+    """Queue agent job directly, as the worker process would"""
+    session = Database.get_session()
+    job = RunQueue(run_id=run.id, agent_type=JobQueueAgentType.AGENT, job_type=JobQueueType.PLAN)
+    session.add(job)
+    session.commit()
+    return job
+
+
+class FakeAgentRequest:
+    """Agent job request, parked in a separate thread"""
+
+    def __init__(self, agent_pool_id):
+        """Store member variables and start request"""
+        self.get_job_calls = 0
+        self.job_id = None
+        self.duration = None
+        self._agent_pool_id = agent_pool_id
+        self._thread = threading.Thread(target=self._request)
+        self._thread.start()
+
+    def _get_job(self):
+        """Return unclaimed agent job"""
+        job = Database.get_session().query(RunQueue).filter(
+            RunQueue.agent_type==JobQueueAgentType.AGENT,
+            RunQueue.agent_id==None,
+        ).first()
+        self.get_job_calls += 1
+        return job, None
+
+    def _request(self):
+        """Wait for job"""
+        start_time = time.monotonic()
+        try:
+            job, _ = AgentJobWaiter.wait_for_job(agent_pool_id=self._agent_pool_id, get_job=self._get_job)
+            self.job_id = job.id if job else None
+        finally:
+            Database.get_session().remove()
+        self.duration = time.monotonic() - start_time
+
+    def join(self):
+        """Wait for request to complete"""
+        self._thread.join()
+
+
+def _wait_for_requests(requests):
+    """Wait for requests to check for a job and be parked"""
+    while AgentJobWaiter._total_waiters < len(requests) or not all(request.get_job_calls for request in requests):
+        time.sleep(0.01)
+
+
+def test_job_queued_by_other_process_wakes_waiters(run, agent_pools):
+    """Jobs queued without notifying this process wake parked requests, which only check for jobs once woken"""
+    scoped_pool_id, _, unscoped_pool_id = agent_pools
+    run.configuration_version.workspace.agent_pool_id = scoped_pool_id
+    Database.get_session().commit()
+
+    requests = [FakeAgentRequest(agent_pool_id=pool_id) for pool_id in (scoped_pool_id, scoped_pool_id)]
+    _wait_for_requests(requests)
+    # Allow several poll intervals to pass whilst no job is queued
+    time.sleep(AgentJobWaiter.POLL_INTERVAL * 10)
+
+    job = _queue_agent_job(run)
+
+    for request in requests:
+        request.join()
+        assert request.job_id == job.id
+        assert request.duration < 5
+        # Initial check and check once woken
+        assert request.get_job_calls == 2
+
+
+def test_job_queued_by_other_process_only_wakes_its_agent_pool(run, agent_pools, monkeypatch):
+    """Requests for agent pools that cannot pick up a new job remain parked"""
+    monkeypatch.setenv("AGENT_JOB_LONG_POLL_TIMEOUT", "1")
+    scoped_pool_id, other_scoped_pool_id, unscoped_pool_id = agent_pools
+    run.configuration_version.workspace.agent_pool_id = scoped_pool_id
+    Database.get_session().commit()
+
+    woken_request = FakeAgentRequest(agent_pool_id=scoped_pool_id)
+    parked_requests = [FakeAgentRequest(agent_pool_id=pool_id) for pool_id in (other_scoped_pool_id, unscoped_pool_id)]
+    _wait_for_requests([woken_request] + parked_requests)
+
+    _queue_agent_job(run)
+
+    woken_request.join()
+    assert woken_request.get_job_calls == 2
+    for request in parked_requests:
+        request.join()
+        assert request.job_id is None
+        assert request.get_job_calls == 1
+
+
+def test_job_without_agent_pool_wakes_unscoped_agent_pools(run, agent_pools, monkeypatch):
+    """Jobs for workspaces without an agent pool only wake agent pools not scoped to workspaces"""
+    monkeypatch.setenv("AGENT_JOB_LONG_POLL_TIMEOUT", "1")
+    scoped_pool_id, _, unscoped_pool_id = agent_pools
+    scoped_request = FakeAgentRequest(agent_pool_id=scoped_pool_id)
+    unscoped_request = FakeAgentRequest(agent_pool_id=unscoped_pool_id)
+    _wait_for_requests([scoped_request, unscoped_request])
+
+    _queue_agent_job(run)
+
+    unscoped_request.join()
+    scoped_request.join()
+    assert unscoped_request.get_job_calls == 2
+    assert scoped_request.get_job_calls == 1
+
+
+def test_parked_requests_do_not_hold_connections(checked_out_connections, monkeypatch):
+    """Database connections are released whilst requests are parked"""
+    monkeypatch.setattr(AgentJobWaiter, "POLL_INTERVAL", 60)
+    requests = [FakeAgentRequest(agent_pool_id=1) for _ in range(5)]
+    _wait_for_requests(requests)
+    time.sleep(0.1)
+
+    assert checked_out_connections[0] == 0
+    AgentJobWaiter.notify(1)
+    for request in requests:
+        request.join()
+
+
+def test_in_process_notify_wakes_waiters(monkeypatch):
+    """Notifying an agent pool wakes requests for the pool"""
+    # Ensure waiters are only woken by the notification
+    monkeypatch.setattr(AgentJobWaiter, "POLL_INTERVAL", 60)
+    monkeypatch.setenv("AGENT_JOB_LONG_POLL_TIMEOUT", "1")
+    request = FakeAgentRequest(agent_pool_id=1)
+    # Wait for initial check for a job
+    _wait_for_requests([request])
+
+    AgentJobWaiter.notify(1)
+
+    # Request returns without a job, once the timeout expires,
+    # having checked for a job once more after being notified
+    request.join()
+    assert request.job_id is None
+    assert request.get_job_calls == 2
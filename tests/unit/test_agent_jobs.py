@@ -0,0 +1,74 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import flask
+import pytest
+
+from terrarun.agent_job_waiter import AgentJobWaiter
+from terrarun.agent_reaper import AgentReaper
+from terrarun.database import Database
+from terrarun.models.agent import Agent
+from terrarun.models.agent_pool import AgentPool
+from terrarun.models.run_flow import RunStatus
+from terrarun.models.run_queue import JobQueueAgentType, JobQueueType, RunQueue
+from terrarun.server import ApiAgentStatus
+
+
+@pytest.fixture
+def agents(organisation):
+    """Create two agents in an agent pool"""
+    agent_pool = AgentPool.create(name="test-pool", organisation=organisation, organisation_scoped=True)
+    session = Database.get_session()
+    agents = [Agent(agent_pool=agent_pool, name=f"agent-{index}") for index in range(2)]
+    session.add_all(agents)
+    session.commit()
+    return agents
+
+
+@pytest.fixture
+def planning_run(run, agents):
+    """Run being planned by the first agent"""
+    session = Database.get_session()
+    run.plan.agent = agents[0]
+    run.status = RunStatus.PLANNING
+    session.add(RunQueue(run_id=run.id, agent=agents[0], agent_type=JobQueueAgentType.AGENT, job_type=JobQueueType.PLAN))
+    session.add_all([run, run.plan])
+    session.commit()
+    return run
+
+
+def _put_agent_status(agent, run, monkeypatch):
+    """Send plan status update for run from agent"""
+    monkeypatch.setattr(ApiAgentStatus, "_get_agent", lambda self: agent)
+    request_json = {
+        "status": "busy",
+        "job": {"type": "plan", "status": "running", "data": {"run_id": run.api_id}},
+    }
+    with flask.Flask(__name__).test_request_context(method="PUT", json=request_json):
+        response = ApiAgentStatus().put()
+    if isinstance(response, tuple):
+        return response[1]
+    return response.status_code
+
+
+def test_status_update_from_assigned_agent(planning_run, agents, monkeypatch):
+    """Status updates from the agent assigned to the job are accepted"""
+    assert _put_agent_status(agents[0], planning_run, monkeypatch) == 200
+
+
+def test_status_update_from_unassigned_agent(planning_run, agents, monkeypatch):
+    """Agents that no longer own the job are informed of the conflict"""
+    assert _put_agent_status(agents[1], planning_run, monkeypatch) == 409
+
+
+def test_reaper_notifies_waiters_of_released_plan(planning_run, monkeypatch):
+    """Plans returned to the queue wake agent job requests"""
+    notified_agent_pool_ids = []
+    monkeypatch.setattr(AgentJobWaiter, "notify", notified_agent_pool_ids.append)
+    job = Database.get_session().query(RunQueue).filter(RunQueue.agent_type==JobQueueAgentType.AGENT).one()
+
+    AgentReaper()._release_plan_job(job)
+
+    assert job.agent is None
+    assert planning_run.status is RunStatus.PLAN_QUEUED
+    assert notified_agent_pool_ids == [planning_run.configuration_version.workspace.effective_agent_pool_id]
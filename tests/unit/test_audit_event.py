@@ -0,0 +1,75 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import datetime
+
+from terrarun.database import Database
+from terrarun.models.audit_event import AuditEvent, AuditEventArchive
+from terrarun.models.run_flow import RunStatus
+
+
+def _set_event_timestamps(run, timestamp):
+    """Set timestamp of all audit events for run"""
+    session = Database.get_session()
+    session.query(AuditEvent).filter(
+        AuditEvent.object_type==run.ID_PREFIX,
+        AuditEvent.object_id==run.id,
+    ).update({AuditEvent.timestamp: timestamp}, synchronize_session=False)
+    session.commit()
+
+
+def _get_statuses(run_id):
+    """Return statuses of run status change audit events"""
+    return [
+        event.new_value
+        for event in AuditEvent.get_by_object_type_and_object_id(object_type="run", object_id=run_id)
+    ]
+
+
+def test_live_events_read_without_archive(run, count_queries):
+    """Audit events of objects with live audit events are read with a single query"""
+    run.update_status(RunStatus.PRE_PLAN_RUNNING)
+    run_id = run.id
+
+    with count_queries() as counter:
+        statuses = _get_statuses(run_id)
+
+    assert statuses == ["pending", "pre_plan_running"]
+    assert counter.count == 1
+
+
+def test_archived_events_read(run):
+    """All audit events of objects are archived together and are returned once archived"""
+    run.update_status(RunStatus.PRE_PLAN_RUNNING)
+    _set_event_timestamps(run, datetime.datetime.now() - datetime.timedelta(days=100))
+
+    archived = AuditEvent.archive_events(older_than=datetime.datetime.now() - datetime.timedelta(days=90), batch_size=1)
+
+    assert archived == 2
+    session = Database.get_session()
+    assert session.query(AuditEventArchive).filter(AuditEventArchive.object_id==run.id).count() == 2
+    assert _get_statuses(run.id) == ["pending", "pre_plan_running"]
+
+
+def test_objects_with_recent_events_not_archived(run):
+    """Audit events are not archived whilst the object has recent audit events"""
+    _set_event_timestamps(run, datetime.datetime.now() - datetime.timedelta(days=100))
+    run.update_status(RunStatus.PRE_PLAN_RUNNING)
+
+    archived = AuditEvent.archive_events(older_than=datetime.datetime.now() - datetime.timedelta(days=90), batch_size=100)
+
+    assert archived == 0
+    assert _get_statuses(run.id) == ["pending", "pre_plan_running"]
+
+
+def test_archived_events_restored_on_new_event(run):
+    """Archived audit events are returned with new audit events of the object"""
+    run.update_status(RunStatus.PRE_PLAN_RUNNING)
+    _set_event_timestamps(run, datetime.datetime.now() - datetime.timedelta(days=100))
+    AuditEvent.archive_events(older_than=datetime.datetime.now() - datetime.timedelta(days=90), batch_size=100)
+
+    run.update_status(RunStatus.CANCELED)
+
+    assert _get_statuses(run.id) == ["pending", "pre_plan_running", "canceled"]
+    session = Database.get_session()
+    assert session.query(AuditEventArchive).count() == 0
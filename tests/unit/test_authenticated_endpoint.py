@@ -0,0 +1,66 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import flask
+import pytest
+
+import terrarun.auth_context
+from terrarun.models.user import User
+from terrarun.server.authenticated_endpoint import AuthenticatedEndpoint
+
+
+class FakeEndpoint(AuthenticatedEndpoint):
+    """Endpoint authenticated with the given auth context, permitting all requests"""
+
+    def __init__(self, auth_context):
+        """Store member variables"""
+        super().__init__()
+        self._auth_context = auth_context
+
+    def _get_auth_context(self):
+        """Return provided auth context"""
+        return self._auth_context
+
+    def check_permissions_get(self, auth_context):
+        """Permit all requests"""
+        return True
+
+    def _get(self, auth_context):
+        """Return authenticated user"""
+        return {"user": auth_context.user.username}, 200
+
+
+@pytest.fixture
+def request_context():
+    """Provide Flask request context"""
+    with flask.Flask(__name__).test_request_context():
+        yield
+
+
+def test_user_api_id_resolved(request_context):
+    """Requests by an existing user are handled, obtaining the user once"""
+    user = User.create_user(username="test-user", email="test@example.com", password="password")
+    auth_context = terrarun.auth_context.AuthContext(user=None, job=None, user_api_id=user.api_id)
+
+    assert FakeEndpoint(auth_context).get() == ({"user": "test-user"}, 200)
+
+
+def test_deleted_user_rejected(request_context):
+    """Requests authenticated by a user that no longer exists are rejected"""
+    auth_context = terrarun.auth_context.AuthContext(user=None, job=None, user_api_id="user-doesnotexist")
+
+    assert FakeEndpoint(auth_context).get() == ({}, 401)
+
+
+def test_deleted_job_rejected(request_context):
+    """Requests authenticated by a job that no longer exists are rejected"""
+    auth_context = terrarun.auth_context.AuthContext(user=None, job=None, job_api_id="job-doesnotexist")
+
+    assert FakeEndpoint(auth_context).get() == ({}, 401)
+
+
+def test_unauthenticated_rejected(request_context):
+    """Requests without a user or job are rejected"""
+    auth_context = terrarun.auth_context.AuthContext(user=None, job=None)
+
+    assert FakeEndpoint(auth_context).get() == ({}, 403)
@@ -0,0 +1,135 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import hashlib
+import re
+
+import flask
+import pytest
+import sqlalchemy.orm
+
+from terrarun.database import Database
+from terrarun.models.blob import Blob
+from terrarun.server import ApiTerraformPlanLog
+from terrarun.terraform_command import TerraformCommandState
+
+
+# Log large enough to be compressed and for its transfer to be significant
+LOG_DATA = b"".join(f"Log line {index}\n".encode() for index in range(50000))
+
+_SELECT_DATA_RE = re.compile(r"^\s*SELECT\b.*\bblob\.data\b", re.IGNORECASE | re.DOTALL)
+
+
+def _data_selects(counter):
+    """Return statements that select blob data"""
+    return [statement for statement in counter.statements if _SELECT_DATA_RE.match(statement)]
+
+
+@pytest.fixture
+def plan_log(run):
+    """Add log to finished plan of run"""
+    session = Database.get_session()
+    plan = run.plan
+    plan.log = Blob(data=LOG_DATA)
+    plan.status = TerraformCommandState.FINISHED
+    session.add(plan)
+    session.commit()
+    return plan.log
+
+
+def _get_plan_log(plan, offset):
+    """Read plan log from offset"""
+    with flask.Flask(__name__).test_request_context(query_string={"offset": offset}):
+        response = ApiTerraformPlanLog().get(plan.api_id)
+    return response.get_data()
+
+
+def test_blob_size_checks_do_not_load_data(plan_log, count_queries):
+    """Presence and size checks use metadata columns, without transferring data"""
+    session = Database.get_session()
+    blob_id = plan_log.id
+    session.expunge_all()
+
+    with count_queries() as counter:
+        blob = session.query(Blob).get(blob_id)
+        assert blob.has_data
+        assert blob.get_data_size() == len(LOG_DATA)
+
+    assert counter.count == 1
+    assert _data_selects(counter) == []
+
+    # Data is loaded, using a single statement, only when accessed
+    with count_queries() as counter:
+        assert blob.data == LOG_DATA
+    assert len(_data_selects(counter)) == 1
+
+
+def test_plan_log_read_beyond_offset_does_not_load_data(run, plan_log, count_queries):
+    """Polling for log data beyond the end of the log does not transfer the log"""
+    plan = run.plan
+    plan.api_id
+
+    with count_queries() as counter:
+        assert _get_plan_log(plan, offset=len(LOG_DATA)) == b""
+
+    assert _data_selects(counter) == []
+
+
+def test_plan_log_read_within_offset_loads_data_once(run, plan_log, count_queries):
+    """Reading new log data loads the log using a single statement"""
+    plan = run.plan
+    plan.api_id
+    offset = len(LOG_DATA) - 100
+
+    with count_queries() as counter:
+        assert _get_plan_log(plan, offset=offset) == LOG_DATA[offset:]
+
+    assert len(_data_selects(counter)) == 1
+
+
+def test_recompress_appended_blobs_combines_gzip_members(plan_log):
+    """Appended blobs are re-encoded as a single gzip member, with their checksum restored"""
+    session = Database.get_session()
+    blob_id = plan_log.id
+    for index in range(100):
+        assert Blob.append_data_by_id(blob_id, f"Appended line {index}\n".encode(), session)
+    session.commit()
+    expected_data = LOG_DATA + b"".join(f"Appended line {index}\n".encode() for index in range(100))
+    appended_length = len(Blob.get_by_id(blob_id)._data)
+
+    assert Blob.recompress_appended_blobs(limit=10) == 1
+
+    session.expire_all()
+    blob = Blob.get_by_id(blob_id)
+    assert blob.data == expected_data
+    assert blob.size == len(expected_data)
+    assert blob.checksum == hashlib.sha256(expected_data).hexdigest()
+    assert len(blob._data) < appended_length
+    # Re-encoded blobs are not processed again
+    assert Blob.recompress_appended_blobs(limit=10) == 0
+
+
+def test_recompress_appended_blobs_skips_concurrent_appends(plan_log, monkeypatch):
+    """Data appended whilst re-encoding is retained"""
+    session = Database.get_session()
+    blob_id = plan_log.id
+    assert Blob.append_data_by_id(blob_id, b"First append\n", session)
+    session.commit()
+
+    # Append data, from another session, once the blob has been read for re-encoding
+    decode = Blob._decode
+
+    def _decode_and_append(data, codec):
+        other_session = Database.get_engine().connect()
+        with sqlalchemy.orm.Session(bind=other_session) as concurrent_session:
+            assert Blob.append_data_by_id(blob_id, b"Second append\n", concurrent_session)
+            concurrent_session.commit()
+        other_session.close()
+        return decode(data, codec)
+
+    monkeypatch.setattr(Blob, "_decode", staticmethod(_decode_and_append))
+    assert Blob.recompress_appended_blobs(limit=10) == 0
+    monkeypatch.undo()
+
+    session.expire_all()
+    assert Blob.get_by_id(blob_id).data == LOG_DATA + b"First append\nSecond append\n"
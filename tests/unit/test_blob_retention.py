@@ -0,0 +1,79 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import datetime
+
+from terrarun.blob_retention import BlobRetentionSweeper
+from terrarun.database import Database
+from terrarun.models.blob import Blob
+from terrarun.models.state_version import StateVersion, StateVersionStatus
+
+
+def _create_blob(created_at):
+    """Create blob, with the given creation time"""
+    session = Database.get_session()
+    blob = Blob(data=b"data")
+    session.add(blob)
+    session.commit()
+    blob.created_at = created_at
+    session.add(blob)
+    session.commit()
+    return blob.id
+
+
+def _blob_exists(blob_id):
+    """Return whether blob exists"""
+    return Database.get_session().query(Blob).filter(Blob.id==blob_id).count() == 1
+
+
+def test_orphaned_blobs_deleted_after_grace_period():
+    """Unreferenced blobs are only deleted once older than the grace period"""
+    expired_blob_id = _create_blob(datetime.datetime.now() - datetime.timedelta(hours=2))
+    recent_blob_id = _create_blob(datetime.datetime.now())
+    unknown_age_blob_id = _create_blob(None)
+
+    sweeper = BlobRetentionSweeper(batch_size=100)
+    sweeper.sweep()
+
+    assert not _blob_exists(expired_blob_id)
+    assert _blob_exists(recent_blob_id)
+    assert _blob_exists(unknown_age_blob_id)
+    metrics = sweeper.get_metrics()
+    assert metrics["reclaimed-blobs"] == 1
+    assert metrics["reclaimed-bytes"] > 0
+    assert metrics["pruned-state-versions"] == 0
+
+
+def test_pruned_state_versions_delete_outputs_document(organisation, workspace):
+    """Backing data of pruned state versions, including the outputs document, is deleted"""
+    session = Database.get_session()
+    organisation.state_version_retention_count = 1
+    session.add(organisation)
+    session.commit()
+
+    state_versions = []
+    for serial in range(2):
+        state_version = StateVersion.create(
+            run=None, workspace=workspace, created_by=None,
+            state={"serial": serial}, json_state=None
+        )
+        state_version.serial = serial
+        state_version.intermediate = False
+        state_version.build_outputs_document()
+        session.add(state_version)
+        session.commit()
+        state_versions.append(state_version)
+    pruned, retained = state_versions
+    pruned_blob_ids = [pruned.state_id, pruned.outputs_document_id]
+
+    sweeper = BlobRetentionSweeper(batch_size=100)
+    sweeper.sweep()
+
+    session.refresh(pruned)
+    session.refresh(retained)
+    assert pruned.status is StateVersionStatus.BACKING_DATA_PERMANENTLY_DELETED
+    assert pruned.outputs_document_id is None
+    assert not any(_blob_exists(blob_id) for blob_id in pruned_blob_ids)
+    assert retained.status is StateVersionStatus.FINALIZED
+    assert _blob_exists(retained.outputs_document_id)
+    assert sweeper.get_metrics()["pruned-state-versions"] == 1
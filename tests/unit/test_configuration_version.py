@@ -0,0 +1,100 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import io
+import tarfile
+
+import pytest
+
+import terrarun.models.configuration
+from terrarun.models.configuration import ConfigurationVersion, ConfigurationVersionStatus
+from terrarun.models.oauth_client import OauthServiceGithub
+
+
+class FakeObjectStorage:
+    """Object storage that, like boto3, closes file objects once uploaded"""
+
+    uploaded = {}
+
+    def upload_fileobj(self, path, fileobj):
+        """Store contents of file object and close it"""
+        self.uploaded[path] = fileobj.read()
+        fileobj.close()
+
+
+@pytest.fixture(autouse=True)
+def object_storage(monkeypatch):
+    """Replace object storage with fake"""
+    FakeObjectStorage.uploaded = {}
+    monkeypatch.setattr(terrarun.models.configuration, "ObjectStorage", FakeObjectStorage)
+    return FakeObjectStorage
+
+
+def test_process_upload(workspace, object_storage):
+    """Uploaded archive is stored in object storage and as the configuration blob"""
+    configuration_version = ConfigurationVersion.create(workspace=workspace)
+
+    configuration_version.process_upload(b"archive-content")
+
+    assert object_storage.uploaded == {configuration_version.storage_key: b"archive-content"}
+    assert configuration_version.configuration_blob.data == b"archive-content"
+    assert configuration_version.status is ConfigurationVersionStatus.UPLOADED
+
+
+def test_process_upload_fileobj_closed_by_upload(workspace, object_storage):
+    """File object is not used after being passed to object storage"""
+    configuration_version = ConfigurationVersion.create(workspace=workspace)
+    fileobj = io.BytesIO(b"archive-content")
+
+    configuration_version.process_upload_fileobj(fileobj)
+
+    assert fileobj.closed
+    assert configuration_version.configuration_blob.data == b"archive-content"
+
+
+def _create_archive(members):
+    """Return gzipped tar archive containing files and symlinks, from dictionary of path to content or link target"""
+    archive_fh = io.BytesIO()
+    with tarfile.open(fileobj=archive_fh, mode="w:gz") as archive:
+        for path, (member_type, value) in members.items():
+            member = tarfile.TarInfo(path)
+            if member_type == "file":
+                member.size = len(value)
+                archive.addfile(member, io.BytesIO(value))
+            else:
+                member.type = tarfile.SYMTYPE
+                member.linkname = value
+                archive.addfile(member)
+    return archive_fh.getvalue()
+
+
+def test_move_archive_into_root_drops_symlinks_outside_archive():
+    """Symlinks in VCS archives are only retained if they point within the archive"""
+    source = _create_archive({
+        "repo-abc123/main.tf": ("file", b"resource {}"),
+        "repo-abc123/modules/link.tf": ("link", "../main.tf"),
+        "repo-abc123/modules/escape": ("link", "../../outside"),
+        "repo-abc123/absolute": ("link", "/etc/passwd"),
+    })
+    target_fh = io.BytesIO()
+
+    OauthServiceGithub(None)._move_archive_into_root(source_fh=io.BytesIO(source), target_fh=target_fh)
+
+    target_fh.seek(0)
+    with tarfile.open(fileobj=target_fh, mode="r:gz") as target:
+        assert {member.path: member.linkname for member in target} == {
+            "main.tf": "",
+            "modules/link.tf": "../main.tf",
+        }
+
+
+def test_extract_configuration_rejects_links_outside_directory(workspace):
+    """Archives uploaded via the API cannot extract links to outside of the extract directory"""
+    configuration_version = ConfigurationVersion.create(workspace=workspace)
+    configuration_version.process_upload(_create_archive({
+        "main.tf": ("file", b"resource {}"),
+        "escape": ("link", "../../outside"),
+    }))
+
+    with pytest.raises(tarfile.FilterError):
+        configuration_version.extract_configuration()
@@ -0,0 +1,60 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+import schedule
+
+import terrarun.cron_tasks
+from terrarun.cron_tasks import CronTasks
+
+
+@pytest.fixture
+def cron_tasks(monkeypatch):
+    """Cron tasks with two poller threads, limited to one concurrent check per VCS provider"""
+    monkeypatch.setenv("VCS_POLL_CONCURRENCY", "2")
+    monkeypatch.setenv("VCS_POLL_PROVIDER_CONCURRENCY", "1")
+    cron_tasks = CronTasks()
+    yield cron_tasks
+    schedule.clear()
+
+
+def _authorised_repo(authorised_repo_id, oauth_client_id):
+    """Return authorised repo, using OAuth client"""
+    return SimpleNamespace(
+        id=authorised_repo_id,
+        oauth_token=SimpleNamespace(oauth_client_id=oauth_client_id),
+        webhook_received_at=None,
+        last_checked_changes=None,
+    )
+
+
+def test_provider_limit_does_not_block_poller_threads(cron_tasks, monkeypatch):
+    """Repos of other VCS providers are checked whilst a provider is at its concurrency limit"""
+    monkeypatch.setattr(
+        terrarun.cron_tasks.AuthorisedRepo, "get_all_utilised_repos",
+        staticmethod(lambda: [_authorised_repo(1, "first"), _authorised_repo(2, "first"), _authorised_repo(3, "second")])
+    )
+    second_provider_checked = threading.Event()
+    checked = []
+    lock = threading.Lock()
+
+    def _check_authorised_repo(authorised_repo_id):
+        with lock:
+            checked.append(authorised_repo_id)
+        if authorised_repo_id == 3:
+            second_provider_checked.set()
+        else:
+            # Checks of the first provider are only completed once the second provider has been checked
+            assert second_provider_checked.wait(timeout=5)
+        return 1
+
+    monkeypatch.setattr(cron_tasks, "_check_authorised_repo", _check_authorised_repo)
+
+    cron_tasks.check_for_vcs_commits()
+
+    assert sorted(checked) == [1, 2, 3]
+    assert second_provider_checked.is_set()
+    assert cron_tasks.last_vcs_poll_saved_api_calls == 3
@@ -0,0 +1,118 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+from collections import OrderedDict
+
+import pytest
+
+import terrarun.github_client
+from terrarun.github_client import GithubApiClient
+
+from fake_github import FakeGithubServer
+
+
+@pytest.fixture
+def fake_github(monkeypatch):
+    """Start fake Github server, with empty client caches and rate limit state"""
+    monkeypatch.setattr(GithubApiClient, "_response_cache", OrderedDict())
+    monkeypatch.setattr(GithubApiClient, "_rate_limits", {})
+    monkeypatch.setattr(GithubApiClient, "_metrics", {})
+    server = FakeGithubServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record delays, without sleeping"""
+    sleeps = []
+    monkeypatch.setattr(terrarun.github_client.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_conditional_request_returns_cached_response(fake_github):
+    """Unchanged resources are re-validated using ETag and returned from cache"""
+    fake_github.set_response("/repos/org/repo", {"name": "repo"}, etag='"abc"')
+    client = GithubApiClient(token="token", metrics_key="test")
+
+    first = client.request("GET", f"{fake_github.url}/repos/org/repo")
+    second = client.request("GET", f"{fake_github.url}/repos/org/repo")
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert second.json() == {"name": "repo"}
+    assert "If-None-Match" not in fake_github.requests[0]["headers"]
+    assert fake_github.requests[1]["headers"]["If-None-Match"] == '"abc"'
+    # Only the initial request consumes the rate limit
+    assert fake_github.rate_limit_remaining == 4999
+    assert GithubApiClient.get_metrics()["test"] == {
+        "requests": 2, "not-modified": 1, "rate-limited": 0, "delayed": 0,
+    }
+
+
+def test_modified_resource_replaces_cached_response(fake_github):
+    """Changed resources are returned and cached"""
+    fake_github.set_response("/repos/org/repo", {"name": "repo"}, etag='"abc"')
+    client = GithubApiClient(token="token", metrics_key="test")
+    client.request("GET", f"{fake_github.url}/repos/org/repo")
+
+    fake_github.set_response("/repos/org/repo", {"name": "renamed"}, etag='"def"')
+    assert client.request("GET", f"{fake_github.url}/repos/org/repo").json() == {"name": "renamed"}
+    assert client.request("GET", f"{fake_github.url}/repos/org/repo").json() == {"name": "renamed"}
+    assert fake_github.requests[2]["headers"]["If-None-Match"] == '"def"'
+
+
+def test_cache_is_per_token(fake_github):
+    """Cached responses are not shared between tokens"""
+    fake_github.set_response("/repos/org/repo", {"name": "repo"}, etag='"abc"')
+    GithubApiClient(token="first", metrics_key="first").request("GET", f"{fake_github.url}/repos/org/repo")
+    GithubApiClient(token="second", metrics_key="second").request("GET", f"{fake_github.url}/repos/org/repo")
+
+    assert "If-None-Match" not in fake_github.requests[1]["headers"]
+
+
+def test_low_rate_limit_delays_requests(fake_github, sleeps, monkeypatch):
+    """Requests are spread out once the remaining rate limit is low"""
+    monkeypatch.setenv("GITHUB_RATE_LIMIT_BACKOFF_THRESHOLD", "500")
+    fake_github.rate_limit_remaining = 11
+    fake_github.set_response("/user", {"login": "user"})
+    client = GithubApiClient(token="token", metrics_key="test")
+
+    client.request("GET", f"{fake_github.url}/user")
+    assert sleeps == []
+    client.request("GET", f"{fake_github.url}/user")
+
+    # Remaining requests are spread across the 3600s until the rate limit resets,
+    # limited to the maximum delay
+    assert len(sleeps) == 1
+    assert 0 < sleeps[0] <= 30
+    assert GithubApiClient.get_metrics()["test"]["delayed"] == 1
+
+
+def test_exhausted_rate_limit_does_not_request(fake_github, sleeps):
+    """No requests are made once the rate limit is exhausted, until it resets"""
+    fake_github.rate_limit_remaining = 1
+    fake_github.set_response("/user", {"login": "user"})
+    client = GithubApiClient(token="token", metrics_key="test")
+
+    assert client.request("GET", f"{fake_github.url}/user").status_code == 200
+    assert client.request("GET", f"{fake_github.url}/user").status_code == 429
+
+    assert len(fake_github.requests) == 1
+    assert GithubApiClient.get_metrics()["test"]["rate-limited"] == 1
+    # Other tokens are unaffected
+    assert GithubApiClient(token="other", metrics_key="other").request("GET", f"{fake_github.url}/user").status_code == 200
+
+
+def test_secondary_rate_limit_blocks_requests(fake_github, sleeps):
+    """Requests are not made whilst a secondary rate limit Retry-After is in effect"""
+    fake_github.set_response("/user", {"login": "user"})
+    fake_github.retry_after = 60
+    client = GithubApiClient(token="token", metrics_key="test")
+
+    assert client.request("GET", f"{fake_github.url}/user").status_code == 403
+    fake_github.retry_after = None
+    assert client.request("GET", f"{fake_github.url}/user").status_code == 429
+
+    assert len(fake_github.requests) == 1
+    assert GithubApiClient.get_metrics()["test"]["rate-limited"] == 2
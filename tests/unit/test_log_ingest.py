@@ -0,0 +1,107 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import threading
+
+import flask
+import pytest
+
+from terrarun.database import Database
+from terrarun.log_ingest import LogIngest
+from terrarun.models.plan import Plan
+from terrarun.presign import Presign
+from terrarun.server import ApiAgentPlanLog
+
+
+CONCURRENT_AGENTS = 200
+CHUNKS_PER_AGENT = 20
+
+
+@pytest.fixture
+def plan_streams(create_run):
+    """Create a run for each agent, returning plan API ID and log key for each"""
+    streams = []
+    for _ in range(CONCURRENT_AGENTS):
+        run = create_run(plan_only=True)
+        streams.append((run.plan.api_id, Presign().encrypt(run.api_id)))
+    return streams
+
+
+def _get_chunk(agent_index, chunk_index):
+    """Return log chunk sent by agent"""
+    return f"agent {agent_index} line {chunk_index}\n".encode()
+
+
+def _stream_log(agent_index, plan_api_id, key, start_barrier, errors):
+    """Send log chunks for plan, as an agent would"""
+    app = flask.Flask(__name__)
+    try:
+        start_barrier.wait()
+        for chunk_index in range(CHUNKS_PER_AGENT):
+            with app.test_request_context(method="PATCH", query_string={"key": key}, data=_get_chunk(agent_index, chunk_index)):
+                _, status = ApiAgentPlanLog().patch(plan_api_id)
+            if status != 200:
+                errors.append(f"Agent {agent_index} received {status}")
+                return
+    except Exception as exc:
+        errors.append(exc)
+    finally:
+        Database.get_session().remove()
+
+
+def test_concurrent_agent_log_streams(plan_streams, count_queries, monkeypatch):
+    """Log chunks streamed by many agents are batched, retaining order, and authentication is cached"""
+    monkeypatch.setenv("AGENT_LOG_FLUSH_INTERVAL", "0.2")
+    errors = []
+    start_barrier = threading.Barrier(CONCURRENT_AGENTS)
+    threads = [
+        threading.Thread(target=_stream_log, args=(agent_index, plan_api_id, key, start_barrier, errors))
+        for agent_index, (plan_api_id, key) in enumerate(plan_streams)
+    ]
+
+    with count_queries() as counter:
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=60)
+        finally:
+            LogIngest.flush()
+
+    assert errors == []
+    assert not any(thread.is_alive() for thread in threads)
+
+    # Each chunk would otherwise be written in its own transaction
+    assert counter.commits < (CONCURRENT_AGENTS * CHUNKS_PER_AGENT) / 10
+    # Streams are only authenticated against the database on the first chunk
+    api_id_lookups = [statement for statement in counter.statements if statement.lstrip().startswith("SELECT api_id.")]
+    assert len(api_id_lookups) <= CONCURRENT_AGENTS
+
+    session = Database.get_session()
+    session.expire_all()
+    for agent_index, (plan_api_id, _) in enumerate(plan_streams):
+        plan = Plan.get_by_api_id(plan_api_id)
+        assert plan.log.data == b"".join(_get_chunk(agent_index, chunk_index) for chunk_index in range(CHUNKS_PER_AGENT))
+
+
+def test_flush_not_blocked_by_other_plans(run, monkeypatch):
+    """Output of a plan is written whilst output of another plan is being written"""
+    monkeypatch.setenv("AGENT_LOG_FLUSH_INTERVAL", "0.2")
+    plan_id = run.plan.id
+    # Plan that does not share a flush lock with the run's plan
+    other_key = next(
+        (Plan, other_plan_id)
+        for other_plan_id in range(plan_id + 1, plan_id + 1000)
+        if LogIngest._get_flush_lock_index((Plan, other_plan_id)) != LogIngest._get_flush_lock_index((Plan, plan_id))
+    )
+
+    with LogIngest._get_flush_lock(other_key):
+        LogIngest.append(Plan, plan_id, b"output\n")
+        flush_thread = threading.Thread(target=LogIngest.flush, kwargs={"command_class": Plan, "command_id": plan_id})
+        flush_thread.start()
+        flush_thread.join(timeout=5)
+        assert not flush_thread.is_alive()
+
+    session = Database.get_session()
+    session.expire_all()
+    assert Plan.get_by_id(plan_id).log.data == b"output\n"
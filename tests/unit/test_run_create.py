@@ -0,0 +1,86 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import pytest
+
+from terrarun.database import Database
+from terrarun.models.audit_event import AuditEvent
+from terrarun.models.run import Run
+from terrarun.models.run_flow import RunStatus
+from terrarun.models.run_queue import JobQueueAgentType
+from terrarun.models.task import Task
+from terrarun.models.workspace_task import WorkspaceTask, WorkspaceTaskEnforcementLevel, WorkspaceTaskStage
+
+
+@pytest.fixture
+def workspace_tasks(organisation, workspace):
+    """Create task for each workspace task stage"""
+    session = Database.get_session()
+    task = Task.create(organisation=organisation, name="test-task", description="", url="http://localhost", hmac_key="key", enabled=True)
+    for stage in (WorkspaceTaskStage.PRE_PLAN, WorkspaceTaskStage.POST_PLAN, WorkspaceTaskStage.PRE_APPLY):
+        session.add(WorkspaceTask(
+            workspace=workspace, task=task, stage=stage,
+            enforcement_level=WorkspaceTaskEnforcementLevel.MANDATORY
+        ))
+    session.commit()
+
+
+def _assert_run_created(run):
+    """Check run has been created with plan, task stages, audit event and worker job"""
+    session = Database.get_session()
+    session.expire_all()
+    assert run.status is RunStatus.PENDING
+    assert run.api_id
+    assert run.plan is not None and run.plan.api_id
+    assert len(run.task_stages) == 3
+    assert run.run_queue.agent_type is JobQueueAgentType.WORKER
+    assert session.query(AuditEvent).filter(AuditEvent.object_type==Run.ID_PREFIX, AuditEvent.object_id==run.id).count() == 1
+
+
+# Statements executed to create a run (17 and 20, respectively, with single-transaction
+# run creation), allowing minor variation. Exceeding these indicates that run creation
+# has regressed to per-object queries or commits.
+RUN_CREATE_MAX_STATEMENTS = 20
+RUN_CREATE_WITH_TASKS_MAX_STATEMENTS = 25
+
+
+def test_run_create_single_commit(configuration_version, create_run, count_queries):
+    """Run is created in a single commit"""
+    # Obtain API ID of configuration version, which is generated on first access
+    configuration_version.api_id
+
+    with count_queries() as counter:
+        run = create_run()
+
+    assert counter.commits == 1
+    assert counter.count <= RUN_CREATE_MAX_STATEMENTS
+    _assert_run_created(run)
+
+
+def test_run_create_with_tasks_single_commit(configuration_version, create_run, workspace_tasks, count_queries):
+    """Run, with task stages and task results, is created in a single commit"""
+    configuration_version.api_id
+
+    with count_queries() as counter:
+        run = create_run()
+
+    assert counter.commits == 1
+    assert counter.count <= RUN_CREATE_WITH_TASKS_MAX_STATEMENTS
+    _assert_run_created(run)
+    assert all(len(task_stage.task_results) == 1 for task_stage in run.task_stages)
+
+
+def test_run_create_failure_rolls_back(create_run, monkeypatch):
+    """Partially created run is discarded on failure, rather than committed by a later commit"""
+    def _fail(self, session=None):
+        raise Exception("Failed to queue run")
+
+    monkeypatch.setattr(Run, "queue_worker_job", _fail)
+    with pytest.raises(Exception, match="Failed to queue run"):
+        create_run()
+
+    # Session remains usable, e.g. by callers handling further workspaces
+    session = Database.get_session()
+    session.commit()
+    assert session.query(Run).count() == 0
+    assert session.query(AuditEvent).filter(AuditEvent.object_type==Run.ID_PREFIX).count() == 0
@@ -0,0 +1,93 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import threading
+
+import pytest
+
+from terrarun.database import Database
+from terrarun.job_processor import JobProcessor
+from terrarun.models.run import Run
+from terrarun.models.run_flow import RunStatus
+from terrarun.models.run_queue import JobQueueAgentType, RunQueue
+
+
+def _cancel_concurrently(run_id):
+    """Cancel run using a separate session, as another process would"""
+    def _cancel():
+        try:
+            Run.get_by_id(run_id).cancel(user=None)
+        finally:
+            Database.get_session().remove()
+
+    thread = threading.Thread(target=_cancel)
+    thread.start()
+    thread.join()
+
+
+def _get_status(run_id):
+    """Return status of run in the database"""
+    session = Database.get_session()
+    return session.query(Run.status).filter(Run.id==run_id).scalar()
+
+
+def _get_agent_jobs(run_id):
+    """Return agent jobs queued for run"""
+    session = Database.get_session()
+    return session.query(RunQueue).filter(
+        RunQueue.run_id==run_id,
+        RunQueue.agent_type==JobQueueAgentType.AGENT
+    ).all()
+
+
+@pytest.fixture
+def run_in_status(run):
+    """Return function to move run to given status, loading the status into the session"""
+    def _run_in_status(status):
+        run.update_attributes(status=status)
+        assert run.status is status
+        return run
+    return _run_in_status
+
+
+def test_queue_plan(run_in_status):
+    """Run is queued for plan"""
+    run = run_in_status(RunStatus.PRE_PLAN_COMPLETED)
+
+    run.queue_plan()
+
+    assert _get_status(run.id) is RunStatus.PLAN_QUEUED
+    assert len(_get_agent_jobs(run.id)) == 1
+
+
+def test_queue_plan_does_not_overwrite_concurrent_cancel(run_in_status):
+    """Concurrently cancelled run is not queued for plan"""
+    run = run_in_status(RunStatus.PRE_PLAN_COMPLETED)
+    _cancel_concurrently(run.id)
+
+    run.queue_plan()
+
+    assert _get_status(run.id) is RunStatus.CANCELED
+    assert _get_agent_jobs(run.id) == []
+
+
+def test_pre_apply_does_not_overwrite_concurrent_cancel(run_in_status):
+    """Concurrently cancelled run is not queued for apply"""
+    run = run_in_status(RunStatus.PRE_APPLY_RUNNING)
+    _cancel_concurrently(run.id)
+
+    run.handle_pre_apply_running()
+
+    assert _get_status(run.id) is RunStatus.CANCELED
+    assert _get_agent_jobs(run.id) == []
+
+
+def test_plan_status_update_does_not_overwrite_concurrent_cancel(run_in_status):
+    """Plan status updates from agents do not overwrite a concurrently cancelled run"""
+    run = run_in_status(RunStatus.PLAN_QUEUED)
+    assert run.configuration_version.workspace.lock(run=run, reason="Locked for run")
+    _cancel_concurrently(run.id)
+
+    JobProcessor.handle_plan_status_update({"status": "running", "data": {"run_id": run.api_id}})
+
+    assert _get_status(run.id) is RunStatus.CANCELED
@@ -0,0 +1,118 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+import terrarun.config
+import terrarun.models.task_result
+from terrarun.task_dispatcher import TaskDispatcher
+
+
+class FakeTaskResult:
+    """Task result, recording the result of dispatching it"""
+
+    def __init__(self, task_result_id, url, results):
+        """Store member variables"""
+        self.id = task_result_id
+        self._url = url
+        self._results = results
+
+    def prepare_dispatch(self):
+        """Return URL, payload and headers"""
+        return self._url, "{}", {}
+
+    def handle_dispatch_result(self, success):
+        """Record dispatch result"""
+        self._results[self.id] = (success, time.monotonic())
+
+
+class FakeSession:
+    """HTTP session, for which calls to dead task URLs fail"""
+
+    def __init__(self):
+        """Store member variables"""
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def post(self, url, data, headers, timeout):
+        """Record call, failing for dead URLs"""
+        with self._lock:
+            self.calls.append(url)
+        if url.startswith("http://dead"):
+            raise requests.exceptions.ConnectionError("Connection refused")
+        return SimpleNamespace(status_code=200)
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    """Dispatcher with a single executor thread, fake HTTP session and short retry interval"""
+    monkeypatch.setenv("TASK_DISPATCH_CONCURRENCY", "1")
+    monkeypatch.setattr(terrarun.config.Config, "TASK_CALL_ATTEMPT_INTERVAL", 0.2)
+    monkeypatch.setattr(TaskDispatcher, "_executor", None)
+    monkeypatch.setattr(TaskDispatcher, "_retries", [])
+    TaskDispatcher._get_executor()
+    session = FakeSession()
+    monkeypatch.setattr(TaskDispatcher, "_session", session)
+
+    task_results = {}
+    monkeypatch.setattr(
+        terrarun.models.task_result.TaskResult, "get_by_id",
+        lambda task_result_id: task_results[task_result_id]
+    )
+    return SimpleNamespace(session=session, task_results=task_results)
+
+
+def _wait_for_results(results, count, timeout=10):
+    """Wait for task results to be dispatched"""
+    deadline = time.monotonic() + timeout
+    while len(results) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_waiting_retries_do_not_block_other_tasks(dispatcher):
+    """Tasks are called whilst retries of failed tasks are waiting, even with a single executor thread"""
+    results = {}
+    task_results = [
+        FakeTaskResult(1, "http://dead-1/task", results),
+        FakeTaskResult(2, "http://dead-2/task", results),
+        FakeTaskResult(3, "http://live/task", results),
+    ]
+    dispatcher.task_results.update({task_result.id: task_result for task_result in task_results})
+    start_time = time.monotonic()
+
+    TaskDispatcher.dispatch(task_results)
+    _wait_for_results(results, 3)
+
+    # Live task is called with the initial attempts, rather than after the retries of the dead tasks
+    assert results[3][0] is True
+    assert "http://live/task" in dispatcher.session.calls[:3]
+    # Dead tasks fail once all attempts, with backoff of 0.2s and 0.4s, have been made
+    assert results[1][0] is False and results[2][0] is False
+    assert results[1][1] - start_time >= 0.6
+    assert sorted(dispatcher.session.calls) == sorted(
+        ["http://dead-1/task"] * 3 + ["http://dead-2/task"] * 3 + ["http://live/task"]
+    )
+
+
+def test_retry_succeeds(dispatcher, monkeypatch):
+    """Task results are only updated once a retry succeeds"""
+    results = {}
+    task_result = FakeTaskResult(1, "http://dead/task", results)
+    dispatcher.task_results[1] = task_result
+    post = dispatcher.session.post
+    # Fail first attempt only
+    monkeypatch.setattr(
+        dispatcher.session, "post",
+        lambda url, **kwargs: post("http://live/task" if dispatcher.session.calls else url, **kwargs)
+    )
+
+    TaskDispatcher.dispatch([task_result])
+    _wait_for_results(results, 1)
+
+    assert results[1][0] is True
+    assert dispatcher.session.calls == ["http://dead/task", "http://live/task"]
@@ -0,0 +1,90 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import datetime
+
+import pytest
+import requests
+
+import terrarun.models.tool
+from terrarun.database import Database
+from terrarun.models.tool import Tool, ToolMirrorStatus, ToolType
+
+
+REAL_DATETIME = datetime.datetime
+START_TIME = REAL_DATETIME.now()
+
+
+class FakeObjectStorage:
+    """Object storage, without any objects"""
+
+    def file_exists(self, path):
+        """Return whether file exists"""
+        return False
+
+
+@pytest.fixture
+def tool(monkeypatch):
+    """Tool pending mirroring, for which upstream downloads fail"""
+    monkeypatch.setenv("TOOL_MIRROR_RETRY_INTERVAL", "60")
+    monkeypatch.setenv("TOOL_MIRROR_RETRY_MAX_INTERVAL", "200")
+    monkeypatch.setattr(terrarun.models.tool, "ObjectStorage", FakeObjectStorage)
+
+    def _get(*args, **kwargs):
+        raise requests.exceptions.ConnectionError("Connection refused")
+
+    monkeypatch.setattr(terrarun.models.tool.requests, "get", _get)
+
+    tool = Tool(tool_type=ToolType.TERRAFORM_VERSION, version="1.5.0", sha="abc", mirror_status=ToolMirrorStatus.PENDING)
+    session = Database.get_session()
+    session.add(tool)
+    session.commit()
+    return tool
+
+
+def _mirror_after(tool, seconds, monkeypatch):
+    """Mirror pending tools, as if the given number of seconds had passed since the start of the test"""
+    now = START_TIME + datetime.timedelta(seconds=seconds)
+    monkeypatch.setattr(
+        terrarun.models.tool.datetime, "datetime",
+        type("FakeDatetime", (REAL_DATETIME,), {"now": classmethod(lambda cls: now)})
+    )
+    attempts = tool.mirror_attempts
+    Tool.mirror_pending_tools()
+    return tool.mirror_attempts > attempts
+
+
+def test_failed_mirrors_are_retried_with_backoff(tool, monkeypatch):
+    """Errored mirrors are retried, doubling the delay after each failed attempt, up to the maximum delay"""
+    assert _mirror_after(tool, 0, monkeypatch)
+    assert tool.mirror_status is ToolMirrorStatus.ERRORED
+    assert tool.mirror_attempts == 1
+
+    # Retried after 60s, then 120s, then at most every 200s
+    assert not _mirror_after(tool, 30, monkeypatch)
+    assert _mirror_after(tool, 61, monkeypatch)
+    assert not _mirror_after(tool, 61 + 100, monkeypatch)
+    assert _mirror_after(tool, 61 + 121, monkeypatch)
+    assert not _mirror_after(tool, 61 + 121 + 150, monkeypatch)
+    assert _mirror_after(tool, 61 + 121 + 201, monkeypatch)
+    assert tool.mirror_attempts == 4
+
+
+def test_successful_mirror_resets_attempts(tool, monkeypatch):
+    """Attempts are reset once mirrored"""
+    Tool.mirror_pending_tools()
+    assert tool.mirror_attempts == 1
+
+    tool._set_mirror_status(ToolMirrorStatus.MIRRORED)
+    assert tool.mirror_attempts == 0
+    assert tool.mirror_retry_at is None
+
+
+@pytest.mark.parametrize("fallback, expected_url", [
+    ("true", "https://releases.hashicorp.com/terraform/1.5.0/terraform_1.5.0_linux_amd64.zip"),
+    ("false", None),
+])
+def test_unmirrored_tool_upstream_fallback(tool, monkeypatch, fallback, expected_url):
+    """Upstream URL is only provided for tools that have not been mirrored if fallback is enabled"""
+    monkeypatch.setenv("TOOL_UPSTREAM_URL_FALLBACK", fallback)
+    assert tool.get_presigned_download_url() == expected_url
@@ -0,0 +1,99 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+from collections import OrderedDict
+import fnmatch
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from terrarun.trigger_matcher import TriggerMatcher
+
+
+# Synthetic diff of a large monorepo change
+CHANGED_FILE_COUNT = 10000
+CHANGED_FILES = [
+    f"services/service-{index % 200}/{'modules' if index % 3 else 'src'}/file-{index}.{'tf' if index % 2 else 'py'}"
+    for index in range(CHANGED_FILE_COUNT)
+]
+# Trigger patterns of a workspace, none of which match the diff
+DIRECTORY_TRIGGER_PATTERNS = [f"infrastructure/stack-{index}/*.tf" for index in range(50)]
+# Patterns with a leading wildcard, each of which must be scanned against every file
+WILDCARD_TRIGGER_PATTERNS = [f"services/*/stack-{index}/*.tf" for index in range(50)]
+
+
+@pytest.fixture(autouse=True)
+def matcher_cache(monkeypatch):
+    """Use empty matcher cache"""
+    monkeypatch.setattr(TriggerMatcher, "_cache", OrderedDict())
+
+
+def _fnmatch_matches(file_paths, patterns):
+    """Match file paths against each pattern in turn, as performed before matchers were compiled"""
+    return any(fnmatch.filter(file_paths, pattern) for pattern in patterns)
+
+
+def _best_time(callable_, repeats=3):
+    """Return fastest duration of callable"""
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        callable_()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+@pytest.mark.parametrize("patterns", [
+    ["*.tf"],
+    ["services/service-1/*"],
+    ["services/service-1[0-9]/src/*.py", "*.md"],
+    ["*.md", "docs/?/index.html"],
+    ["services/*/modules/file-9999.tf"],
+])
+def test_patterns_match_as_fnmatch(patterns):
+    """Compiled patterns match the same diffs as per-pattern fnmatch"""
+    matcher = TriggerMatcher.get_for_workspace(SimpleNamespace(trigger_patterns=patterns, trigger_prefixes=[]))
+    for file_paths in (CHANGED_FILES, CHANGED_FILES[:10], ["README.md"], ["docs/a/index.html"], []):
+        assert matcher.matches(file_paths) == _fnmatch_matches(file_paths, patterns)
+
+
+def test_prefixes_match():
+    """Prefixes are matched when patterns are not set"""
+    matcher = TriggerMatcher.get_for_workspace(SimpleNamespace(trigger_patterns=[], trigger_prefixes=["services/service-1/", "docs/"]))
+    assert matcher.matches(CHANGED_FILES)
+    assert not matcher.matches(["services/service-2/src/main.py"])
+
+
+def test_matchers_are_cached_by_triggers():
+    """Workspaces with the same triggers share a matcher"""
+    first = TriggerMatcher.get_for_workspace(SimpleNamespace(trigger_patterns=["*.tf"], trigger_prefixes=[]))
+    assert TriggerMatcher.get_for_workspace(SimpleNamespace(trigger_patterns=["*.tf"], trigger_prefixes=["docs/"])) is first
+    assert TriggerMatcher.get_for_workspace(SimpleNamespace(trigger_patterns=["*.md"], trigger_prefixes=[])) is not first
+    assert TriggerMatcher.get_for_workspace(SimpleNamespace(trigger_patterns=[], trigger_prefixes=[])) is None
+
+
+@pytest.mark.parametrize("patterns", [DIRECTORY_TRIGGER_PATTERNS, WILDCARD_TRIGGER_PATTERNS])
+def test_large_diff_without_matching_pattern(patterns):
+    """A 10k file diff does not match patterns that match none of its files"""
+    workspace = SimpleNamespace(trigger_patterns=patterns, trigger_prefixes=[])
+    assert not TriggerMatcher.get_for_workspace(workspace).matches(CHANGED_FILES)
+
+
+# Maximum duration of matcher relative to per-pattern fnmatch.
+# Patterns with leading wildcards are dominated by regex backtracking, which
+# combining patterns does not avoid, so only require these not to regress.
+@pytest.mark.skipif(not os.environ.get("TERRARUN_BENCHMARK"), reason="Benchmarks are only run when TERRARUN_BENCHMARK is set")
+@pytest.mark.parametrize("patterns, max_ratio", [
+    (DIRECTORY_TRIGGER_PATTERNS, 0.5),
+    (WILDCARD_TRIGGER_PATTERNS, 1.2),
+])
+def test_matcher_benchmark_large_diff(patterns, max_ratio):
+    """Benchmark matching a 10k file diff, with no matching pattern, against per-pattern fnmatch"""
+    workspace = SimpleNamespace(trigger_patterns=patterns, trigger_prefixes=[])
+
+    matcher_duration = _best_time(lambda: TriggerMatcher.get_for_workspace(workspace).matches(CHANGED_FILES))
+    fnmatch_duration = _best_time(lambda: _fnmatch_matches(CHANGED_FILES, patterns))
+
+    assert matcher_duration < fnmatch_duration * max_ratio
@@ -0,0 +1,138 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import threading
+
+import pytest
+
+import terrarun.vcs_trigger
+from terrarun.database import Database
+from terrarun.models.configuration import ConfigurationVersion
+from terrarun.models.oauth_client import OauthServiceGithub
+from terrarun.models.vcs_trigger_claim import VcsTriggerClaim
+from terrarun.vcs_trigger import VcsTrigger
+from terrarun.vcs_webhook_event import VcsWebhookEvent, VcsWebhookEventType
+
+
+def _pull_request_payload(head_repo):
+    """Return pull request webhook payload, with head in the given repository"""
+    return {
+        "action": "opened",
+        "pull_request": {
+            "number": 5,
+            "head": {"sha": "abc123", "ref": "feature", "repo": {"full_name": head_repo} if head_repo else None},
+            "base": {"ref": "main", "repo": {"full_name": "org/repo"}},
+        },
+    }
+
+
+@pytest.mark.parametrize("head_repo, from_fork", [
+    ("org/repo", False),
+    ("someone/repo", True),
+    # Deleted fork
+    (None, True),
+])
+def test_parse_pull_request_from_fork(head_repo, from_fork):
+    """Pull requests from forks are identified"""
+    event = OauthServiceGithub(None).parse_webhook_event(
+        headers={"X-GitHub-Event": "pull_request"},
+        payload=_pull_request_payload(head_repo),
+    )
+    assert event.event_type is VcsWebhookEventType.PULL_REQUEST
+    assert event.commit_sha == "abc123"
+    assert event.from_fork is from_fork
+
+
+@pytest.fixture
+def speculative_workspace(workspace, monkeypatch):
+    """Workspace with speculative plans enabled, used by webhook events"""
+    workspace.speculative_enabled = True
+    workspace.vcs_repo_branch = "main"
+    Database.get_session().commit()
+    monkeypatch.setattr(VcsTrigger, "get_workspaces", staticmethod(lambda authorised_repo: [workspace]))
+    monkeypatch.setattr(terrarun.vcs_trigger, "RepositorySnapshot", lambda **kwargs: None)
+    return workspace
+
+
+@pytest.fixture
+def speculative_runs(monkeypatch):
+    """Record speculative runs created"""
+    speculative_runs = []
+    monkeypatch.setattr(
+        VcsTrigger, "create_speculative_run",
+        lambda self, **kwargs: speculative_runs.append(kwargs["pull_request_id"])
+    )
+    return speculative_runs
+
+
+@pytest.mark.parametrize("from_fork, enabled, expected_runs", [
+    (False, False, [5]),
+    (True, False, []),
+    (True, True, [5]),
+])
+def test_fork_pull_requests_require_opt_in(speculative_workspace, speculative_runs, monkeypatch,
+                                            from_fork, enabled, expected_runs):
+    """Speculative plans are only created for pull requests from forks if enabled"""
+    monkeypatch.setenv("VCS_SPECULATIVE_PLANS_FOR_FORKS", "true" if enabled else "false")
+    event = VcsWebhookEvent(
+        event_type=VcsWebhookEventType.PULL_REQUEST,
+        commit_sha="abc123",
+        branch="main",
+        pull_request_id=5,
+        from_fork=from_fork,
+    )
+
+    VcsTrigger().handle_webhook_event(authorised_repo=None, event=event)
+
+    assert speculative_runs == expected_runs
+
+
+def test_claim_is_unique(workspace):
+    """A commit may only be claimed once for a workspace"""
+    claim = VcsTriggerClaim.claim(workspace=workspace, commit_sha="abc123", speculative=False)
+    assert claim
+    assert VcsTriggerClaim.claim(workspace=workspace, commit_sha="abc123", speculative=False) is None
+    # Speculative and non-speculative configuration versions are claimed separately
+    assert VcsTriggerClaim.claim(workspace=workspace, commit_sha="abc123", speculative=True)
+
+    # Released claims may be claimed again
+    claim.release()
+    assert VcsTriggerClaim.claim(workspace=workspace, commit_sha="abc123", speculative=False)
+
+
+def test_concurrent_speculative_runs_create_one_configuration_version(workspace, monkeypatch):
+    """Concurrent handling of the same commit, e.g. by a webhook and the VCS poller, creates a single configuration version"""
+    workspace_id = workspace.id
+    generating = threading.Event()
+    release = threading.Event()
+    generate_calls = []
+
+    def _generate_from_vcs(**kwargs):
+        generate_calls.append(kwargs["commit_ref"])
+        generating.set()
+        release.wait(timeout=10)
+        return None
+
+    monkeypatch.setattr(ConfigurationVersion, "generate_from_vcs", _generate_from_vcs)
+
+    def _create_speculative_run():
+        try:
+            thread_workspace = terrarun.Workspace.get_by_id(workspace_id)
+            VcsTrigger().create_speculative_run(
+                authorised_repo=None, workspace=thread_workspace,
+                commit_sha="abc123", branch="main", pull_request_id=5
+            )
+        finally:
+            Database.get_session().remove()
+
+    first = threading.Thread(target=_create_speculative_run)
+    first.start()
+    assert generating.wait(timeout=10)
+    # Commit is claimed by first thread whilst generating configuration version
+    _create_speculative_run()
+    release.set()
+    first.join()
+
+    assert generate_calls == ["abc123"]
+    # Failure to create configuration version releases the claim, so that it may be retried
+    assert Database.get_session().query(VcsTriggerClaim).count() == 0
@@ -0,0 +1,106 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import pytest
+
+from terrarun.database import Database
+from terrarun.job_processor import JobProcessor
+from terrarun.models.audit_event import AuditEvent
+from terrarun.models.run import Run
+from terrarun.models.run_flow import RunStatus
+from terrarun.worker import Worker
+
+
+class QueueOperations:
+    """Worker job pickups and run queue inserts, performed by the worker whilst processing a run"""
+
+    def __init__(self):
+        """Store member variables"""
+        self.pickups = 0
+        self.inserts = 0
+
+
+def _process_worker_jobs(count_queries, operations):
+    """Process worker jobs until the queue is empty, recording queue operations"""
+    worker = Worker()
+    with count_queries() as counter:
+        while worker._check_for_jobs():
+            operations.pickups += 1
+            Database.get_session().remove()
+    operations.inserts += len([
+        statement for statement in counter.statements
+        if statement.startswith("INSERT INTO run_queue")
+    ])
+
+
+def _run_to_apply_queued(create_run, count_queries):
+    """Process run, without tasks, from creation until queued for apply, returning queue operations"""
+    run = create_run(auto_apply=True)
+    run_id = run.id
+    run_api_id = run.api_id
+    operations = QueueOperations()
+
+    _process_worker_jobs(count_queries, operations)
+    assert Run.get_by_id(run_id).status is RunStatus.PLAN_QUEUED
+
+    # Complete plan, as an agent would
+    for status in ("running", "finished"):
+        JobProcessor.handle_plan_status_update({"status": status, "data": {"run_id": run_api_id, "has_changes": True}})
+        Database.get_session().remove()
+
+    _process_worker_jobs(count_queries, operations)
+    assert Run.get_by_id(run_id).status is RunStatus.APPLY_QUEUED
+
+    # Each status change is recorded, regardless of how many are handled per job
+    statuses = [
+        event.new_value
+        for event in AuditEvent.get_by_object_type_and_object_id(object_type=Run.ID_PREFIX, object_id=run_id)
+    ]
+    assert statuses == [
+        "pending", "pre_plan_running", "pre_plan_completed", "queuing", "plan_queued",
+        "planning", "planned", "post_plan_running", "post_plan_completed", "confirmed",
+        "pre_apply_running", "pre_apply_completed", "apply_queued",
+    ]
+    return operations
+
+
+def test_run_without_tasks_queue_operations(create_run, count_queries):
+    """Consecutive states of runs without tasks are handled within a single worker job"""
+    operations = _run_to_apply_queued(create_run, count_queries)
+
+    # Single pickup of the job queued on creation and of the job queued once planned,
+    # with the only queue inserts being the agent plan and apply jobs
+    assert operations.pickups == 2
+    assert operations.inserts == 2
+
+
+def test_run_without_tasks_queue_operations_single_state(create_run, count_queries, monkeypatch):
+    """Handling a single state per worker job, as before inline transitions, requeues for each state"""
+    monkeypatch.setattr(Worker, "MAX_INLINE_TRANSITIONS", 1)
+
+    operations = _run_to_apply_queued(create_run, count_queries)
+
+    # Worker job requeued for each state, in addition to the agent plan and apply jobs
+    assert operations.pickups == 8
+    assert operations.inserts == 8
+
+
+def test_run_waiting_for_workspace_lock_backs_off(run, create_run, configuration_version):
+    """Runs that cannot progress are requeued, without the worker immediately checking the queue again"""
+    session = Database.get_session()
+    # Lock workspace for an existing run, which is not queued for the worker
+    assert configuration_version.workspace.lock(run=run, reason="Locked for run")
+    session.delete(run.run_queue)
+    session.commit()
+
+    waiting_run = create_run()
+    waiting_run_id = waiting_run.id
+
+    worker = Worker()
+    for _ in range(2):
+        assert not worker._check_for_jobs()
+        Database.get_session().remove()
+
+        waiting_run = Run.get_by_id(waiting_run_id)
+        assert waiting_run.status is RunStatus.PENDING
+        assert waiting_run.run_queue is not None
@@ -0,0 +1,54 @@
+# Copyright (C) 2024 Matt Comben - All Rights Reserved
+# SPDX-License-Identifier: GPL-2.0
+
+import pytest
+
+import terrarun
+from terrarun.database import Database
+from terrarun.models.agent_pool import AgentPool
+
+
+@pytest.fixture
+def agent_pools(organisation):
+    """Create two agent pools"""
+    return [
+        AgentPool.create(name=f"pool-{index}", organisation=organisation, organisation_scoped=True)
+        for index in range(2)
+    ]
+
+
+def test_changing_project_id_updates_effective_agent_pool(organisation, workspace, agent_pools):
+    """Effective agent pool is inherited from the new project, when only the project ID is changed"""
+    session = Database.get_session()
+    workspace.project.default_agent_pool = agent_pools[0]
+    other_project = terrarun.Project.create(
+        organisation=organisation, name="other-project", lifecycle=organisation.default_lifecycle)
+    other_project.default_agent_pool = agent_pools[1]
+    session.add_all([workspace.project, other_project])
+    session.commit()
+    assert workspace.effective_agent_pool_id == agent_pools[0].id
+    assert workspace.project.default_agent_pool_id == agent_pools[0].id
+
+    # Relationship to the previous project remains loaded
+    workspace.project_id = other_project.id
+    session.add(workspace)
+    session.commit()
+
+    assert workspace.effective_agent_pool_id == agent_pools[1].id
+
+
+def test_changing_default_agent_pool_id_updates_effective_agent_pool(workspace, agent_pools):
+    """Effective agent pool is updated, when only the agent pool ID of a project is changed"""
+    session = Database.get_session()
+    project = workspace.project
+    project.default_agent_pool = agent_pools[0]
+    session.add(project)
+    session.commit()
+    assert project.default_agent_pool.id == agent_pools[0].id
+
+    # Relationship to the previous agent pool remains loaded
+    project.default_agent_pool_id = agent_pools[1].id
+    session.add(project)
+    session.commit()
+
+    assert workspace.effective_agent_pool_id == agent_pools[1].id